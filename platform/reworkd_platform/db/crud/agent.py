@@ -1,13 +1,19 @@
+from typing import List, Optional, Tuple
+
 from fastapi import HTTPException
-from sqlalchemy import and_, func, select
+from sqlalchemy import Select, and_, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from reworkd_platform.db.crud.base import BaseCrud
-from reworkd_platform.db.models.agent import AgentRun, AgentTask
-from reworkd_platform.schemas.agent import Loop_Step
+from reworkd_platform.db.models.agent import AgentRun, AgentRunTask, AgentTask
+from reworkd_platform.schemas.agent import Loop_Step, RunState, RunSummary, Usage
 from reworkd_platform.schemas.user import UserBase
 from reworkd_platform.settings import settings
-from reworkd_platform.web.api.errors import MaxLoopsError, MultipleSummaryError
+from reworkd_platform.web.api.errors import (
+    MaxLoopsError,
+    MultipleSummaryError,
+    RunBudgetError,
+)
 
 
 class AgentCRUD(BaseCrud):
@@ -21,16 +27,28 @@ class AgentCRUD(BaseCrud):
             goal=goal,
         ).save(self.session)
 
-    async def create_task(self, run_id: str, type_: Loop_Step) -> AgentTask:
+    async def get_run(self, run_id: Optional[str]) -> AgentRun:
+        """The run with the given id, 404 unless it belongs to the user"""
+        query = select(AgentRun).where(
+            and_(
+                AgentRun.id == run_id,
+                AgentRun.user_id == self.user.id,
+            )
+        )
+        if run_id and (run := (await self.session.execute(query)).scalar_one_or_none()):
+            return run
+
+        raise HTTPException(404, f"Run {run_id} not found")
+
+    async def create_task(self, run_id: Optional[str], type_: Loop_Step) -> AgentTask:
         await self.validate_task_count(run_id, type_)
         return await AgentTask(
             run_id=run_id,
             type_=type_,
         ).save(self.session)
 
-    async def validate_task_count(self, run_id: str, type_: str) -> None:
-        if not await AgentRun.get(self.session, run_id):
-            raise HTTPException(404, f"Run {run_id} not found")
+    async def validate_task_count(self, run_id: Optional[str], type_: str) -> None:
+        run = await self.get_run(run_id)
 
         query = select(func.count(AgentTask.id)).where(
             and_(
@@ -50,9 +68,154 @@ class AgentCRUD(BaseCrud):
                 should_log=False,
             )
 
+        await self.validate_budget(run.id)
+
         if type_ == "summarize" and task_count > 1:
             raise MultipleSummaryError(
                 StopIteration(),
                 "Multiple summary tasks are not allowed",
                 429,
             )
+
+    async def validate_budget(self, run_id: str) -> None:
+        max_tokens, max_cost = settings.run_max_tokens, settings.run_max_cost
+        if max_tokens is None and max_cost is None:
+            return
+
+        usage = await self.get_run_usage(run_id)
+        if max_tokens is not None and usage.total_tokens >= max_tokens:
+            raise RunBudgetError(
+                StopIteration(),
+                f"Token budget of {max_tokens} exceeded "
+                f"({usage.total_tokens} used), shutting down.",
+                429,
+                should_log=False,
+            )
+
+        if max_cost is not None and usage.cost >= max_cost:
+            raise RunBudgetError(
+                StopIteration(),
+                f"Cost budget of ${max_cost:.2f} exceeded "
+                f"(${usage.cost:.2f} used), shutting down.",
+                429,
+                should_log=False,
+            )
+
+    async def get_run_usage(self, run_id: str) -> Usage:
+        # Usage is recorded from other sessions, so don't rely on a loaded run
+        query = select(
+            AgentRun.prompt_tokens, AgentRun.completion_tokens, AgentRun.cost
+        ).where(
+            and_(
+                AgentRun.id == run_id,
+                AgentRun.user_id == self.user.id,
+            )
+        )
+        row = (await self.session.execute(query)).one_or_none()
+        if row is None:
+            return Usage()
+
+        prompt_tokens, completion_tokens, cost = row
+        return Usage(
+            prompt_tokens=prompt_tokens or 0,
+            completion_tokens=completion_tokens or 0,
+            cost=cost or 0.0,
+        )
+
+    async def get_user_usage(self) -> Usage:
+        query = select(
+            func.sum(AgentRun.prompt_tokens),
+            func.sum(AgentRun.completion_tokens),
+            func.sum(AgentRun.cost),
+        ).where(AgentRun.user_id == self.user.id)
+        prompt_tokens, completion_tokens, cost = (
+            await self.session.execute(query)
+        ).one()
+
+        return Usage(
+            prompt_tokens=prompt_tokens or 0,
+            completion_tokens=completion_tokens or 0,
+            cost=cost or 0.0,
+        )
+
+    async def add_run_tasks(self, run_id: Optional[str], tasks: List[str]) -> None:
+        await self.get_run(run_id)
+        sort = await self._next_sort(run_id)
+        for i, task in enumerate(tasks):
+            self.session.add(AgentRunTask(run_id=run_id, task=task, sort=sort + i))
+        await self.session.flush()
+
+    async def complete_run_task(
+        self, run_id: Optional[str], task: str, result: str
+    ) -> None:
+        await self.get_run(run_id)
+        query = (
+            self._run_tasks(run_id)
+            .where(
+                and_(
+                    AgentRunTask.task == task,
+                    AgentRunTask.completed.is_(False),
+                )
+            )
+            .order_by(AgentRunTask.sort)
+            .limit(1)
+        )
+
+        sort = await self._next_sort(run_id)
+        run_task = (await self.session.execute(query)).scalar_one_or_none()
+        run_task = run_task or AgentRunTask(run_id=run_id, task=task)
+        run_task.result = result
+        run_task.completed = True
+        run_task.sort = sort
+        await run_task.save(self.session)
+
+    async def get_run_state(self, run_id: Optional[str]) -> RunState:
+        await self.get_run(run_id)
+        query = self._run_tasks(run_id).order_by(AgentRunTask.sort)
+        run_tasks = (await self.session.execute(query)).scalars().all()
+        completed = [run_task for run_task in run_tasks if run_task.completed]
+
+        return RunState(
+            tasks=[run_task.task for run_task in run_tasks if not run_task.completed],
+            completed_tasks=[run_task.task for run_task in completed],
+            results=[run_task.result or "" for run_task in completed],
+        )
+
+    async def get_run_summary(self, run_id: str) -> RunSummary:
+        run = await self.get_run(run_id)
+        return RunSummary(
+            summary=run.summary or "",
+            checkpoint=run.summarized_results or 0,
+        )
+
+    async def save_run_summary(self, run_id: str, summary: RunSummary) -> None:
+        run = await self.get_run(run_id)
+        run.summary = summary.summary
+        run.summarized_results = summary.checkpoint
+        await run.save(self.session)
+
+    def _run_tasks(self, run_id: Optional[str]) -> Select[Tuple[AgentRunTask]]:
+        return (
+            select(AgentRunTask)
+            .join(AgentRun, AgentRun.id == AgentRunTask.run_id)
+            .where(
+                and_(
+                    AgentRunTask.run_id == run_id,
+                    AgentRun.user_id == self.user.id,
+                )
+            )
+        )
+
+    async def _next_sort(self, run_id: Optional[str]) -> int:
+        query = (
+            select(func.max(AgentRunTask.sort))
+            .join(AgentRun, AgentRun.id == AgentRunTask.run_id)
+            .where(
+                and_(
+                    AgentRunTask.run_id == run_id,
+                    AgentRun.user_id == self.user.id,
+                )
+            )
+        )
+        sort = (await self.session.execute(query)).scalar_one_or_none()
+        return 0 if sort is None else sort + 1
@@ -5,10 +5,13 @@ from sqlalchemy.orm import selectinload
 
 from reworkd_platform.db.crud.base import BaseCrud
 from reworkd_platform.db.models.auth import OrganizationUser
-from reworkd_platform.db.models.user import UserSession
+from reworkd_platform.db.models.user import User, UserSession
 
 
 class UserCrud(BaseCrud):
+    async def get_user(self, user_id: str) -> User:
+        return await User.get_or_404(self.session, user_id)
+
     async def get_user_session(self, token: str) -> UserSession:
         query = (
             select(UserSession)
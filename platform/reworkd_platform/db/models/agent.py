@@ -1,4 +1,4 @@
-from sqlalchemy import DateTime, String, Text, func
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text, func
 from sqlalchemy.orm import mapped_column
 
 from reworkd_platform.db.base import Base
@@ -9,6 +9,13 @@ class AgentRun(Base):
 
     user_id = mapped_column(String, nullable=False)
     goal = mapped_column(Text, nullable=False)
+    # Rolling summary of the results and how many of them it covers
+    summary = mapped_column(Text, nullable=True)
+    summarized_results = mapped_column(Integer, nullable=False, default=0)
+    # Totals over all LLM calls of the run, cost in USD
+    prompt_tokens = mapped_column(Integer, nullable=False, default=0)
+    completion_tokens = mapped_column(Integer, nullable=False, default=0)
+    cost = mapped_column(Float, nullable=False, default=0)
     create_date = mapped_column(
         DateTime, name="create_date", server_default=func.now(), nullable=False
     )
@@ -22,3 +29,19 @@ class AgentTask(Base):
     create_date = mapped_column(
         DateTime, name="create_date", server_default=func.now(), nullable=False
     )
+
+
+class AgentRunTask(Base):
+    """A task of a run and, once executed, its result"""
+
+    __tablename__ = "agent_run_task"
+
+    run_id = mapped_column(String, nullable=False)
+    task = mapped_column(Text, nullable=False)
+    result = mapped_column(Text, nullable=True)
+    completed = mapped_column(Boolean, nullable=False, default=False)
+    # Creation order while pending, completion order once completed
+    sort = mapped_column(Integer, nullable=False)
+    create_date = mapped_column(
+        DateTime, name="create_date", server_default=func.now(), nullable=False
+    )
@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Any, Dict, List, Literal, Optional
 
@@ -20,12 +21,32 @@ Loop_Step = Literal[
     "chat",
 ]
 
+
+@dataclass(frozen=True)
+class ModelSpec:
+    encoding: str
+    context_window: int  # Prompt and completion tokens together
+    max_output_tokens: int
+
+
+LLM_MODELS: Dict[LLM_Model, ModelSpec] = {
+    "gpt-3.5-turbo": ModelSpec("cl100k_base", 16_385, 4_096),
+    "gpt-4": ModelSpec("cl100k_base", 8_192, 8_192),
+    "gpt-4o": ModelSpec("o200k_base", 128_000, 16_384),
+}
+
+# Assumed for models that aren't in the registry
+UNKNOWN_MODEL = ModelSpec("cl100k_base", 4_000, 4_000)
+
 LLM_MODEL_MAX_TOKENS: Dict[LLM_Model, int] = {
-    "gpt-3.5-turbo": 4000,
-    "gpt-4": 8000,
-    "gpt-4o": 8000,
+    model: spec.max_output_tokens for model, spec in LLM_MODELS.items()
 }
 
+
+def get_model_spec(model: str) -> ModelSpec:
+    return LLM_MODELS.get(model, UNKNOWN_MODEL)  # type: ignore
+
+
 class ModelSettings(BaseModel):
     model: LLM_Model = Field(default="gpt-3.5-turbo")
     custom_api_key: Optional[str] = Field(default=None)
@@ -40,37 +61,92 @@ class ModelSettings(BaseModel):
             raise ValueError(f"Model {model} only supports {max_tokens} tokens")
         return v
 
-class AgentRun(BaseModel):
+
+class AgentRunCreate(BaseModel):
     goal: str
     model_settings: ModelSettings = Field(default=ModelSettings())
+
+
+class AgentRun(AgentRunCreate):
     run_id: Optional[str] = None
 
+
+class AgentRunLoop(AgentRun):
+    tool_names: List[str] = Field(default=[])
+    fused: bool = Field(default=False)  # Create and analyze tasks in one call
+
+
 class AgentTaskAnalyze(AgentRun):
     task: str
     tool_names: List[str] = Field(default=[])
     model_settings: ModelSettings = Field(default=ModelSettings())
 
+
+class AgentTasksAnalyze(AgentRun):
+    tasks: List[str] = Field(min_items=1, max_items=20)
+    tool_names: List[str] = Field(default=[])
+
+
 class AgentTaskExecute(AgentRun):
     task: str
     analysis: Analysis
 
+
 class AgentTaskCreate(AgentRun):
-    tasks: List[str] = Field(default=[])
+    # Left out fields are loaded from the state stored with the run
+    tasks: Optional[List[str]] = Field(default=None)
     last_task: Optional[str] = Field(default=None)
     result: Optional[str] = Field(default=None)
-    completed_tasks: List[str] = Field(default=[])
+    completed_tasks: Optional[List[str]] = Field(default=None)
+
+
+class AgentTaskCreateAnalyze(AgentTaskCreate):
+    tool_names: List[str] = Field(default=[])
+
 
 class AgentSummarize(AgentRun):
-    results: List[str] = Field(default=[])
+    results: Optional[List[str]] = Field(
+        default=None
+    )  # Loaded from the run if left out
+
 
 class AgentChat(AgentRun):
     message: str
-    results: List[str] = Field(default=[])
+    results: Optional[List[str]] = Field(
+        default=None
+    )  # Loaded from the run if left out
+
 
 class NewTasksResponse(BaseModel):
     run_id: str
     new_tasks: List[str] = Field(alias="newTasks")
 
+
+class NewAnalyzedTasksResponse(NewTasksResponse):
+    analyses: List[Analysis] = Field(default=[])
+
+
+class RunState(BaseModel):
+    tasks: List[str] = Field(default=[])  # Pending
+    completed_tasks: List[str] = Field(default=[])
+    results: List[str] = Field(default=[])
+
+
+class RunSummary(BaseModel):
+    summary: str = ""
+    checkpoint: int = 0  # Number of results folded into the summary
+
+
+class Usage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0  # USD
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
 class RunCount(BaseModel):
     count: int
     first_run: Optional[datetime]
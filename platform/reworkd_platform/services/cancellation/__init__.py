@@ -0,0 +1 @@
+"""Cancellation of work nobody is waiting for anymore"""
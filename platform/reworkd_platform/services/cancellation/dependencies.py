@@ -0,0 +1,7 @@
+from fastapi import Request
+
+from reworkd_platform.services.cancellation.meter import CancellationMeter
+
+
+def get_cancellation_meter(request: Request) -> CancellationMeter:
+    return request.app.state.cancellation_meter
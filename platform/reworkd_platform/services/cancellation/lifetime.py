@@ -0,0 +1,13 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.cancellation.meter import CancellationMeter
+
+
+def init_cancellation_meter(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the meter of work cancelled by client disconnects.
+    Must run after the tokenizer has been initialized.
+
+    :param app: current application.
+    """
+    app.state.cancellation_meter = CancellationMeter(app.state.token_service.count)
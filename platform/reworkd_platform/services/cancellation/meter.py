@@ -0,0 +1,39 @@
+from typing import Callable
+
+from pydantic import BaseModel
+
+
+class CancellationStats(BaseModel):
+    cancelled_requests: int
+    cancelled_completions: int
+    saved_tokens: int
+
+
+class CancellationMeter:
+    """
+    Counts the work that was cancelled because the client disconnected.
+
+    Saved tokens are estimated as the completion tokens a cancelled completion
+    was still allowed to generate, so they are an upper bound.
+    """
+
+    def __init__(self, count: Callable[[str], int]):
+        self.count = count
+        self.cancelled_requests = 0
+        self.cancelled_completions = 0
+        self.saved_tokens = 0
+
+    def record_request(self) -> None:
+        self.cancelled_requests += 1
+
+    def record_completion(self, max_tokens: int, completion: str = "") -> None:
+        self.cancelled_completions += 1
+        generated = self.count(completion) if completion else 0
+        self.saved_tokens += max(max_tokens - generated, 0)
+
+    def stats(self) -> CancellationStats:
+        return CancellationStats(
+            cancelled_requests=self.cancelled_requests,
+            cancelled_completions=self.cancelled_completions,
+            saved_tokens=self.saved_tokens,
+        )
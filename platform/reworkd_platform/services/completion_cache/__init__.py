@@ -0,0 +1 @@
+"""Completion cache for deterministic LLM calls"""
@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+
+class CacheBackend(ABC):
+    """Storage for completions keyed by `completion_key`"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    async def aget(self, key: str) -> Optional[str]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: str) -> None:
+        self.set(key, value)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache where entries expire after `ttl` seconds"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    SQLite backed cache so completions survive restarts.
+
+    From async code the queries run on a single thread of their own, so they
+    neither block the event loop nor use the connection concurrently.
+    """
+
+    def __init__(self, path: Union[str, Path], ttl: float):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS completion "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "DELETE FROM completion WHERE expires_at <= ?", (time.time(),)
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT value FROM completion WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO completion (key, value, expires_at) "
+            "VALUES (?, ?, ?)",
+            (key, value, time.time() + self.ttl),
+        )
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM completion").fetchone()[0]
+
+    async def aget(self, key: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.get, key)
+
+    async def aset(self, key: str, value: str) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.set, key, value)
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        self._connection.close()
@@ -0,0 +1,97 @@
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+from pydantic import BaseModel
+
+from reworkd_platform.services.completion_cache.backends import (
+    CacheBackend,
+    DiskCacheBackend,
+)
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    size: int
+
+
+class CompletionCache:
+    """
+    Caches completions of identical LLM calls.
+
+    Backends are checked in order (memory first, then disk) and a hit in a
+    slower backend is copied into the faster ones. Calls are only cached when
+    their temperature is at or below `max_temperature`, since sampling at a
+    higher temperature is expected to give a different answer each time.
+    """
+
+    def __init__(self, backends: List[CacheBackend], max_temperature: float):
+        self.backends = backends
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+
+    def accepts(self, temperature: float) -> bool:
+        return temperature <= self.max_temperature
+
+    async def get(self, key: str) -> Optional[str]:
+        for i, backend in enumerate(self.backends):
+            if (value := await backend.aget(key)) is not None:
+                for faster in self.backends[:i]:
+                    await faster.aset(key, value)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        for backend in self.backends:
+            await backend.aset(key, value)
+
+    async def get_or_call(self, key: str, func: Callable[[], Awaitable[str]]) -> str:
+        if (cached := await self.get(key)) is not None:
+            return cached
+
+        value = await func()
+        await self.set(key, value)
+        return value
+
+    def stats(self) -> CacheStats:
+        total = self.hits + self.misses
+        return CacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / total if total else 0.0,
+            size=len(self.backends[0]) if self.backends else 0,
+        )
+
+    def close(self) -> None:
+        for backend in self.backends:
+            if isinstance(backend, DiskCacheBackend):
+                backend.close()
+
+
+def completion_key(
+    model: str,
+    temperature: float,
+    max_tokens: Optional[int],
+    prompt: str,
+    functions: Optional[Sequence[Any]] = None,
+) -> str:
+    # max_tokens is part of the key, a completion cut short by a small budget
+    # must not be replayed to a caller with a larger one
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "prompt": prompt,
+            "functions": functions,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
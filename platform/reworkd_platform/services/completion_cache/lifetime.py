@@ -0,0 +1,49 @@
+from typing import List
+
+from fastapi import FastAPI
+
+from reworkd_platform.services.completion_cache.backends import (
+    CacheBackend,
+    DiskCacheBackend,
+    MemoryCacheBackend,
+)
+from reworkd_platform.services.completion_cache.cache import CompletionCache
+from reworkd_platform.settings import settings
+
+
+def init_completion_cache(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the completion cache.
+
+    The cache is disabled unless `completion_cache_enabled` is set.
+    The on-disk backend is only used if `completion_cache_path` is set.
+
+    :param app: current application.
+    """
+    app.state.completion_cache = None
+    if not settings.completion_cache_enabled:
+        return
+
+    backends: List[CacheBackend] = [
+        MemoryCacheBackend(
+            max_size=settings.completion_cache_size,
+            ttl=settings.completion_cache_ttl,
+        )
+    ]
+    if settings.completion_cache_path:
+        backends.append(
+            DiskCacheBackend(
+                settings.completion_cache_path,
+                ttl=settings.completion_cache_ttl,
+            )
+        )
+
+    app.state.completion_cache = CompletionCache(
+        backends,
+        max_temperature=settings.completion_cache_max_temperature,
+    )
+
+
+def shutdown_completion_cache(app: FastAPI) -> None:  # pragma: no cover
+    if app.state.completion_cache:
+        app.state.completion_cache.close()
@@ -0,0 +1 @@
+"""Replay of responses to requests retried with an Idempotency-Key"""
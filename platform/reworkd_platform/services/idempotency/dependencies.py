@@ -0,0 +1,9 @@
+from typing import Optional
+
+from fastapi import Request
+
+from reworkd_platform.services.idempotency.store import IdempotencyStore
+
+
+def get_idempotency_store(request: Request) -> Optional[IdempotencyStore]:
+    return request.app.state.idempotency_store
@@ -0,0 +1,20 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.idempotency.store import IdempotencyStore
+from reworkd_platform.settings import settings
+
+
+def init_idempotency_store(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the store of responses replayed for Idempotency-Key retries.
+
+    :param app: current application.
+    """
+    app.state.idempotency_store = (
+        IdempotencyStore(
+            ttl=settings.idempotency_ttl,
+            max_size=settings.idempotency_max_entries,
+        )
+        if settings.idempotency_enabled
+        else None
+    )
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import json
+from typing import Optional, Set
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from reworkd_platform.services.idempotency.store import IdempotencyStore, StoredResponse
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+
+
+class IdempotencyMiddleware:
+    """
+    Replays the response to a POST that is retried with the same Idempotency-Key
+    instead of running it again, so retries don't create steps, count against
+    max_loops or call the LLM. A retry that arrives while the original is
+    still running follows its response as it is produced.
+
+    The original runs detached from its connection: a client sending the
+    header will retry, so a disconnect doesn't cancel the request.
+    """
+
+    def __init__(self, app: ASGIApp, path_prefix: str = "/"):
+        self.app = app
+        self.path_prefix = path_prefix
+        self._running: Set["asyncio.Task[None]"] = set()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            return await self.app(scope, receive, send)
+
+        store: Optional[IdempotencyStore] = getattr(
+            scope["app"].state, "idempotency_store", None
+        )
+        headers = dict(scope["headers"])
+        if store is None or not headers.get(IDEMPOTENCY_HEADER):
+            return await self.app(scope, receive, send)
+
+        body = await read_body(receive)
+        # Keys are only unique per client
+        key = hashlib.sha256(
+            b"\0".join(
+                [
+                    headers.get(b"authorization", b""),
+                    scope["path"].encode(),
+                    headers[IDEMPOTENCY_HEADER],
+                ]
+            )
+        ).hexdigest()
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        response = store.get(key)
+        if response is None:
+            response = store.begin(key, fingerprint)
+            self._run(scope, body, store, key, response)
+        elif response.fingerprint != fingerprint:
+            return await send_conflict(send)
+        else:
+            store.record_retry(response)
+
+        await follow(response, receive, send)
+
+    def _run(
+        self,
+        scope: Scope,
+        body: bytes,
+        store: IdempotencyStore,
+        key: str,
+        response: StoredResponse,
+    ) -> None:
+        received = False
+
+        async def receive() -> Message:
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body}
+            # Never disconnects, see the class docstring
+            await asyncio.Event().wait()
+            return {"type": "http.disconnect"}  # pragma: no cover
+
+        async def run() -> None:
+            try:
+                await self.app(scope, receive, response.record)
+                await response.finish()
+            except BaseException as e:
+                await response.finish(e)
+                if not isinstance(e, Exception):
+                    raise
+            finally:
+                store.complete(key, response)
+
+        task = asyncio.create_task(run())
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+
+async def read_body(receive: Receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            break
+    return body
+
+
+async def follow(response: StoredResponse, receive: Receive, send: Send) -> None:
+    """Send a stored response until it is done or the client disconnects"""
+
+    async def disconnected() -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    replay = asyncio.create_task(response.replay(send))
+    disconnect = asyncio.create_task(disconnected())
+    await asyncio.wait({replay, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+
+    for task in (replay, disconnect):
+        task.cancel()
+    await asyncio.gather(disconnect, return_exceptions=True)
+    if replay.done() and not replay.cancelled():
+        replay.result()
+
+
+async def send_conflict(send: Send) -> None:
+    body = json.dumps(
+        {"detail": "Idempotency-Key was already used for a different request"}
+    ).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 422,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from starlette.types import Message, Send
+
+
+class IdempotencyStats(BaseModel):
+    entries: int
+    replayed: int
+    attached: int
+
+
+class StoredResponse:
+    """
+    The ASGI messages of a response, recorded as they are sent so that retries
+    can follow a response that is still being produced.
+    """
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.start: Optional[Message] = None
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def succeeded(self) -> bool:
+        return (
+            self.done
+            and self.error is None
+            and self.start is not None
+            and 200 <= self.start["status"] < 300
+        )
+
+    async def record(self, message: Message) -> None:
+        async with self._changed:
+            if message["type"] == "http.response.start":
+                self.start = message
+            elif message["type"] == "http.response.body" and message.get("body"):
+                self.chunks.append(message["body"])
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def replay(self, send: Send) -> None:
+        """Send the response from the start, following it until it is done"""
+        started = False
+        index = 0
+
+        def ready() -> bool:
+            return self.done or (
+                self.start is not None and (not started or len(self.chunks) > index)
+            )
+
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(ready)
+                start, chunks, done = self.start, self.chunks[index:], self.done
+
+            if not started:
+                if start is None:
+                    raise self.error or RuntimeError("No response was sent")
+                await send(start)
+                started = True
+
+            for chunk in chunks:
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            index += len(chunks)
+
+            if done and index >= len(self.chunks):
+                return await self._end(send)
+
+    async def _end(self, send: Send) -> None:
+        # A response that failed once started breaks off like the original
+        if self.error:
+            raise self.error
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class IdempotencyStore:
+    """
+    Responses to requests made with an Idempotency-Key, kept for `ttl` seconds
+    once complete. Only successful responses are kept, failed requests are
+    executed again when retried.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._responses: Dict[str, StoredResponse] = {}
+        self._expiry: "OrderedDict[str, float]" = OrderedDict()
+        self.replayed = 0
+        self.attached = 0
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        self._purge()
+        return self._responses.get(key)
+
+    def record_retry(self, response: StoredResponse) -> None:
+        if response.done:
+            self.replayed += 1
+        else:
+            self.attached += 1
+
+    def begin(self, key: str, fingerprint: str) -> StoredResponse:
+        response = self._responses[key] = StoredResponse(fingerprint)
+        return response
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        if self._responses.get(key) is not response:
+            return
+
+        if not response.succeeded:
+            del self._responses[key]
+            return
+
+        self._expiry[key] = time.monotonic() + self.ttl
+        self._expiry.move_to_end(key)
+        while len(self._expiry) > self.max_size:
+            evicted, _ = self._expiry.popitem(last=False)
+            self._responses.pop(evicted, None)
+
+    def stats(self) -> IdempotencyStats:
+        return IdempotencyStats(
+            entries=len(self._responses),
+            replayed=self.replayed,
+            attached=self.attached,
+        )
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        while self._expiry and next(iter(self._expiry.values())) <= now:
+            key, _ = self._expiry.popitem(last=False)
+            self._responses.pop(key, None)
@@ -0,0 +1 @@
+"""Client side rate limiting of LLM providers"""
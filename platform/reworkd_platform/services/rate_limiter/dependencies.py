@@ -0,0 +1,10 @@
+"""Rate Limiter"""
+from typing import Optional
+
+from fastapi import Request
+
+from reworkd_platform.services.rate_limiter.limiter import RateLimiter
+
+
+def get_rate_limiter(request: Request) -> Optional[RateLimiter]:
+    return request.app.state.rate_limiter
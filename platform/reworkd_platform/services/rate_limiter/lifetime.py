@@ -0,0 +1,25 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.rate_limiter.limiter import RateLimiter
+from reworkd_platform.settings import settings
+
+
+def init_rate_limiter(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the client side rate limiter.
+
+    Only enabled when a requests or tokens per minute limit is set.
+    Must run after the tokenizer has been initialized.
+
+    :param app: current application.
+    """
+    app.state.rate_limiter = None
+    if not (settings.openai_rpm_limit or settings.openai_tpm_limit):
+        return
+
+    app.state.rate_limiter = RateLimiter(
+        app.state.token_service,
+        rpm=settings.openai_rpm_limit,
+        tpm=settings.openai_tpm_limit,
+        max_wait=settings.openai_rate_limit_max_wait,
+    )
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from reworkd_platform.web.api.errors import RateLimitTimeoutError
+
+if TYPE_CHECKING:  # TokenService depends on the model factory which uses the limiter
+    from reworkd_platform.services.tokenizer.token_service import TokenService
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously up to `capacity` over a minute.
+    The level may go negative when usage turns out higher than estimated.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` can be consumed.
+        Oversized requests wait for a full bucket.
+        """
+        self.refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.refill()
+        self.level -= amount
+
+
+class Reservation:
+    """Capacity taken from a limit before a request, corrected once usage is known"""
+
+    def __init__(self, tokens: Optional[TokenBucket], estimated: int):
+        self._tokens = tokens
+        self.estimated = estimated
+
+    def reconcile(self, actual: Optional[int]) -> None:
+        if self._tokens is None or actual is None:
+            return
+
+        self._tokens.consume(actual - self.estimated)
+        self.estimated = actual
+
+
+class _Limit:
+    def __init__(self, rpm: Optional[int], tpm: Optional[int]):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.queue = asyncio.Lock()  # Waiters are woken in FIFO order
+
+    def wait_time(self, tokens: int) -> float:
+        return max(
+            self.requests.wait_time(1) if self.requests else 0,
+            self.tokens.wait_time(tokens) if self.tokens else 0,
+        )
+
+    def consume(self, tokens: int) -> None:
+        if self.requests:
+            self.requests.consume(1)
+        if self.tokens:
+            self.tokens.consume(tokens)
+
+
+class RateLimiter:
+    """
+    Enforces requests-per-minute and tokens-per-minute budgets per API key or
+    Azure deployment before requests are sent, so that overload queues up here
+    instead of turning into 429s and retries.
+
+    Requests wait in FIFO order for at most `max_wait` seconds.
+    """
+
+    def __init__(
+        self,
+        token_service: "TokenService",
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        max_wait: float = 30.0,
+    ):
+        self.token_service = token_service
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_wait = max_wait
+        self._limits: Dict[str, _Limit] = {}
+
+    def count(self, text: str) -> int:
+        return self.token_service.count(text)
+
+    async def acquire(self, key: str, prompt: str) -> Reservation:
+        estimated = self.count(prompt)
+        limit = self._limits.setdefault(key, _Limit(self.rpm, self.tpm))
+        deadline = time.monotonic() + self.max_wait
+
+        if limit.queue.locked():
+            try:
+                await asyncio.wait_for(limit.queue.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                raise_timeout(self.max_wait)
+        else:
+            await limit.queue.acquire()
+
+        try:
+            while (wait := limit.wait_time(estimated)) > 0:
+                if time.monotonic() + wait > deadline:
+                    raise_timeout(self.max_wait)
+                await asyncio.sleep(wait)
+
+            limit.consume(estimated)
+        finally:
+            limit.queue.release()
+
+        return Reservation(limit.tokens, estimated)
+
+
+def rate_limit_key(
+    api_base: str, api_key: str, deployment_name: Optional[str] = None
+) -> str:
+    if deployment_name:
+        return f"{api_base}#{deployment_name}"
+
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def raise_timeout(max_wait: float) -> None:
+    raise RateLimitTimeoutError(
+        TimeoutError(),
+        f"The AI model is currently overloaded, no capacity became available "
+        f"within {max_wait:.0f} seconds. Please try again shortly.",
+        429,
+        should_log=False,
+    )
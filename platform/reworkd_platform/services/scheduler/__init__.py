@@ -0,0 +1 @@
+"""Concurrent execution of the tasks of a run"""
@@ -0,0 +1,8 @@
+"""Run Scheduler"""
+from fastapi import Request
+
+from reworkd_platform.services.scheduler.scheduler import KeyedSemaphore
+
+
+def get_run_slots(request: Request) -> KeyedSemaphore:
+    return request.app.state.run_slots
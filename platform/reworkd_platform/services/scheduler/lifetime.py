@@ -0,0 +1,13 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.scheduler.scheduler import KeyedSemaphore
+from reworkd_platform.settings import settings
+
+
+def init_run_slots(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the per user limit on concurrently executing tasks.
+
+    :param app: current application.
+    """
+    app.state.run_slots = KeyedSemaphore(settings.user_max_concurrent_tasks)
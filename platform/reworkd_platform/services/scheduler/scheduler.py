@@ -0,0 +1,186 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+    Union,
+)
+
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class TaskNode(BaseModel):
+    id: str
+    task: str
+    depends_on: Set[str] = set()
+
+
+class TaskGraph:
+    """
+    Dependency graph over the tasks of a run. A task is ready once every task
+    it depends on has completed. Tasks without dependencies are independent
+    """
+
+    def __init__(self) -> None:
+        self.nodes: Dict[str, TaskNode] = {}
+        self.started: Set[str] = set()
+        self.completed: Set[str] = set()
+
+    def add(self, task: str, depends_on: Iterable[str] = ()) -> TaskNode:
+        node = TaskNode(
+            id=str(len(self.nodes) + 1), task=task, depends_on=set(depends_on)
+        )
+        self.nodes[node.id] = node
+        return node
+
+    def ready(self) -> List[TaskNode]:
+        return [
+            node
+            for node in self.nodes.values()
+            if node.id not in self.started and node.depends_on <= self.completed
+        ]
+
+    def pending(self) -> List[TaskNode]:
+        return [node for node in self.nodes.values() if node.id not in self.started]
+
+    def start(self, node: TaskNode) -> None:
+        self.started.add(node.id)
+
+    def complete(self, node: TaskNode) -> None:
+        self.completed.add(node.id)
+
+
+class KeyedSemaphore:
+    """One semaphore per key (e.g. per user), dropped once nobody holds it"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._holders: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        semaphore = self._semaphores.setdefault(key, asyncio.Semaphore(self.limit))
+        self._holders[key] = self._holders.get(key, 0) + 1
+
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                del self._holders[key]
+                del self._semaphores[key]
+
+    def __len__(self) -> int:
+        return len(self._semaphores)
+
+
+class _Finished(BaseModel):
+    node: TaskNode
+
+
+class _Failed(BaseModel):
+    error: BaseException
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class RunScheduler(Generic[T]):
+    """
+    Executes the ready tasks of a TaskGraph concurrently, at most
+    `max_concurrency` at a time for the run and `user_slots.limit` at a time
+    across all runs of the same user. Items produced by the tasks are merged
+    into a single stream as they arrive.
+
+    Tasks may add new nodes to the graph while running; they are scheduled once
+    their dependencies complete. At most `max_tasks` tasks are started.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        user_slots: Optional[KeyedSemaphore] = None,
+        user_id: str = "",
+        max_tasks: Optional[int] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.user_slots = user_slots
+        self.user_id = user_id
+        self.max_tasks = max_tasks
+
+    async def run(
+        self,
+        graph: TaskGraph,
+        process: Callable[[TaskNode], AsyncIterator[T]],
+    ) -> AsyncIterator[T]:
+        queue: "asyncio.Queue[Union[T, _Finished, _Failed]]" = asyncio.Queue()
+        running: Dict[str, "asyncio.Task[None]"] = {}
+
+        try:
+            self._launch(graph, process, queue, running)
+            while running:
+                item = await queue.get()
+                if isinstance(item, _Failed):
+                    raise item.error
+                if isinstance(item, _Finished):
+                    running.pop(item.node.id)
+                    self._launch(graph, process, queue, running)
+                    continue
+                yield item
+        finally:
+            for task in running.values():
+                task.cancel()
+
+    def _launch(
+        self,
+        graph: TaskGraph,
+        process: Callable[[TaskNode], AsyncIterator[T]],
+        queue: "asyncio.Queue[Union[T, _Finished, _Failed]]",
+        running: Dict[str, "asyncio.Task[None]"],
+    ) -> None:
+        for node in graph.ready():
+            if len(running) >= self.max_concurrency or self._exhausted(graph):
+                return
+            graph.start(node)
+            running[node.id] = asyncio.create_task(
+                self._work(graph, node, process, queue)
+            )
+
+    async def _work(
+        self,
+        graph: TaskGraph,
+        node: TaskNode,
+        process: Callable[[TaskNode], AsyncIterator[T]],
+        queue: "asyncio.Queue[Union[T, _Finished, _Failed]]",
+    ) -> None:
+        try:
+            async with self._user_slot():
+                async for item in process(node):
+                    await queue.put(item)
+            graph.complete(node)
+            await queue.put(_Finished(node=node))
+        except Exception as e:
+            await queue.put(_Failed(error=e))
+
+    def _exhausted(self, graph: TaskGraph) -> bool:
+        return self.max_tasks is not None and len(graph.started) >= self.max_tasks
+
+    @asynccontextmanager
+    async def _user_slot(self) -> AsyncIterator[None]:
+        if self.user_slots is None:
+            yield
+            return
+
+        async with self.user_slots.hold(self.user_id):
+            yield
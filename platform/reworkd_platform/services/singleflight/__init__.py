@@ -0,0 +1 @@
+"""Coalescing of identical in-flight LLM calls"""
@@ -0,0 +1,42 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
+from lanarky.responses import StreamingResponse as LanarkyStreamingResponse
+from starlette.types import Message
+
+
+async def iter_body(response: FastAPIStreamingResponse) -> AsyncIterator[bytes]:
+    """
+    Iterate over the body of a streaming response without sending it.
+
+    Lanarky responses only produce output while their chain runs, so the chain
+    is executed here with a `send` that captures the body messages instead.
+    """
+    if not isinstance(response, LanarkyStreamingResponse):
+        async for data in response.body_iterator:
+            yield data if isinstance(data, bytes) else data.encode(response.charset)
+        return
+
+    queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+
+    async def send(message: Message) -> None:
+        if message["type"] == "http.response.body" and message.get("body"):
+            await queue.put(message["body"])
+
+    async def execute() -> None:
+        try:
+            await response.chain_executor(send)
+        except Exception as e:
+            # Mirror lanarky, which streams the error message as the body
+            await queue.put(str(e).encode(response.charset))
+        finally:
+            await queue.put(None)
+
+    task = asyncio.create_task(execute())
+    try:
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,10 @@
+"""Single Flight"""
+from typing import Optional
+
+from fastapi import Request
+
+from reworkd_platform.services.singleflight.singleflight import SingleFlight
+
+
+def get_single_flight(request: Request) -> Optional[SingleFlight]:
+    return request.app.state.single_flight
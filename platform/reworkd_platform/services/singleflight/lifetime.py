@@ -0,0 +1,13 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.singleflight.singleflight import SingleFlight
+from reworkd_platform.settings import settings
+
+
+def init_single_flight(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the process wide single-flight group.
+
+    :param app: current application.
+    """
+    app.state.single_flight = SingleFlight() if settings.single_flight_enabled else None
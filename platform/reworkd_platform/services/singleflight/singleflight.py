@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
+from starlette.background import BackgroundTask
+
+from reworkd_platform.services.singleflight.body import iter_body
+
+
+def scoped_key(key: str, model: Any) -> str:
+    """
+    Scope a key to the credentials of a model, so that calls are only shared
+    between callers using the same API key and base URL.
+    """
+    base = getattr(model, "openai_api_base", None) or ""
+    api_key = getattr(model, "openai_api_key", None) or ""
+    credentials = hashlib.sha256(f"{base}\0{api_key}".encode()).hexdigest()
+    return f"{key}:{credentials}"
+
+
+class SharedStream:
+    """
+    A single upstream streaming response fanned out to many subscribers.
+
+    Chunks are buffered so that subscribers joining late replay the stream
+    from the start before following it live. Once the last subscriber leaves,
+    the upstream response is cancelled.
+    """
+
+    def __init__(self, response: "asyncio.Future[FastAPIStreamingResponse]"):
+        self.response = response
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.subscribers = 0
+        self.cancelled = False
+        self._changed = asyncio.Condition()
+        self.pump = asyncio.ensure_future(self._pump())
+
+    async def _pump(self) -> None:
+        try:
+            async for chunk in iter_body(await self.response):
+                async with self._changed:
+                    self.chunks.append(chunk)
+                    self._changed.notify_all()
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> FastAPIStreamingResponse:
+        self.subscribers += 1
+        try:
+            response = await asyncio.shield(self.response)
+        except BaseException:
+            self._unsubscribe()
+            raise
+
+        # A body that is never iterated (the client left before it started)
+        # is released by the background task that runs after the response
+        leave = self._subscription()
+        return FastAPIStreamingResponse(
+            self._follow(leave),
+            status_code=response.status_code,
+            media_type=response.media_type,
+            background=BackgroundTask(leave),
+        )
+
+    def _subscription(self) -> Callable[[], None]:
+        left = False
+
+        def leave() -> None:
+            nonlocal left
+            if not left:
+                left = True
+                self._unsubscribe()
+
+        return leave
+
+    def _unsubscribe(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0:
+            # Nobody is left to read the stream, stop producing it
+            self.cancelled = True
+            self.response.cancel()
+            self.pump.cancel()
+
+    async def _follow(self, leave: Callable[[], None]) -> AsyncIterator[bytes]:
+        index = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(
+                        lambda: len(self.chunks) > index or self.done
+                    )
+                    chunks = self.chunks[index:]
+                    finished = self.done
+
+                for chunk in chunks:
+                    yield chunk
+                index += len(chunks)
+
+                if finished and index >= len(self.chunks):
+                    return
+        finally:
+            leave()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single upstream call.
+
+    The upstream call runs in its own task so that a caller disconnecting
+    does not cancel the call for everyone else waiting on it.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self._streams: Dict[str, SharedStream] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        if (call := self._calls.get(key)) is not None:
+            self.coalesced += 1
+        else:
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(self._calls, key, done))
+
+        return await asyncio.shield(call)
+
+    async def stream(
+        self, key: str, func: Callable[[], Awaitable[FastAPIStreamingResponse]]
+    ) -> FastAPIStreamingResponse:
+        shared = self._streams.get(key)
+        if shared is not None and not shared.cancelled:
+            self.coalesced += 1
+        else:
+            shared = SharedStream(asyncio.ensure_future(func()))
+            self._streams[key] = shared
+            shared.pump.add_done_callback(
+                lambda _: self._forget(self._streams, key, shared)
+            )
+
+        return await shared.subscribe()
+
+    @staticmethod
+    def _forget(calls: Dict[str, Any], key: str, call: Any) -> None:
+        if calls.get(key) is call:
+            del calls[key]
+
+        # Consume errors so that calls nobody is waiting on anymore don't warn
+        future = call.pump if isinstance(call, SharedStream) else call
+        if not future.cancelled():
+            future.exception()
@@ -0,0 +1 @@
+"""Agent steps executed by separate worker processes through Kafka"""
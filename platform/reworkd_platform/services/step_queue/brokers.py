@@ -0,0 +1,122 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka.helpers import create_ssl_context
+
+
+class Broker(ABC):
+    """
+    Topics messages are published to and consumed from.
+    Every consumer group receives each message once, the consumers of a group
+    share its messages between them.
+    """
+
+    # Optional hooks, brokers without connections don't override them
+    async def start(self) -> None:  # noqa: B027
+        pass
+
+    async def stop(self) -> None:  # noqa: B027
+        pass
+
+    @abstractmethod
+    async def send(self, topic: str, key: str, value: bytes) -> None:
+        pass
+
+    @abstractmethod
+    async def subscribe(
+        self, topic: str, group: Optional[str] = None, from_beginning: bool = False
+    ) -> AsyncIterator[bytes]:
+        """
+        Join `group` on `topic`. Messages sent once this returns are received.
+        With `from_beginning` a new group also receives the messages sent
+        before it joined. Without a group every message is received and no
+        offsets are kept.
+        """
+
+
+class MemoryBroker(Broker):
+    """Single process stand-in for a Kafka cluster with a single broker"""
+
+    def __init__(self) -> None:
+        self._groups: Dict[str, Dict[str, "asyncio.Queue[bytes]"]] = defaultdict(dict)
+        self._backlog: Dict[str, List[bytes]] = defaultdict(list)
+
+    async def send(self, topic: str, key: str, value: bytes) -> None:
+        self._backlog[topic].append(value)
+        for queue in self._groups[topic].values():
+            queue.put_nowait(value)
+
+    async def subscribe(
+        self, topic: str, group: Optional[str] = None, from_beginning: bool = False
+    ) -> AsyncIterator[bytes]:
+        queue = self._groups[topic].get(group) if group else None
+        if queue is None:
+            queue = asyncio.Queue()
+            self._groups[topic][group or f"_{id(queue)}"] = queue
+            for value in self._backlog[topic] if from_beginning else []:
+                queue.put_nowait(value)
+
+        async def messages() -> AsyncIterator[bytes]:
+            while True:
+                yield await queue.get()  # type: ignore
+
+        return messages()
+
+
+class KafkaBroker(Broker):
+    """Kafka through aiokafka, SASL over SSL is used if a username is set"""
+
+    def __init__(
+        self,
+        bootstrap_servers: Union[str, List[str]],
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        sasl_mechanism: str = "PLAIN",
+    ):
+        self.options: Dict[str, Any] = {"bootstrap_servers": bootstrap_servers}
+        if username:
+            self.options.update(
+                security_protocol="SASL_SSL",
+                sasl_mechanism=sasl_mechanism,
+                sasl_plain_username=username,
+                sasl_plain_password=password,
+                ssl_context=create_ssl_context(),
+            )
+        self._producer: Optional[AIOKafkaProducer] = None
+
+    async def start(self) -> None:
+        self._producer = AIOKafkaProducer(**self.options)
+        await self._producer.start()
+
+    async def stop(self) -> None:
+        if self._producer:
+            await self._producer.stop()
+            self._producer = None
+
+    async def send(self, topic: str, key: str, value: bytes) -> None:
+        if not self._producer:
+            raise RuntimeError("Broker has not been started")
+        await self._producer.send_and_wait(topic, value, key=key.encode())
+
+    async def subscribe(
+        self, topic: str, group: Optional[str] = None, from_beginning: bool = False
+    ) -> AsyncIterator[bytes]:
+        consumer = AIOKafkaConsumer(
+            topic,
+            group_id=group,
+            auto_offset_reset="earliest" if from_beginning else "latest",
+            **self.options,
+        )
+        await consumer.start()
+
+        async def messages() -> AsyncIterator[bytes]:
+            try:
+                async for record in consumer:
+                    yield record.value
+            finally:
+                await consumer.stop()
+
+        return messages()
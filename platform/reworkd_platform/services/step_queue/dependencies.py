@@ -0,0 +1,9 @@
+from typing import Optional
+
+from fastapi import Request
+
+from reworkd_platform.services.step_queue.dispatcher import StepDispatcher
+
+
+def get_step_dispatcher(request: Request) -> Optional[StepDispatcher]:
+    return request.app.state.step_dispatcher
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, Optional
+
+from loguru import logger
+
+from reworkd_platform.services.step_queue.brokers import Broker
+from reworkd_platform.services.step_queue.jobs import StepEvent, StepJob
+from reworkd_platform.web.api.errors import StepWorkerError
+
+
+class StepDispatcher:
+    """
+    Enqueues jobs for the step workers and routes the events they publish back
+    to the request waiting for them.
+
+    Every API process reads all results outside of any consumer group and drops
+    the events of jobs it didn't submit.
+    """
+
+    def __init__(
+        self,
+        broker: Broker,
+        jobs_topic: str,
+        results_topic: str,
+        timeout: float,
+    ):
+        self.broker = broker
+        self.jobs_topic = jobs_topic
+        self.results_topic = results_topic
+        self.timeout = timeout
+        self._waiting: Dict[str, "asyncio.Queue[StepEvent]"] = {}
+        self._listener: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        await self.broker.start()
+        messages = await self.broker.subscribe(self.results_topic)
+        self._listener = asyncio.create_task(self._listen(messages))
+
+    async def stop(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        await self.broker.stop()
+
+    async def _listen(self, messages: AsyncIterator[bytes]) -> None:
+        async for value in messages:
+            try:
+                event = StepEvent.parse_raw(value)
+            except ValueError as e:
+                logger.warning(f"Dropping malformed step event: {e}")
+                continue
+
+            if queue := self._waiting.get(event.job_id):
+                queue.put_nowait(event)
+
+    async def submit(self, job: StepJob) -> AsyncGenerator[StepEvent, None]:
+        """Enqueue a job and yield its events, the last one is done"""
+        # Workers skip the job once this request has stopped waiting for it
+        job = job.copy(update={"deadline": time.time() + self.timeout})
+        queue: "asyncio.Queue[StepEvent]" = asyncio.Queue()
+        self._waiting[job.id] = queue
+        try:
+            await self.broker.send(self.jobs_topic, job.id, job.json().encode())
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.timeout)
+                except asyncio.TimeoutError as e:
+                    raise StepWorkerError(
+                        e, f"No step worker answered within {self.timeout}s", 504
+                    )
+
+                yield event
+                if event.done:
+                    return
+        finally:
+            self._waiting.pop(job.id, None)
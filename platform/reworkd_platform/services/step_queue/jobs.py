@@ -0,0 +1,68 @@
+import time
+from typing import Any, Dict, Literal, Optional
+from uuid import uuid4
+
+from pydantic import BaseModel, Field
+
+from reworkd_platform.schemas.agent import LLM_Model, ModelSettings
+from reworkd_platform.services.security import encryption_service
+
+Step_Event_Type = Literal["chunk", "result", "error"]
+
+
+class StepJob(BaseModel):
+    """
+    A call of an AgentService method to be executed by a step worker.
+
+    Jobs only reference the user, the worker looks them up. A custom API key
+    is sent encrypted and never as part of the model settings. Once past its
+    `deadline` (a UNIX timestamp) nobody waits for the job anymore.
+    """
+
+    id: str = Field(default_factory=lambda: uuid4().hex)
+    method: str
+    kwargs: Dict[str, Any]
+    model_settings: ModelSettings
+    user_id: str
+    encrypted_api_key: Optional[str] = None
+    run_id: Optional[str] = None
+    streaming: bool = False
+    llm_model: Optional[LLM_Model] = None
+    deadline: Optional[float] = None
+
+    @classmethod
+    def create(cls, model_settings: ModelSettings, **kwargs: Any) -> "StepJob":
+        key = model_settings.custom_api_key
+        return cls(
+            model_settings=model_settings.copy(update={"custom_api_key": None}),
+            encrypted_api_key=key and encryption_service.encrypt(key).decode(),
+            **kwargs,
+        )
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and self.deadline < time.time()
+
+    def get_model_settings(self) -> ModelSettings:
+        if not self.encrypted_api_key:
+            return self.model_settings
+
+        key = encryption_service.decrypt(self.encrypted_api_key)
+        return self.model_settings.copy(update={"custom_api_key": key})
+
+
+class StepEvent(BaseModel):
+    """
+    Output of a job. Streaming jobs send their text as chunks followed by an
+    empty result, other jobs a single JSON encoded result. A failed job ends
+    with an error.
+    """
+
+    job_id: str
+    type: Step_Event_Type
+    data: str = ""
+    code: int = 500
+
+    @property
+    def done(self) -> bool:
+        return self.type != "chunk"
@@ -0,0 +1,41 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.step_queue.brokers import Broker, KafkaBroker
+from reworkd_platform.services.step_queue.dispatcher import StepDispatcher
+from reworkd_platform.settings import settings
+
+
+def create_broker() -> Broker:  # pragma: no cover
+    return KafkaBroker(
+        settings.kafka_bootstrap_servers,
+        username=settings.kafka_username,
+        password=settings.kafka_password,
+        sasl_mechanism=settings.kafka_ssal_mechanism,
+    )
+
+
+async def init_step_dispatcher(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the dispatcher that sends agent steps to the step workers.
+    Steps run in the API process unless `step_workers_enabled` is set and
+    Kafka is configured.
+
+    :param app: current application.
+    """
+    app.state.step_dispatcher = None
+    if not settings.step_queue_enabled:
+        return
+
+    dispatcher = StepDispatcher(
+        create_broker(),
+        jobs_topic=settings.kafka_steps_topic,
+        results_topic=settings.kafka_step_results_topic,
+        timeout=settings.step_timeout,
+    )
+    await dispatcher.start()
+    app.state.step_dispatcher = dispatcher
+
+
+async def shutdown_step_dispatcher(app: FastAPI) -> None:  # pragma: no cover
+    if app.state.step_dispatcher:
+        await app.state.step_dispatcher.stop()
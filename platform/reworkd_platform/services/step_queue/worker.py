@@ -0,0 +1,92 @@
+import asyncio
+from typing import AsyncIterator, Callable, Optional, Set
+
+from loguru import logger
+
+from reworkd_platform.services.step_queue.brokers import Broker
+from reworkd_platform.services.step_queue.jobs import StepEvent, StepJob
+
+
+class StepWorker:
+    """
+    Consumes jobs and publishes their events to the results topic.
+
+    At most `concurrency` jobs run at once. No jobs are read while all slots
+    are taken, the next ones wait on the partitions assigned to this worker.
+    New workers read the jobs sent before their group existed, expired jobs
+    are dropped.
+    """
+
+    def __init__(
+        self,
+        broker: Broker,
+        execute: Callable[[StepJob], AsyncIterator[StepEvent]],
+        jobs_topic: str,
+        results_topic: str,
+        group: str,
+        concurrency: int,
+    ):
+        self.broker = broker
+        self.execute = execute
+        self.jobs_topic = jobs_topic
+        self.results_topic = results_topic
+        self.group = group
+        self.concurrency = concurrency
+
+    async def run(self) -> None:
+        messages = await self.broker.subscribe(
+            self.jobs_topic, self.group, from_beginning=True
+        )
+        slots = asyncio.Semaphore(self.concurrency)
+        running: Set["asyncio.Task[None]"] = set()
+
+        def release(task: "asyncio.Task[None]") -> None:
+            running.discard(task)
+            slots.release()
+
+        try:
+            while True:
+                await slots.acquire()
+                try:
+                    value = await messages.__anext__()
+                except BaseException:
+                    slots.release()
+                    raise
+
+                task = asyncio.create_task(self.process(value))
+                running.add(task)
+                task.add_done_callback(release)
+        finally:
+            for task in list(running):
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def process(self, value: bytes) -> None:
+        job = parse_job(value)
+        if not job:
+            return
+
+        try:
+            async for event in self.execute(job):
+                await self.publish(event)
+        except Exception as e:
+            logger.exception(f"Step {job.method} of job {job.id} failed")
+            await self.publish(StepEvent(job_id=job.id, type="error", data=str(e)))
+
+    async def publish(self, event: StepEvent) -> None:
+        await self.broker.send(self.results_topic, event.job_id, event.json().encode())
+
+
+def parse_job(value: bytes) -> Optional[StepJob]:
+    """Parse a job, None if it is malformed or nobody waits for it anymore"""
+    try:
+        job = StepJob.parse_raw(value)
+    except ValueError as e:
+        logger.warning(f"Dropping malformed step job: {e}")
+        return None
+
+    if job.expired:
+        logger.info(f"Dropping expired step job {job.id}")
+        return None
+
+    return job
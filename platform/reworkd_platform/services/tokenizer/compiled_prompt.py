@@ -0,0 +1,26 @@
+from string import Formatter
+from typing import Any, Callable, List
+
+from langchain import PromptTemplate
+
+
+class CompiledPrompt:
+    """
+    A prompt template split into its static text and variable slots.
+
+    The static text is counted once, so counting a formatted prompt only
+    encodes the values of its variables. Tokens don't merge across the slot
+    boundaries as they would in the formatted prompt, which makes the count
+    a slight overestimate.
+    """
+
+    def __init__(self, template: PromptTemplate, count: Callable[[str], int]):
+        if template.template_format != "f-string":
+            raise ValueError(f"Can't compile a {template.template_format} template")
+
+        segments = list(Formatter().parse(template.template))
+        self.static_tokens = sum(count(literal) for literal, _, _, _ in segments)
+        self.slots: List[str] = [name for _, name, _, _ in segments if name]
+
+    def count(self, count: Callable[[str], int], **kwargs: Any) -> int:
+        return self.static_tokens + sum(count(str(kwargs[name])) for name in self.slots)
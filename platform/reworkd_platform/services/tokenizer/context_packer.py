@@ -0,0 +1,105 @@
+import math
+import re
+from typing import Dict, List, Set
+
+from reworkd_platform.schemas.agent import LLM_Model
+from reworkd_platform.services.tokenizer.count_cache import TokenCountCache
+from reworkd_platform.services.tokenizer.token_service import TokenService
+
+WORD = re.compile(r"\w+")
+STOP_WORDS = {
+    "a", "about", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for",
+    "from", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "tell",
+    "that", "the", "this", "to", "was", "what", "when", "where", "which", "who",
+    "why", "with", "you", "your",
+}  # fmt: skip
+
+# Below this many tokens a truncated result isn't worth including
+MIN_PARTIAL_TOKENS = 100
+
+
+def terms(text: str) -> Set[str]:
+    return {
+        word
+        for word in WORD.findall(text.lower())
+        if word not in STOP_WORDS and len(word) > 1
+    }
+
+
+class ContextPacker:
+    """
+    Picks the results that go into a chat prompt so that they fit a token budget.
+
+    Results are ranked by their relevance to the message (the idf weighted
+    terms of the message a result contains, relative to the best result) plus a
+    bonus for recency, and added greedily until the budget is used up. The
+    chosen results keep their original order.
+
+    Token counts are cached per result, so chatting about the same run again
+    doesn't encode its results again. The packer keeps its own cache when the
+    token service it is given has none.
+    """
+
+    def __init__(
+        self,
+        token_service: TokenService,
+        max_tokens: int = 3000,
+        min_completion_tokens: int = 500,
+        recency_weight: float = 0.3,
+        cache_size: int = 10_000,
+    ):
+        self.token_service = (
+            token_service
+            if token_service.cache is not None
+            else TokenService(token_service.encoding_name, TokenCountCache(cache_size))
+        )
+        self.max_tokens = max_tokens
+        self.min_completion_tokens = min_completion_tokens
+        self.recency_weight = recency_weight
+
+    def count(self, text: str) -> int:
+        return self.token_service.count(text)
+
+    def budget(self, model: LLM_Model, *prompts: str, prompt_tokens: int = 0) -> int:
+        """Tokens left for results once the prompts and the answer are accounted for"""
+        space = self.token_service.get_completion_space(
+            model, *prompts, prompt_tokens=prompt_tokens
+        )
+        return max(min(self.max_tokens, space - self.min_completion_tokens), 0)
+
+    def scores(self, message: str, results: List[str]) -> List[float]:
+        if not results:
+            return []
+
+        query = terms(message)
+        documents = [terms(result) for result in results]
+        idf: Dict[str, float] = {}
+        for term in query:
+            df = sum(term in document for document in documents)
+            idf[term] = math.log((len(results) + 1) / (df + 1)) + 1
+        relevance = [
+            sum(idf[term] for term in query & document) for document in documents
+        ]
+        top = max(relevance) or 1
+
+        return [
+            relevance[i] / top + self.recency_weight * (i + 1) / len(results)
+            for i in range(len(results))
+        ]
+
+    def pack(self, message: str, results: List[str], budget: int) -> List[str]:
+        scores = self.scores(message, results)
+        ranked = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+
+        chosen: Dict[int, str] = {}
+        remaining = budget
+        for i in ranked:
+            count = self.count(results[i])
+            if count <= remaining:
+                chosen[i] = results[i]
+                remaining -= count
+            elif remaining >= MIN_PARTIAL_TOKENS:
+                chosen[i] = self.token_service.truncate(results[i], remaining)
+                remaining = 0
+
+        return [chosen[i] for i in sorted(chosen)]
@@ -0,0 +1,51 @@
+import hashlib
+from collections import OrderedDict
+from typing import Callable
+
+from pydantic import BaseModel
+
+
+class TokenCountStats(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    size: int
+
+
+class TokenCountCache:
+    """
+    LRU cache of token counts keyed on a hash of the encoding and the text.
+
+    Only the hash is kept, so large texts such as task results don't stay in
+    memory after they have been counted.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+
+    def get_or_count(
+        self, encoding: str, text: str, count: Callable[[str], int]
+    ) -> int:
+        key = hashlib.sha256(f"{encoding}\0{text}".encode()).digest()
+        if (cached := self._counts.get(key)) is not None:
+            self._counts.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        value = self._counts[key] = count(text)
+        while len(self._counts) > self.max_size:
+            self._counts.popitem(last=False)
+        return value
+
+    def stats(self) -> TokenCountStats:
+        total = self.hits + self.misses
+        return TokenCountStats(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / total if total else 0.0,
+            size=len(self._counts),
+        )
@@ -1,7 +1,19 @@
+from typing import Optional
+
 from fastapi import Request
 
+from reworkd_platform.services.tokenizer.context_packer import ContextPacker
+from reworkd_platform.services.tokenizer.count_cache import TokenCountCache
 from reworkd_platform.services.tokenizer.token_service import TokenService
 
 
 def get_token_service(request: Request) -> TokenService:
-    return TokenService(request.app.state.token_encoding)
+    return request.app.state.token_service
+
+
+def get_token_count_cache(request: Request) -> Optional[TokenCountCache]:
+    return request.app.state.token_count_cache
+
+
+def get_context_packer(request: Request) -> ContextPacker:
+    return request.app.state.context_packer
@@ -0,0 +1,26 @@
+import threading
+from typing import Dict
+
+import tiktoken
+from tiktoken import Encoding
+
+DEFAULT_ENCODING = "cl100k_base"  # gpt-4, gpt-3.5-turbo, text-embedding-ada-002
+
+_encodings: Dict[str, Encoding] = {}
+_lock = threading.Lock()
+
+
+def get_encoding(name: str = DEFAULT_ENCODING) -> Encoding:
+    """
+    Process wide registry of encodings, each is built once on first use.
+
+    tiktoken reads the BPE ranks from TIKTOKEN_CACHE_DIR and only downloads
+    them when they are missing there. The image pre-warms that directory.
+    """
+    if (encoding := _encodings.get(name)) is not None:
+        return encoding
+
+    with _lock:
+        if name not in _encodings:
+            _encodings[name] = tiktoken.get_encoding(name)
+        return _encodings[name]
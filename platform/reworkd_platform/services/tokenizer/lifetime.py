@@ -1,16 +1,31 @@
-import tiktoken
 from fastapi import FastAPI
 
-ENCODING_NAME = "cl100k_base"  # gpt-4, gpt-3.5-turbo, text-embedding-ada-002
+from reworkd_platform.services.tokenizer.context_packer import ContextPacker
+from reworkd_platform.services.tokenizer.count_cache import TokenCountCache
+from reworkd_platform.services.tokenizer.token_service import TokenService
+from reworkd_platform.settings import settings
 
 
 def init_tokenizer(app: FastAPI) -> None:  # pragma: no cover
     """
     Initialize tokenizer.
 
-    TikToken downloads the encoding on start. It is then
-    stored in the state of the application.
+    A token service shared by all requests is stored in the state of the
+    application. Its encoding is only built on first use, from the TikToken
+    cache that is only downloaded when empty, so it doesn't slow down startup.
+    Prompt templates are counted the first time they are used.
 
     :param app: current application.
     """
-    app.state.token_encoding = tiktoken.get_encoding(ENCODING_NAME)
+    app.state.token_count_cache = (
+        TokenCountCache(settings.token_count_cache_size)
+        if settings.token_count_cache_enabled
+        else None
+    )
+    app.state.token_service = TokenService(cache=app.state.token_count_cache)
+    app.state.context_packer = ContextPacker(
+        app.state.token_service,
+        max_tokens=settings.chat_context_max_tokens,
+        min_completion_tokens=settings.chat_min_completion_tokens,
+        recency_weight=settings.chat_context_recency_weight,
+    )
@@ -1,16 +1,73 @@
-from tiktoken import Encoding, get_encoding
+from typing import Any, Dict, List, Literal, Mapping, Optional, Sequence, Tuple, Union
 
-from reworkd_platform.schemas.agent import LLM_MODEL_MAX_TOKENS, LLM_Model
+from langchain import PromptTemplate
+from loguru import logger
+from tiktoken import Encoding
+
+from reworkd_platform.schemas.agent import LLM_Model, get_model_spec
+from reworkd_platform.services.tokenizer.compiled_prompt import CompiledPrompt
+from reworkd_platform.services.tokenizer.count_cache import TokenCountCache
+from reworkd_platform.services.tokenizer.encodings import DEFAULT_ENCODING, get_encoding
 from reworkd_platform.web.api.agent.model_factory import WrappedChatOpenAI
 
+# Function specs differ per combination of tools a user has enabled
+FUNCTION_CACHE_SIZE = 256
+
+# Truncation encodes chunks of about this many characters per token first
+CHARS_PER_TOKEN = 4
+# Tokens this close to the cut of a chunk may differ from those of the whole text
+BOUNDARY_TOKENS = 8
+
+Truncation = Literal["head", "tail", "head_tail"]
+
 
 class TokenService:
-    def __init__(self, encoding: Encoding):
-        self.encoding = encoding
+    """
+    Counts, truncates and budgets tokens. An encoding given by name is only
+    loaded the first time text is encoded.
+    """
+
+    def __init__(
+        self,
+        encoding: Union[Encoding, str] = DEFAULT_ENCODING,
+        cache: Optional[TokenCountCache] = None,
+    ):
+        self._encoding = encoding
+        self.cache = cache
+        self._prompts: Dict[str, CompiledPrompt] = {}
+        self._functions = TokenCountCache(FUNCTION_CACHE_SIZE)
+        self._models: Dict[str, "TokenService"] = {}
 
     @classmethod
-    def create(cls, encoding: str = "cl100k_base") -> "TokenService":
-        return cls(get_encoding(encoding))
+    def create(cls, encoding: str = DEFAULT_ENCODING) -> "TokenService":
+        return cls(encoding)
+
+    @property
+    def encoding(self) -> Encoding:
+        if isinstance(self._encoding, str):
+            self._encoding = get_encoding(self._encoding)
+        return self._encoding
+
+    @property
+    def encoding_name(self) -> str:
+        if isinstance(self._encoding, str):
+            return self._encoding
+        return self._encoding.name
+
+    def for_model(self, model: str) -> "TokenService":
+        """A token service with the encoding of the model, sharing the count cache"""
+        name = get_model_spec(model).encoding
+        if name == self.encoding_name:
+            return self
+
+        if name not in self._models:
+            try:
+                self._models[name] = TokenService(get_encoding(name), self.cache)
+            except ValueError as e:
+                # e.g. an encoding the installed tiktoken doesn't know yet
+                logger.warning(f"Counting {model} tokens as {self.encoding_name}: {e}")
+                self._models[name] = self
+        return self._models[name]
 
     def tokenize(self, text: str) -> list[int]:
         return self.encoding.encode(text)
@@ -19,15 +76,146 @@ class TokenService:
         return self.encoding.decode(tokens)
 
     def count(self, text: str) -> int:
+        if self.cache is None:
+            return self._count(text)
+        return self.cache.get_or_count(self.encoding_name, text, self._count)
+
+    def _count(self, text: str) -> int:
         return len(self.tokenize(text))
 
-    def get_completion_space(self, model: LLM_Model, *prompts: str) -> int:
-        max_allowed_tokens = LLM_MODEL_MAX_TOKENS.get(model, 4000)
-        prompt_tokens = sum([self.count(p) for p in prompts])
-        return max_allowed_tokens - prompt_tokens
+    def count_up_to(self, text: str, limit: int) -> int:
+        """The token count if it is at most `limit`, otherwise `limit + 1`"""
+        tokens, complete = self._encode_head(text, limit)
+        return len(tokens) if complete else limit + 1
+
+    def truncate(
+        self,
+        text: str,
+        max_tokens: int,
+        mode: Truncation = "head",
+        separator: str = "\n...\n",
+    ) -> str:
+        """
+        Keep the start (head), the end (tail) or both ends (head_tail, joined by
+        the separator) of a text so it fits in `max_tokens`. Only about
+        `max_tokens` of the text are encoded, however long it is.
+        """
+        if max_tokens <= 0:
+            return ""
+
+        if mode == "tail":
+            tokens, complete = self._encode_tail(text, max_tokens)
+            return text if complete else self._decode(tokens)
+
+        tokens, complete = self._encode_head(text, max_tokens)
+        if complete:
+            return text
+        if mode == "head":
+            return self._decode(tokens)
+
+        remaining = max(max_tokens - self.count(separator), 0)
+        head = self._decode(tokens[: (remaining + 1) // 2])
+        tail, _ = self._encode_tail(text, remaining // 2)
+        return head + separator + self._decode(tail)
+
+    def truncate_all(
+        self, texts: List[str], max_tokens: int, mode: Truncation = "head"
+    ) -> List[str]:
+        """
+        Truncate texts to a fair share of `max_tokens` each. Texts shorter than
+        their share are kept whole and what they leave over is split among the
+        longer ones.
+        """
+        pending = list(range(len(texts)))
+        remaining = max(max_tokens, 0)
+        while pending:
+            share = remaining // len(pending)
+            counts = {i: self.count_up_to(texts[i], share) for i in pending}
+            fits = [i for i in pending if counts[i] <= share]
+            if not fits:
+                break
+
+            remaining -= sum(counts[i] for i in fits)
+            pending = [i for i in pending if counts[i] > share]
+
+        truncated = {i: self.truncate(texts[i], share, mode) for i in pending}
+        return [truncated.get(i, text) for i, text in enumerate(texts)]
+
+    def _encode_head(self, text: str, max_tokens: int) -> Tuple[List[int], bool]:
+        """The first `max_tokens` tokens of a text, and whether that is all of it"""
+        size = (max_tokens + BOUNDARY_TOKENS) * CHARS_PER_TOKEN
+        while size < len(text):
+            tokens = self.tokenize(text[:size])
+            if len(tokens) > max_tokens + BOUNDARY_TOKENS:
+                return tokens[:max_tokens], False
+            size *= 2
+
+        tokens = self.tokenize(text)
+        return tokens[:max_tokens], len(tokens) <= max_tokens
+
+    def _encode_tail(self, text: str, max_tokens: int) -> Tuple[List[int], bool]:
+        """The last `max_tokens` tokens of a text, and whether that is all of it"""
+        size = (max_tokens + BOUNDARY_TOKENS) * CHARS_PER_TOKEN
+        while size < len(text):
+            tokens = self.tokenize(text[-size:])
+            if len(tokens) > max_tokens + BOUNDARY_TOKENS:
+                return tokens[len(tokens) - max_tokens :], False
+            size *= 2
+
+        tokens = self.tokenize(text)
+        return tokens[max(len(tokens) - max_tokens, 0) :], len(tokens) <= max_tokens
+
+    def _decode(self, tokens: List[int]) -> str:
+        # A cut can split a multi byte character, which is dropped
+        return self.encoding.decode_bytes(tokens).decode(errors="ignore")
+
+    def compile(self, *templates: PromptTemplate) -> None:
+        """Count the static text of templates ahead of `count_prompt`"""
+        for template in templates:
+            self._compiled(template)
+
+    def count_prompt(self, template: PromptTemplate, **kwargs: Any) -> int:
+        """Tokens of the formatted template, only the variables are encoded"""
+        return self._compiled(template).count(self.count, **kwargs)
+
+    def count_functions(self, functions: Sequence[Mapping[str, object]]) -> int:
+        """Tokens of the function specs sent along with a prompt"""
+        return sum(
+            self._functions.get_or_count(self.encoding_name, str(f), self._count)
+            for f in functions
+        )
+
+    def _compiled(self, template: PromptTemplate) -> CompiledPrompt:
+        if (compiled := self._prompts.get(template.template)) is None:
+            compiled = self._prompts[template.template] = CompiledPrompt(
+                template, self._count
+            )
+        return compiled
+
+    def get_completion_space(
+        self,
+        model: LLM_Model,
+        *prompts: str,
+        prompt_tokens: int = 0,
+        functions: Sequence[Mapping[str, object]] = (),
+    ) -> int:
+        """Tokens of the context window left once the prompts are accounted for"""
+        prompt_tokens += sum([self.count(p) for p in prompts])
+        prompt_tokens += self.count_functions(functions)
+        return get_model_spec(model).context_window - prompt_tokens
 
-    def calculate_max_tokens(self, model: WrappedChatOpenAI, *prompts: str) -> None:
-        requested_tokens = self.get_completion_space(model.model_name, *prompts)
+    def calculate_max_tokens(
+        self,
+        model: WrappedChatOpenAI,
+        *prompts: str,
+        prompt_tokens: int = 0,
+        functions: Sequence[Mapping[str, object]] = (),
+    ) -> None:
+        """Limit the completion to what the model can output and its window has left"""
+        requested_tokens = self.get_completion_space(
+            model.model_name, *prompts, prompt_tokens=prompt_tokens, functions=functions
+        )
+        max_output_tokens = get_model_spec(model.model_name).max_output_tokens
 
-        model.max_tokens = min(model.max_tokens, requested_tokens)
+        model.max_tokens = min(model.max_tokens, requested_tokens, max_output_tokens)
         model.max_tokens = max(model.max_tokens, 1)
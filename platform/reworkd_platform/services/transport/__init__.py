@@ -0,0 +1 @@
+"""Shared HTTP transport for LLM providers"""
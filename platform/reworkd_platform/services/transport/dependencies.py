@@ -0,0 +1,8 @@
+"""LLM Transport"""
+from fastapi import Request
+
+from reworkd_platform.services.transport.transport import LLMTransport
+
+
+def get_llm_transport(request: Request) -> LLMTransport:
+    return request.app.state.llm_transport
@@ -0,0 +1,23 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.transport.transport import LLMTransport
+from reworkd_platform.settings import settings
+
+
+def init_transport(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the shared LLM transport.
+
+    Sessions are created lazily per API base and live
+    until the application shuts down.
+
+    :param app: current application.
+    """
+    app.state.llm_transport = LLMTransport(
+        pool_size=settings.llm_pool_size,
+        keepalive_timeout=settings.llm_pool_keepalive_timeout,
+    )
+
+
+async def shutdown_transport(app: FastAPI) -> None:  # pragma: no cover
+    await app.state.llm_transport.close()
@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from urllib.parse import urlparse
+
+import aiohttp
+import openai
+
+
+class LLMTransport:
+    """
+    Process wide pool of keep-alive aiohttp sessions used for LLM calls.
+
+    OpenAI's client opens (and closes) a new session for every request unless one
+    is bound to `openai.aiosession`. We keep one session per API base so that
+    model instances created per request share warm connections.
+    """
+
+    def __init__(self, pool_size: int = 100, keepalive_timeout: float = 30.0):
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def get_session(self, api_base: str) -> aiohttp.ClientSession:
+        key = pool_key(api_base)
+        session = self._sessions.get(key)
+
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+            )
+            self._sessions[key] = session
+
+        return session
+
+    @contextmanager
+    def bind(self, api_base: str) -> Iterator[aiohttp.ClientSession]:
+        """Route OpenAI requests made within this block through the pooled session"""
+        session = self.get_session(api_base)
+        token = openai.aiosession.set(session)
+        try:
+            yield session
+        finally:
+            openai.aiosession.reset(token)
+
+    async def close(self) -> None:
+        sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            await session.close()
+
+
+def pool_key(api_base: str) -> str:
+    """Connections are reusable per origin, so Azure and Helicone paths share a pool"""
+    parsed = urlparse(api_base)
+    if not parsed.scheme or not parsed.netloc:
+        return api_base
+
+    return f"{parsed.scheme}://{parsed.netloc}".lower()
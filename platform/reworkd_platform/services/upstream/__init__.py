@@ -0,0 +1 @@
+"""Health tracking and failover across LLM API bases"""
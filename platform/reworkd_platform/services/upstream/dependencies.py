@@ -0,0 +1,8 @@
+"""Upstream Router"""
+from fastapi import Request
+
+from reworkd_platform.services.upstream.router import UpstreamRouter
+
+
+def get_upstream_router(request: Request) -> UpstreamRouter:
+    return request.app.state.upstream_router
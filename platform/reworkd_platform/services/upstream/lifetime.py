@@ -0,0 +1,18 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.upstream.router import UpstreamRouter
+from reworkd_platform.settings import settings
+
+
+def init_upstream_router(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize health tracking of the LLM API bases.
+
+    :param app: current application.
+    """
+    app.state.upstream_router = UpstreamRouter(
+        failure_threshold=settings.upstream_failure_threshold,
+        open_seconds=settings.upstream_open_seconds,
+        hedging_enabled=settings.upstream_hedging_enabled,
+        hedge_min_delay=settings.upstream_hedge_min_delay,
+    )
@@ -0,0 +1,231 @@
+import asyncio
+import time
+from collections import deque
+from typing import (
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    TypeVar,
+)
+
+from openai.error import APIConnectionError, APIError, ServiceUnavailableError, Timeout
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+Circuit_State = Literal["closed", "open", "half_open"]
+
+# Errors that say something about the health of a base rather than the request
+UPSTREAM_ERRORS = (
+    APIConnectionError,
+    APIError,
+    ServiceUnavailableError,
+    Timeout,
+    asyncio.TimeoutError,
+)
+
+EWMA_ALPHA = 0.2
+LATENCY_SAMPLES = 100
+
+
+class Upstream(NamedTuple):
+    api_base: str
+    headers: Optional[Dict[str, str]] = None
+
+
+class UpstreamStats(BaseModel):
+    api_base: str
+    state: Circuit_State
+    latency: Optional[float]
+    error_rate: float
+    p95_latency: Optional[float]
+
+
+class UpstreamHealth:
+    """
+    EWMA latency and error rate of one API base, plus its circuit breaker.
+
+    The circuit opens once the error rate passes `failure_threshold`. After
+    `open_seconds` a single probe request is let through (half open): success
+    closes the circuit again, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: float, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.state: Circuit_State = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+
+    def available(self) -> bool:
+        if (
+            self.state == "open"
+            and time.monotonic() - self.opened_at >= self.open_seconds
+        ):
+            self.state = "half_open"
+
+        return self.state == "closed" or (
+            self.state == "half_open" and not self.probing
+        )
+
+    def start(self) -> None:
+        if self.state == "half_open":
+            self.probing = True
+
+    def record_success(self, latency: float) -> None:
+        self.latency = (
+            latency
+            if self.latency is None
+            else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+        )
+        self.error_rate *= 1 - EWMA_ALPHA
+        self.samples.append(latency)
+        self.probing = False
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+        self.probing = False
+        if self.state == "half_open" or self.error_rate >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """The request finished without telling us anything (e.g. cancelled)"""
+        self.probing = False
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < 20:
+            return None
+        return sorted(self.samples)[int(len(self.samples) * 0.95) - 1]
+
+
+class UpstreamRouter:
+    """
+    Routes LLM calls across equivalent API bases (e.g. Helicone and the
+    provider it proxies to) based on their health.
+
+    Calls go to the first available base in preference order and fail over to
+    the next one on upstream errors. Non-streaming calls can optionally be
+    hedged: if the primary hasn't answered after its p95 latency, the same
+    request is sent to the next base and whichever answers first wins.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        open_seconds: float = 30.0,
+        hedging_enabled: bool = False,
+        hedge_min_delay: float = 1.0,
+    ):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.hedging_enabled = hedging_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self._health: Dict[str, UpstreamHealth] = {}
+
+    def health(self, upstream: Upstream) -> UpstreamHealth:
+        return self._health.setdefault(
+            upstream.api_base,
+            UpstreamHealth(self.failure_threshold, self.open_seconds),
+        )
+
+    def order(self, upstreams: List[Upstream]) -> List[Upstream]:
+        """Available upstreams in preference order. Never empty if given any"""
+        available = [u for u in upstreams if self.health(u).available()]
+        return available or upstreams[:1]
+
+    def hedge_delay(self, upstream: Upstream) -> Optional[float]:
+        p95 = self.health(upstream).p95()
+        return None if p95 is None else max(p95, self.hedge_min_delay)
+
+    async def attempt(
+        self, upstream: Upstream, func: Callable[[Upstream], Awaitable[T]]
+    ) -> T:
+        """Run func against a single upstream, recording the outcome"""
+        health = self.health(upstream)
+        health.start()
+        start = time.monotonic()
+
+        try:
+            result = await func(upstream)
+        except UPSTREAM_ERRORS:
+            health.record_failure()
+            raise
+        except BaseException:
+            health.release()
+            raise
+
+        health.record_success(time.monotonic() - start)
+        return result
+
+    async def call(
+        self,
+        upstreams: List[Upstream],
+        func: Callable[[Upstream], Awaitable[T]],
+        hedge: bool = False,
+    ) -> T:
+        candidates = self.order(upstreams)
+        error: Optional[BaseException] = None
+
+        while candidates:
+            primary, candidates = candidates[0], candidates[1:]
+            delay = self.hedge_delay(primary)
+            attempt = asyncio.ensure_future(self.attempt(primary, func))
+
+            try:
+                if hedge and self.hedging_enabled and candidates and delay:
+                    done, _ = await asyncio.wait({attempt}, timeout=delay)
+                    if not done:
+                        secondary, candidates = candidates[0], candidates[1:]
+                        hedged = asyncio.ensure_future(self.attempt(secondary, func))
+                        return await self._first_success([attempt, hedged])
+
+                return await attempt
+            except UPSTREAM_ERRORS as e:
+                error = e
+            finally:
+                attempt.cancel()
+
+        raise error or ValueError("No upstream to call")
+
+    @staticmethod
+    async def _first_success(tasks: "List[asyncio.Future[T]]") -> T:
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.cancelled():
+                        error = asyncio.CancelledError()
+                    elif (error := task.exception()) is None:
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise error or ValueError("No upstream to call")
+
+    def stats(self) -> List[UpstreamStats]:
+        return [
+            UpstreamStats(
+                api_base=api_base,
+                state=health.state,
+                latency=health.latency,
+                error_rate=health.error_rate,
+                p95_latency=health.p95(),
+            )
+            for api_base, health in self._health.items()
+        ]
@@ -0,0 +1 @@
+"""Tokens and cost of the LLM calls of each run"""
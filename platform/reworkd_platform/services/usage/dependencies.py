@@ -0,0 +1,7 @@
+from fastapi import Request
+
+from reworkd_platform.services.usage.meter import UsageMeter
+
+
+def get_usage_meter(request: Request) -> UsageMeter:
+    return request.app.state.usage_meter
@@ -0,0 +1,16 @@
+from fastapi import FastAPI
+
+from reworkd_platform.services.usage.meter import UsageMeter
+
+
+def init_usage_meter(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Initialize the meter that records the usage of every run.
+    Must run after the database and the tokenizer have been initialized.
+
+    :param app: current application.
+    """
+    app.state.usage_meter = UsageMeter(
+        app.state.db_session_factory,
+        app.state.token_service.count,
+    )
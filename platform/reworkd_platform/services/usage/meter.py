@@ -0,0 +1,95 @@
+import asyncio
+from typing import Callable, Dict, Set, Tuple
+
+from loguru import logger
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from reworkd_platform.db.models.agent import AgentRun
+
+# USD per 1K prompt and completion tokens
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4o": (0.005, 0.015),
+}
+
+
+def cost_of(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class UsageMeter:
+    """
+    Records the tokens and cost of LLM calls against their run.
+
+    Every record is an atomic increment of the run's totals in a session of its
+    own, so concurrent calls of a run don't contend for the request's session.
+    `count` is used for streams, which don't report their usage.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        count: Callable[[str], int],
+    ):
+        self.session_factory = session_factory
+        self.count = count
+        self._pending: Set["asyncio.Task[None]"] = set()
+
+    def for_run(self, run_id: str, model: str) -> "RunUsage":
+        return RunUsage(self, run_id, model)
+
+    async def record(
+        self, run_id: str, model: str, prompt_tokens: int, completion_tokens: int
+    ) -> None:
+        try:
+            async with self.session_factory() as session:
+                await session.execute(
+                    update(AgentRun)
+                    .where(AgentRun.id == run_id)
+                    .values(
+                        prompt_tokens=AgentRun.prompt_tokens + prompt_tokens,
+                        completion_tokens=AgentRun.completion_tokens
+                        + completion_tokens,
+                        cost=AgentRun.cost
+                        + cost_of(model, prompt_tokens, completion_tokens),
+                    )
+                )
+                await session.commit()
+        except Exception as e:
+            # Metering must never fail the call it is recording
+            logger.warning(f"Failed to record usage of run {run_id}: {e}")
+
+    def record_in_background(
+        self, run_id: str, model: str, prompt_tokens: int, completion_tokens: int
+    ) -> None:
+        task = asyncio.create_task(
+            self.record(run_id, model, prompt_tokens, completion_tokens)
+        )
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+
+class RunUsage:
+    """The usage meter bound to the calls of one run to one model"""
+
+    def __init__(self, meter: UsageMeter, run_id: str, model: str):
+        self.meter = meter
+        self.run_id = run_id
+        self.model = model
+
+    def count(self, text: str) -> int:
+        return self.meter.count(text)
+
+    async def record(self, prompt_tokens: int, completion_tokens: int) -> None:
+        await self.meter.record(
+            self.run_id, self.model, prompt_tokens, completion_tokens
+        )
+
+    def record_in_background(self, prompt_tokens: int, completion_tokens: int) -> None:
+        """For calls that are being cancelled and can't await anymore"""
+        self.meter.record_in_background(
+            self.run_id, self.model, prompt_tokens, completion_tokens
+        )
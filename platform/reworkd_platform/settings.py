@@ -57,6 +57,44 @@ class Settings(BaseSettings):
     openai_api_version: str = "2023-08-01-preview"
     azure_openai_deployment_name: str = "<Should be updated via env if using azure>"
 
+    # Client side limits for the platform key / each Azure deployment
+    openai_rpm_limit: Optional[int] = None  # Requests per minute
+    openai_tpm_limit: Optional[int] = None  # Tokens per minute
+    openai_rate_limit_max_wait: float = 30.0  # Seconds to queue before failing
+
+    # Connection pool shared by all LLM clients (per API base)
+    llm_pool_size: int = 100
+    llm_pool_keepalive_timeout: float = 30.0  # Seconds to keep idle connections
+
+    # Completion cache for repeated prompts
+    completion_cache_enabled: bool = False
+    completion_cache_size: int = 1000  # Max entries kept in memory
+    completion_cache_ttl: int = 60 * 60  # Seconds
+    completion_cache_max_temperature: float = 0.5  # Only reuse at or below this
+    completion_cache_path: Optional[str] = None  # Enables the on-disk backend
+    single_flight_enabled: bool = True  # Share identical in-flight calls
+    upstream_failure_threshold: float = 0.5  # Error rate that opens the circuit
+    upstream_open_seconds: float = 30.0  # Time before a half open probe
+    upstream_hedging_enabled: bool = False
+    upstream_hedge_min_delay: float = 1.0  # Never hedge sooner than this (seconds)
+    # Alternate OpenAI / Azure bases accepting the platform key, tried in order
+    upstream_fallback_bases: List[str] = []
+    fast_path_enabled: bool = True  # Pick obvious tools without calling the LLM
+    fast_path_min_confidence: float = 0.9
+    fast_path_rules: Optional[List[str]] = None  # Rule names to run, None for all
+    run_max_concurrent_tasks: int = 5  # Tasks of one server driven run in parallel
+    user_max_concurrent_tasks: int = 10  # Across all runs of a user
+    task_similarity_threshold: float = 0.75  # New tasks this similar are duplicates
+    task_index_cache_size: int = 1000  # Runs whose task index is kept between steps
+    chat_context_max_tokens: int = 3000  # Prompt budget for results in /chat
+    chat_min_completion_tokens: int = 500  # Always left over for the answer
+    chat_context_recency_weight: float = 0.3  # Recency vs relevance to the message
+    token_count_cache_enabled: bool = False  # Memoize token counts of repeated texts
+    token_count_cache_size: int = 10_000
+    idempotency_enabled: bool = True  # Replay retries sent with an Idempotency-Key
+    idempotency_ttl: int = 10 * 60  # Seconds a completed response is replayed for
+    idempotency_max_entries: int = 1000
+
     # Helicone
     helicone_api_base: str = "https://oai.hconeai.com/v1"
     helicone_api_key: Optional[str] = None
@@ -92,6 +130,13 @@ class Settings(BaseSettings):
     kafka_password: Optional[str] = None
     kafka_ssal_mechanism: SASL_MECHANISM = "PLAIN"
 
+    # Agent steps executed by `python -m reworkd_platform.worker` through Kafka
+    step_workers_enabled: bool = False
+    kafka_steps_topic: str = "agent-steps"
+    kafka_step_results_topic: str = "agent-step-results"
+    step_worker_concurrency: int = 10  # Steps a worker process runs at once
+    step_timeout: float = 120.0  # Seconds to wait for the next event of a step
+
     # Websocket settings
     pusher_app_id: Optional[str] = None
     pusher_key: Optional[str] = None
@@ -101,6 +146,8 @@ class Settings(BaseSettings):
     # Application Settings
     ff_mock_mode_enabled: bool = False  # Controls whether calls are mocked
     max_loops: int = 25  # Maximum number of loops to run
+    run_max_tokens: Optional[int] = None  # Token budget of a run, None for no limit
+    run_max_cost: Optional[float] = None  # Cost budget of a run in USD
 
     # Settings for sid
     sid_client_id: Optional[str] = None
@@ -130,6 +177,10 @@ class Settings(BaseSettings):
             path=f"/{self.db_base}",
         )
 
+    @property
+    def step_queue_enabled(self) -> bool:
+        return self.step_workers_enabled and bool(self.kafka_bootstrap_servers)
+
     @property
     def pusher_enabled(self) -> bool:
         return all(
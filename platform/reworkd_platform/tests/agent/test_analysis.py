@@ -1,7 +1,22 @@
+import json
+from typing import List
+
 import pytest
 from pydantic import ValidationError
 
+from reworkd_platform.schemas.agent import ModelSettings
+from reworkd_platform.web.api.agent.agent_service.open_ai_agent_service import (
+    OpenAIAgentService,
+    parse_batch_analysis,
+)
 from reworkd_platform.web.api.agent.analysis import Analysis
+from reworkd_platform.web.api.agent.fast_path import FastPathRouter
+from reworkd_platform.web.api.agent.task_index import TaskIndex
+from reworkd_platform.web.api.agent.tools.image import Image
+from reworkd_platform.web.api.agent.tools.open_ai_function import (
+    get_batch_analysis_function,
+)
+from reworkd_platform.web.api.agent.tools.search import Search
 from reworkd_platform.web.api.agent.tools.tools import get_default_tool, get_tool_name
 
 
@@ -29,3 +44,183 @@ def test_analysis_model_search_non_empty_arg() -> None:
 def test_analysis_model_invalid_tool() -> None:
     with pytest.raises(ValidationError):
         Analysis(action="invalid tool name", arg="test argument", reasoning="reasoning")
+
+
+def test_parse_batch_analysis() -> None:
+    completion = json.dumps(
+        {
+            "analyses": [
+                {"task": 2, "action": "image", "arg": "a logo", "reasoning": "r"},
+                {"task": 1, "action": "search", "arg": "bagels", "reasoning": "r"},
+            ]
+        }
+    )
+
+    analyses = parse_batch_analysis(completion, 2, [Search, Image])
+
+    assert [a.action if a else None for a in analyses] == ["search", "image"]
+    assert analyses[1] is not None and analyses[1].arg == "a logo"
+
+
+def test_parse_batch_analysis_leaves_invalid_entries_empty() -> None:
+    completion = json.dumps(
+        {
+            "analyses": [
+                {"task": 1, "action": "search", "arg": "", "reasoning": "r"},
+                {"task": 2, "action": "code", "arg": "x", "reasoning": "r"},
+                {"task": 3, "action": "not a tool", "arg": "x", "reasoning": "r"},
+                {"task": 4, "action": "search"},
+                {"task": 9, "action": "search", "arg": "x", "reasoning": "r"},
+            ]
+        }
+    )
+
+    assert parse_batch_analysis(completion, 4, [Search]) == [None] * 4
+
+
+@pytest.mark.parametrize("completion", ["", "not json", "[]", '{"analyses": 1}'])
+def test_parse_batch_analysis_malformed(completion: str) -> None:
+    assert parse_batch_analysis(completion, 2, [Search]) == [None, None]
+
+
+def test_batch_analysis_function() -> None:
+    function = get_batch_analysis_function([Search, Image])
+    items = function["parameters"]["properties"]["analyses"]["items"]  # type: ignore
+
+    assert function["name"] == "analyze_tasks"
+    assert items["properties"]["action"]["enum"] == ["search", "image"]
+    assert set(items["required"]) == {"task", "action", "reasoning", "arg"}
+
+
+@pytest.mark.asyncio
+async def test_analyze_tasks_agent_combines_fast_path_and_llm(mocker) -> None:
+    call = mocker.patch(
+        "reworkd_platform.web.api.agent.agent_service.open_ai_agent_service"
+        ".call_function_with_handling",
+        return_value={
+            "arguments": json.dumps(
+                {
+                    "analyses": [
+                        {"task": 1, "action": "search", "arg": "a", "reasoning": "r"}
+                    ]
+                }
+            )
+        },
+    )
+    service = OpenAIAgentService(
+        model=mocker.Mock(),
+        settings=ModelSettings(),
+        token_service=mocker.Mock(),
+        callbacks=None,
+        user=mocker.Mock(),
+        oauth_crud=mocker.Mock(),
+        fast_path=FastPathRouter(),
+    )
+
+    analyses = await service.analyze_tasks_agent(
+        goal="goal",
+        tasks=["Research bagels", "Draw a picture of a bagel", "Research cream cheese"],
+        tool_names=["image"],
+    )
+
+    assert [a.action for a in analyses] == ["search", "image", "search"]
+    assert analyses[0].arg == "a"
+    assert analyses[2] == Analysis.get_default_analysis("Research cream cheese")
+    assert call.call_count == 1
+
+
+def create_service(mocker, function_call) -> OpenAIAgentService:
+    mocker.patch(
+        "reworkd_platform.web.api.agent.agent_service.open_ai_agent_service"
+        ".call_function_with_handling",
+        return_value={"arguments": json.dumps(function_call)},
+    )
+    return OpenAIAgentService(
+        model=mocker.Mock(),
+        settings=ModelSettings(),
+        token_service=mocker.Mock(),
+        callbacks=None,
+        user=mocker.Mock(),
+        oauth_crud=mocker.Mock(),
+        fast_path=FastPathRouter(),
+    )
+
+
+async def create_and_analyze(service: OpenAIAgentService, completed_tasks=None):
+    return await service.create_and_analyze_task_agent(
+        goal="goal",
+        tasks=["Existing task"],
+        last_task="Last task",
+        result="result",
+        completed_tasks=completed_tasks or [],
+        tool_names=["image"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_and_analyze_returns_task_with_analysis(mocker) -> None:
+    service = create_service(
+        mocker,
+        {
+            "task": "Task 1: Draw a logo",
+            "action": "image",
+            "arg": "a logo",
+            "reasoning": "r",
+        },
+    )
+
+    [(task, analysis)] = await create_and_analyze(service)
+
+    assert task == "Draw a logo"
+    assert analysis == Analysis(action="image", arg="a logo", reasoning="r")
+
+
+@pytest.mark.parametrize(
+    "task, completed_tasks",
+    [
+        ("Existing task", []),
+        ("Done before", ["Done before"]),
+        ("", []),
+        ("No new tasks needed", []),
+    ],
+)
+@pytest.mark.asyncio
+async def test_create_and_analyze_dedups_tasks(
+    mocker, task: str, completed_tasks: List[str]
+) -> None:
+    service = create_service(
+        mocker, {"task": task, "action": "search", "arg": "x", "reasoning": "r"}
+    )
+    assert await create_and_analyze(service, completed_tasks) == []
+
+
+@pytest.mark.asyncio
+async def test_create_and_analyze_falls_back_on_invalid_analysis(mocker) -> None:
+    service = create_service(
+        mocker,
+        {"task": "Research bagels", "action": "code", "arg": "x", "reasoning": "r"},
+    )
+
+    [(task, analysis)] = await create_and_analyze(service)
+
+    assert analysis == Analysis.get_default_analysis("Research bagels")
+
+
+@pytest.mark.asyncio
+async def test_create_and_analyze_extends_the_run_index(mocker) -> None:
+    service = create_service(
+        mocker,
+        {
+            "task": "Research bagel shops",
+            "action": "search",
+            "arg": "a",
+            "reasoning": "",
+        },
+    )
+    service.task_index = TaskIndex(["Research bagel shops"])
+
+    assert await create_and_analyze(service, ["Done task"]) == []
+    assert len(service.task_index) == 3
+
+    await create_and_analyze(service, ["Done task"])
+    assert len(service.task_index) == 3
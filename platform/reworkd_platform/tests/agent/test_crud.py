@@ -5,8 +5,14 @@ from fastapi import HTTPException
 from pytest_mock import MockerFixture
 
 from reworkd_platform.db.crud.agent import AgentCRUD
+from reworkd_platform.db.models.agent import AgentRun, AgentRunTask
+from reworkd_platform.schemas.user import UserBase
 from reworkd_platform.settings import settings
-from reworkd_platform.web.api.errors import MaxLoopsError, MultipleSummaryError
+from reworkd_platform.web.api.errors import (
+    MaxLoopsError,
+    MultipleSummaryError,
+    RunBudgetError,
+)
 
 
 @pytest.mark.asyncio
@@ -50,8 +56,59 @@ async def test_validate_task_count_multiple_summary_error(
         await agent_crud.validate_task_count("test", "summarize")
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "budget, usage",
+    [
+        ({"run_max_tokens": 1000}, (600, 400, 0.0)),
+        ({"run_max_cost": 0.5}, (10, 10, 0.5)),
+    ],
+)
+async def test_validate_task_count_budget_error(
+    mocker: MockerFixture, budget: dict, usage: tuple
+) -> None:
+    for name, value in budget.items():
+        mocker.patch.object(settings, name, value)
+    mock_agent_run_exists(mocker, True)
+    session = mock_session_with_run_count(mocker, 0)
+    session.execute.return_value.one_or_none.return_value = usage
+    agent_crud: AgentCRUD = AgentCRUD(session, mocker.MagicMock())
+
+    with pytest.raises(RunBudgetError):
+        await agent_crud.validate_task_count("test", "execute")
+
+
+@pytest.mark.asyncio
+async def test_validate_task_count_within_budget(mocker: MockerFixture) -> None:
+    mocker.patch.object(settings, "run_max_tokens", 1000)
+    mocker.patch.object(settings, "run_max_cost", 0.5)
+    mock_agent_run_exists(mocker, True)
+    session = mock_session_with_run_count(mocker, 0)
+    session.execute.return_value.one_or_none.return_value = (600, 300, 0.2)
+    agent_crud: AgentCRUD = AgentCRUD(session, mocker.MagicMock())
+
+    await agent_crud.validate_task_count("test", "execute")
+
+
+@pytest.mark.asyncio
+async def test_get_user_usage_without_runs(mocker: MockerFixture) -> None:
+    session = mocker.AsyncMock()
+    session.execute.return_value = mocker.MagicMock()
+    session.execute.return_value.one.return_value = (None, None, None)
+    agent_crud = AgentCRUD(session, mocker.MagicMock())
+
+    usage = await agent_crud.get_user_usage()
+
+    assert usage.total_tokens == 0
+    assert usage.cost == 0
+
+
 def mock_agent_run_exists(mocker: MockerFixture, exists: bool) -> None:
-    mocker.patch("reworkd_platform.db.models.agent.AgentRun.get", return_value=exists)
+    mocker.patch.object(
+        AgentCRUD,
+        "get_run",
+        side_effect=None if exists else HTTPException(404, "Run not found"),
+    )
 
 
 def mock_session_with_run_count(mocker: MockerFixture, run_count: int) -> AsyncMock:
@@ -61,3 +118,63 @@ def mock_session_with_run_count(mocker: MockerFixture, run_count: int) -> AsyncM
     session.execute.return_value = scalar_mock
     scalar_mock.scalar_one.return_value = run_count
     return session
+
+
+@pytest.mark.asyncio
+async def test_get_run_state(mocker: MockerFixture) -> None:
+    session = mocker.AsyncMock()
+    session.execute.return_value = mocker.MagicMock()
+    session.execute.return_value.scalar_one_or_none.return_value = AgentRun()
+    session.execute.return_value.scalars.return_value.all.return_value = [
+        AgentRunTask(run_id="run", task="Pending", completed=False, sort=1),
+        AgentRunTask(run_id="run", task="First", result="1", completed=True, sort=2),
+        AgentRunTask(run_id="run", task="Second", result="2", completed=True, sort=3),
+    ]
+    agent_crud = AgentCRUD(session, mocker.MagicMock())
+
+    state = await agent_crud.get_run_state("run")
+
+    assert state.tasks == ["Pending"]
+    assert state.completed_tasks == ["First", "Second"]
+    assert state.results == ["1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_complete_run_task_moves_task_to_the_end(mocker: MockerFixture) -> None:
+    run_task = AgentRunTask(run_id="run", task="Task", completed=False, sort=0)
+    session = mocker.AsyncMock()
+    session.add = mocker.MagicMock()
+    session.execute.return_value = result = mocker.MagicMock()
+    result.scalar_one_or_none.side_effect = [AgentRun(), 4, run_task]
+    agent_crud = AgentCRUD(session, mocker.MagicMock())
+
+    await agent_crud.complete_run_task("run", "Task", "result")
+
+    assert run_task.completed
+    assert run_task.result == "result"
+    assert run_task.sort == 5
+    session.add.assert_called_once_with(run_task)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("run_id", [None, "", "someone_elses_run"])
+async def test_get_run_not_owned(mocker: MockerFixture, run_id) -> None:
+    session = mocker.AsyncMock()
+    session.execute.return_value = mocker.MagicMock()
+    session.execute.return_value.scalar_one_or_none.return_value = None
+    agent_crud = AgentCRUD(session, mocker.MagicMock())
+
+    with pytest.raises(HTTPException) as e:
+        await agent_crud.get_run_state(run_id)
+
+    assert e.value.status_code == 404
+    session.execute.return_value.scalars.assert_not_called()
+
+
+def test_run_tasks_are_scoped_to_the_user(mocker: MockerFixture) -> None:
+    agent_crud = AgentCRUD(mocker.AsyncMock(), UserBase(id="user_id"))
+
+    query = str(agent_crud._run_tasks("run"))
+
+    assert "JOIN agent_run ON agent_run.id = agent_run_task.run_id" in query
+    assert "agent_run.user_id = :user_id_1" in query
@@ -0,0 +1,149 @@
+import json
+from typing import Optional
+
+import pytest
+
+from reworkd_platform.web.api.agent.fast_path import (
+    ArithmeticRule,
+    FastPathRouter,
+    ImageRequestRule,
+    NotionUrlRule,
+)
+from reworkd_platform.web.api.agent.tools.calculator import Calculator
+from reworkd_platform.web.api.agent.tools.image import Image
+from reworkd_platform.web.api.agent.tools.notion import Notion
+from reworkd_platform.web.api.agent.tools.search import Search
+
+ALL_TOOLS = [Search, Calculator, Image, Notion]
+
+
+@pytest.mark.parametrize(
+    "task, database_id",
+    [
+        (
+            "Read https://www.notion.so/acme/"
+            "Roadmap-0123456789abcdef0123456789abcdef?v=1",
+            "0123456789abcdef0123456789abcdef",
+        ),
+        (
+            "Summarise notion.so entries at https://notion.so/abc123?v=5678.",
+            "abc123",
+        ),
+    ],
+)
+def test_notion_url_rule(task: str, database_id: str) -> None:
+    match = NotionUrlRule().match("goal", task)
+
+    assert match is not None
+    assert match.analysis.action == "notion"
+    assert json.loads(match.analysis.arg) == {
+        "action": "read_database",
+        "params": {"database_id": database_id},
+    }
+
+
+@pytest.mark.parametrize(
+    "task",
+    [
+        "Add a new entry titled Milk to https://notion.so/acme/abc123",
+        "Create a page in https://www.notion.so/acme/Roadmap-0123456789abcdef",
+        "List the databases shared in https://notion.so/acme",
+    ],
+)
+def test_notion_url_rule_ignores_writes(task: str) -> None:
+    assert NotionUrlRule().match("goal", task) is None
+
+
+@pytest.mark.parametrize(
+    "task, expression",
+    [
+        ("2 + 2", "2 + 2"),
+        ("Calculate (3.5 * 4) / 2", "(3.5 * 4) / 2"),
+        ("What is 2^10?", "2^10"),
+        ("sqrt(16) + log(100)", "sqrt(16) + log(100)"),
+        ("1,000 + 2", "1000 + 2"),
+        ("max(1, 2) * 1,250,000", "max(1, 2) * 1250000"),
+    ],
+)
+def test_arithmetic_rule_matches(task: str, expression: str) -> None:
+    match = ArithmeticRule().match("goal", task)
+
+    assert match is not None
+    assert match.analysis.action == "calculator"
+    assert match.analysis.arg == expression
+
+
+@pytest.mark.parametrize(
+    "task",
+    [
+        "Research the 2023 revenue of Apple",
+        "Calculate the market size of bagels in NYC",
+        "2023",
+        "e",
+        "1, 2 + 3",
+    ],
+)
+def test_arithmetic_rule_ignores_non_expressions(task: str) -> None:
+    assert ArithmeticRule().match("goal", task) is None
+
+
+@pytest.mark.parametrize(
+    "task, confidence",
+    [
+        ("Draw a cat wearing a hat", 0.8),
+        ("Generate an image of a bagel shop logo", 0.9),
+        ("Create a picture of the moon", 0.9),
+        ("Design a logo for a bagel shop", 0.9),
+        ("Research how to draw cats", None),
+        ("Create a marketing plan", None),
+        ("Make a list of image formats", None),
+        ("Draw conclusions from the collected data", None),
+        ("Draw up a project plan", None),
+        ("Sketch out a marketing strategy", None),
+        ("Illustrate the key differences between React and Vue", None),
+        ("Paint a picture of the competitive landscape", None),
+        ("Draw a comparison between the two frameworks", None),
+    ],
+)
+def test_image_request_rule(task: str, confidence: Optional[float]) -> None:
+    match = ImageRequestRule().match("goal", task)
+
+    if confidence is None:
+        assert match is None
+    else:
+        assert match is not None and match.confidence == confidence
+
+
+def test_router_short_circuits_and_counts() -> None:
+    router = FastPathRouter()
+
+    analysis = router.route("goal", "2 + 2", ALL_TOOLS)
+    assert analysis is not None and analysis.action == "calculator"
+    assert router.route("goal", "Research bagels", ALL_TOOLS) is None
+
+    stats = router.stats()
+    assert stats.evaluated == 2
+    assert stats.short_circuited == {
+        "notion_url": 0,
+        "arithmetic": 1,
+        "image_request": 0,
+    }
+
+
+def test_router_only_uses_available_tools() -> None:
+    router = FastPathRouter()
+    assert router.route("goal", "2 + 2", [Search]) is None
+
+
+def test_router_respects_min_confidence() -> None:
+    router = FastPathRouter(min_confidence=0.99)
+
+    assert router.route("goal", "2 + 2", ALL_TOOLS) is None
+    assert router.route("goal", "https://notion.so/abc?v=1", ALL_TOOLS) is not None
+
+
+def test_router_from_names() -> None:
+    router = FastPathRouter.from_names(["image_request"], min_confidence=0.9)
+
+    assert [rule.name for rule in router.rules] == ["image_request"]
+    assert router.route("goal", "2 + 2", ALL_TOOLS) is None
@@ -136,3 +136,20 @@ def test_custom_model_settings(model_settings: ModelSettings, streaming: bool):
     assert model.model_name.startswith(model_settings.model)
     assert model.max_tokens == model_settings.max_tokens
     assert model.streaming == streaming
+
+
+@pytest.mark.parametrize(
+    "custom_api_key, expected",
+    [(None, True), ("custom_key", False)],
+)
+def test_rate_limiter_only_applies_to_platform_key(mocker, custom_api_key, expected):
+    rate_limiter = mocker.Mock()
+
+    model = create_model(
+        Settings(),
+        ModelSettings(custom_api_key=custom_api_key),
+        UserBase(id="user_id"),
+        rate_limiter=rate_limiter,
+    )
+
+    assert (model.rate_limiter is rate_limiter) == expected
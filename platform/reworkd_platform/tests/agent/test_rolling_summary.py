@@ -0,0 +1,139 @@
+import pytest
+
+from reworkd_platform.schemas.agent import ModelSettings, RunSummary
+from reworkd_platform.schemas.user import UserBase
+from reworkd_platform.services.tokenizer.token_service import TokenService
+from reworkd_platform.settings import Settings
+from reworkd_platform.web.api.agent.agent_service.open_ai_agent_service import (
+    SUMMARY_CHUNK_TOKENS,
+    SUMMARY_MAX_TOKENS,
+    OpenAIAgentService,
+)
+from reworkd_platform.web.api.agent.model_factory import create_model
+from reworkd_platform.web.api.agent.rolling_summary import (
+    fold_results,
+    summary_inputs,
+    update_run_summary,
+)
+
+
+def create_service(mocker):
+    service = mocker.AsyncMock()
+    service.fold_summary_agent.side_effect = lambda summary, results, **_: "\n".join(
+        [summary, *results]
+    ).strip()
+    return service
+
+
+@pytest.mark.asyncio
+async def test_fold_results_only_folds_the_tail(mocker) -> None:
+    service = create_service(mocker)
+    summary = RunSummary(summary="a\nb", checkpoint=2)
+
+    folded = await fold_results(service, "goal", summary, ["a", "b", "c"])
+
+    assert folded == RunSummary(summary="a\nb\nc", checkpoint=3)
+    service.fold_summary_agent.assert_called_once_with(
+        goal="goal", summary="a\nb", results=["c"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_fold_results_without_new_results(mocker) -> None:
+    service = create_service(mocker)
+    summary = RunSummary(summary="a", checkpoint=1)
+
+    assert await fold_results(service, "goal", summary, ["a"]) is summary
+    service.fold_summary_agent.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_update_run_summary_saves_the_checkpoint(mocker) -> None:
+    service = create_service(mocker)
+    crud = mocker.AsyncMock()
+    crud.get_run_state.return_value.results = ["a", "b"]
+    crud.get_run_summary.return_value = RunSummary(summary="a", checkpoint=1)
+
+    summary = await update_run_summary(service, crud, "run", "goal")
+
+    assert summary == RunSummary(summary="a\nb", checkpoint=2)
+    crud.save_run_summary.assert_called_once_with("run", summary)
+
+
+@pytest.mark.asyncio
+async def test_update_run_summary_restarts_on_foreign_results(mocker) -> None:
+    service = create_service(mocker)
+    crud = mocker.AsyncMock()
+    crud.get_run_summary.return_value = RunSummary(summary="old", checkpoint=5)
+
+    summary = await update_run_summary(service, crud, "run", "goal", ["x"])
+
+    assert summary == RunSummary(summary="x", checkpoint=1)
+
+
+@pytest.mark.asyncio
+async def test_update_run_summary_waits_for_enough_results(mocker) -> None:
+    service = create_service(mocker)
+    crud = mocker.AsyncMock()
+    crud.get_run_summary.return_value = RunSummary(summary="a", checkpoint=1)
+
+    summary = await update_run_summary(
+        service, crud, "run", "goal", ["a", "b"], min_results=2
+    )
+
+    assert summary == RunSummary(summary="a", checkpoint=1)
+    service.fold_summary_agent.assert_not_called()
+    crud.save_run_summary.assert_not_called()
+
+
+def test_summary_inputs_add_the_unfolded_tail() -> None:
+    summary = RunSummary(summary="a and b", checkpoint=2)
+
+    assert summary_inputs(summary, ["a", "b", "c"]) == ["a and b", "c"]
+    assert summary_inputs(RunSummary(), ["a"]) == ["a"]
+
+
+def test_summary_chunks_respect_the_token_budget(mocker) -> None:
+    token_service = TokenService.create()
+    service = OpenAIAgentService(
+        mocker.MagicMock(),
+        ModelSettings(),
+        token_service,
+        callbacks=None,
+        user=mocker.MagicMock(),
+        oauth_crud=mocker.MagicMock(),
+    )
+    big = "word " * (SUMMARY_CHUNK_TOKENS * 2)
+
+    chunks = service._summary_chunks(["small", big, "a", "b"])
+
+    assert len(chunks) == 3
+    assert chunks[0] == "small"
+    assert token_service.count(chunks[1]) == SUMMARY_CHUNK_TOKENS
+    assert chunks[2] == "a\n\nb"
+
+
+@pytest.mark.asyncio
+async def test_fold_summary_agent_keeps_the_model_max_tokens(mocker) -> None:
+    call = mocker.patch(
+        "reworkd_platform.web.api.agent.agent_service.open_ai_agent_service"
+        ".call_model_with_handling",
+        return_value="folded",
+    )
+    model = create_model(
+        Settings(), ModelSettings(max_tokens=2000), UserBase(id="user_id")
+    )
+    service = OpenAIAgentService(
+        model,
+        ModelSettings(),
+        TokenService.create(),
+        callbacks=None,
+        user=mocker.MagicMock(),
+        oauth_crud=mocker.MagicMock(),
+    )
+
+    summary = await service.fold_summary_agent(goal="goal", summary="", results=["a"])
+
+    assert summary == "folded"
+    assert model.max_tokens == 2000
+    assert call.call_args.args[0].max_tokens <= SUMMARY_MAX_TOKENS
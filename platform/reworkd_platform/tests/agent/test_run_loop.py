@@ -0,0 +1,287 @@
+import asyncio
+import json
+from typing import List, Tuple
+
+import pytest
+
+from reworkd_platform.schemas import ModelSettings, UserBase
+from reworkd_platform.schemas.agent import AgentRunLoop
+from reworkd_platform.services.scheduler.scheduler import RunScheduler
+from reworkd_platform.settings import Settings
+from reworkd_platform.web.api.agent.agent_service.open_ai_agent_service import (
+    OpenAIAgentService,
+)
+from reworkd_platform.web.api.agent.analysis import Analysis
+from reworkd_platform.web.api.agent.model_factory import create_model
+from reworkd_platform.web.api.agent.run_loop import RunEvent, RunLoop
+from reworkd_platform.web.api.agent.stream_mock import stream_string
+from reworkd_platform.web.api.errors import MaxLoopsError, OpenAIError
+
+ANALYSIS = Analysis(action="search", arg="arg", reasoning="reasoning")
+
+
+def create_service(mocker, created: List[List[str]]):
+    service = mocker.AsyncMock()
+    service.copy = mocker.Mock(return_value=service)
+    service.start_goal_agent.return_value = ["Task 1", "Task 2"]
+    service.analyze_task_agent.return_value = ANALYSIS
+    service.execute_task_agent.side_effect = lambda task, **_: stream_string(
+        f"Result of {task}"
+    )
+    service.create_tasks_agent.side_effect = created
+    service.create_and_analyze_task_agent.side_effect = [
+        [(task, ANALYSIS) for task in tasks] for tasks in created
+    ]
+    service.summarize_task_agent.return_value = stream_string("Summary")
+    service.fold_summary_agent.side_effect = lambda summary, results, **_: "\n".join(
+        [summary, *results]
+    ).strip()
+    return service
+
+
+async def run(loop: RunLoop) -> List[Tuple[str, dict]]:
+    return [
+        (event.type, json.loads(event.json(exclude_none=True)))
+        async for event in loop.events()
+    ]
+
+
+def create_loop(mocker, service, fused: bool = False) -> RunLoop:
+    crud = mocker.AsyncMock()
+    return RunLoop(
+        AgentRunLoop(goal="goal", run_id="run_id", fused=fused), service, crud
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_loop_emits_typed_events(mocker) -> None:
+    service = create_service(mocker, [["Task 3"], [], []])
+    loop = create_loop(mocker, service)
+
+    events = await run(loop)
+    types = [type_ for type_, _ in events]
+
+    assert types[:3] == ["run", "task", "task"]
+    assert types[-2:] == ["summary", "done"]
+    assert types.count("analysis") == 3
+    assert types.count("task_done") == 3
+    assert (
+        "output",
+        {
+            "type": "output",
+            "run_id": "run_id",
+            "task_id": "1",
+            "task": "Task 1",
+            "text": "Result of Task 1",
+        },
+    ) in events
+    assert loop.completed_tasks == ["Task 1", "Task 2", "Task 3"]
+    assert loop.results == ["Result of Task 1", "Result of Task 2", "Result of Task 3"]
+
+    steps = [call.args[1] for call in loop.crud.create_task.call_args_list]
+    assert steps.count("analyze") == 3
+    assert steps.count("execute") == 3
+    assert steps.count("create") == 3
+    assert steps.count("summarize") == 1
+
+
+@pytest.mark.asyncio
+async def test_run_loop_stops_at_max_loops_and_summarizes(mocker) -> None:
+    service = create_service(mocker, [["Task 3"]])
+    loop = create_loop(mocker, service)
+
+    async def create_task(run_id: str, type_: str) -> None:
+        if type_ == "execute" and loop.results:
+            raise MaxLoopsError(StopIteration(), "Max loops exceeded", 429)
+
+    loop.crud.create_task.side_effect = create_task
+
+    events = await run(loop)
+
+    assert (
+        "error",
+        {"type": "error", "run_id": "run_id", "text": "Max loops exceeded"},
+    ) in events
+    assert [type_ for type_, _ in events][-2:] == ["summary", "done"]
+    assert loop.results == ["Result of Task 1"]
+
+
+@pytest.mark.asyncio
+async def test_failed_task_does_not_abort_the_run(mocker) -> None:
+    service = create_service(mocker, [[]])
+
+    def execute(task: str, **_):
+        if task == "Task 1":
+            raise OpenAIError(Exception(), "Upstream failed", 500)
+        return stream_string(f"Result of {task}")
+
+    service.execute_task_agent.side_effect = execute
+    loop = create_loop(mocker, service)
+
+    events = await run(loop)
+
+    assert (
+        "error",
+        {
+            "type": "error",
+            "run_id": "run_id",
+            "task_id": "1",
+            "task": "Task 1",
+            "text": "Upstream failed",
+        },
+    ) in events
+    assert loop.results == ["Result of Task 2"]
+    assert [type_ for type_, _ in events][-2:] == ["summary", "done"]
+
+
+@pytest.mark.asyncio
+async def test_run_loop_summarizes_the_rolling_summary(mocker) -> None:
+    mocker.patch("reworkd_platform.web.api.agent.run_loop.MIN_FOLD_RESULTS", 2)
+    service = create_service(mocker, [["Task 3"], [], []])
+    loop = create_loop(mocker, service)
+
+    await run(loop)
+
+    assert loop.summary.checkpoint == 2
+    service.fold_summary_agent.assert_called_once_with(
+        goal="goal", summary="", results=["Result of Task 1", "Result of Task 2"]
+    )
+    loop.crud.save_run_summary.assert_called_with("run_id", loop.summary)
+
+    # The summary and the tail it doesn't cover are summarized in one call
+    service.summarize_task_agent.assert_called_once_with(
+        goal="goal", results=[loop.summary.summary, "Result of Task 3"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_short_runs_are_summarized_without_folding(mocker) -> None:
+    service = create_service(mocker, [["Task 3"], [], []])
+    loop = create_loop(mocker, service)
+
+    await run(loop)
+
+    service.fold_summary_agent.assert_not_called()
+    service.summarize_task_agent.assert_called_once_with(
+        goal="goal", results=loop.results
+    )
+
+
+@pytest.mark.asyncio
+async def test_fused_run_skips_separate_analysis(mocker) -> None:
+    service = create_service(mocker, [["Task 3"], [], []])
+    loop = create_loop(mocker, service, fused=True)
+
+    await run(loop)
+
+    # Only the initial tasks need their own analysis
+    assert service.analyze_task_agent.call_count == 2
+    assert service.create_and_analyze_task_agent.call_count == 3
+    assert service.create_tasks_agent.call_count == 0
+
+
+def test_run_event_sse() -> None:
+    event = RunEvent(type="task", run_id="run_id", task="Task 1")
+    assert event.sse() == (
+        b'event: task\ndata: {"type": "task", "run_id": "run_id", "task": "Task 1"}\n\n'
+    )
+
+
+@pytest.mark.asyncio
+async def test_initial_tasks_run_concurrently(mocker) -> None:
+    service = create_service(mocker, [[], []])
+    release = asyncio.Event()
+    started = []
+
+    async def execute(task: str, **_):
+        started.append(task)
+        if len(started) == 2:
+            release.set()
+        await release.wait()  # Deadlocks unless both tasks run at once
+        return stream_string(f"Result of {task}")
+
+    service.execute_task_agent.side_effect = execute
+    crud = mocker.AsyncMock()
+    loop = RunLoop(
+        AgentRunLoop(goal="goal", run_id="run_id"),
+        service,
+        crud,
+        RunScheduler(max_concurrency=2),
+    )
+
+    events = await asyncio.wait_for(run(loop), timeout=1)
+
+    outputs = [event["task_id"] for type_, event in events if type_ == "output"]
+    assert sorted(outputs) == ["1", "2"]
+    assert sorted(loop.completed_tasks) == ["Task 1", "Task 2"]
+
+
+@pytest.mark.asyncio
+async def test_created_tasks_depend_on_their_parent(mocker) -> None:
+    service = create_service(mocker, [["Task 3"], [], []])
+    loop = create_loop(mocker, service)
+
+    await run(loop)
+
+    assert loop.graph.nodes["3"].depends_on == {"1"}
+    assert loop.graph.nodes["1"].depends_on == set()
+
+
+@pytest.mark.asyncio
+async def test_run_loop_records_run_state(mocker) -> None:
+    service = create_service(mocker, [["Task 3"], [], []])
+    loop = create_loop(mocker, service)
+
+    await run(loop)
+
+    added = [call.args[1] for call in loop.crud.add_run_tasks.call_args_list]
+    assert added == [["Task 1", "Task 2"], ["Task 3"]]
+    loop.crud.complete_run_task.assert_any_call("run_id", "Task 3", "Result of Task 3")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_tasks_get_their_own_service(mocker) -> None:
+    service = create_service(mocker, [[], []])
+    copies = [mocker.AsyncMock(wraps=service) for _ in range(3)]
+    service.copy = mocker.Mock(side_effect=copies)
+    loop = create_loop(mocker, service)
+
+    await run(loop)
+
+    assert service.copy.call_count == 2
+    assert [copy.execute_task_agent.call_count for copy in copies] == [1, 1, 0]
+
+
+def test_openai_agent_service_copy_has_its_own_model(mocker) -> None:
+    model = create_model(
+        Settings(), ModelSettings(max_tokens=500), UserBase(id="user_id")
+    )
+    service = OpenAIAgentService(
+        model=model,
+        settings=ModelSettings(),
+        token_service=mocker.Mock(),
+        callbacks=None,
+        user=mocker.Mock(),
+        oauth_crud=mocker.Mock(),
+    )
+
+    copy = service.copy()
+    copy.model.max_tokens = 100
+
+    assert copy.model is not model
+    assert service.model.max_tokens == 500
+
+
+@pytest.mark.asyncio
+async def test_run_loop_drops_tasks_repeating_the_run(mocker) -> None:
+    service = create_service(mocker, [["Task 2 again"], ["task 1"], []])
+    service.start_goal_agent.return_value = ["Task 1", "Task 2 again"]
+    loop = create_loop(mocker, service)
+
+    await run(loop)
+
+    assert [node.task for node in loop.graph.nodes.values()] == [
+        "Task 1",
+        "Task 2 again",
+    ]
+    assert len(loop.index) == 2
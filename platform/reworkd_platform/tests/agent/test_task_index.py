@@ -0,0 +1,99 @@
+import pytest
+
+from reworkd_platform.web.api.agent.task_index import (
+    TaskIndex,
+    TaskIndexCache,
+    normalize,
+)
+
+
+def test_normalize_ignores_case_order_and_filler() -> None:
+    assert normalize("Search the web for NBA news") == normalize(
+        "search for news on NBA the Web"
+    )
+
+
+@pytest.mark.parametrize(
+    "task",
+    [
+        "Search the web for the latest NBA news",
+        "search for the latest nba news on the web.",
+        "Searching the web for latest NBA news",
+        "Search the web for the latest NBA news today",
+    ],
+)
+def test_near_duplicates_are_found(task: str) -> None:
+    index = TaskIndex(["Search the web for the latest NBA news"], threshold=0.75)
+    assert task in index
+
+
+def test_normalize_keeps_direction() -> None:
+    assert normalize("Find flights from NYC to London") != normalize(
+        "Find flights from London to NYC"
+    )
+    assert normalize("Find flights from NYC to London") == normalize(
+        "find flights to London from NYC"
+    )
+
+
+@pytest.mark.parametrize(
+    "task",
+    [
+        "Write a report about the NBA news",
+        "Search the web for the latest NFL scores",
+        "",
+    ],
+)
+def test_different_tasks_are_not_found(task: str) -> None:
+    index = TaskIndex(["Search the web for the latest NBA news"], threshold=0.75)
+    assert task not in index
+
+
+def test_threshold_of_one_only_matches_normalized_tasks() -> None:
+    index = TaskIndex(["Search the web for the latest NBA news"], threshold=1)
+
+    assert index.find("search the web for latest NBA news") is not None
+    assert index.find("Search the web for the latest NBA news today") is None
+
+
+def test_find_returns_the_original_task() -> None:
+    index = TaskIndex(["Task one", "Research quantum computing breakthroughs"])
+
+    assert index.find("research breakthroughs in quantum computing") == (
+        "Research quantum computing breakthroughs"
+    )
+    assert len(index) == 2
+
+
+def test_lookup_only_compares_candidates(mocker) -> None:
+    tasks = [f"Research topic number {i} in depth" for i in range(500)]
+    index = TaskIndex(tasks, threshold=0.75)
+    jaccard = mocker.patch(
+        "reworkd_platform.web.api.agent.task_index.jaccard", return_value=0
+    )
+
+    index.find("Write a poem about the ocean")
+
+    assert jaccard.call_count < 50
+
+
+def test_update_only_adds_new_tasks(mocker) -> None:
+    index = TaskIndex(["Task one", "Task two"])
+    add = mocker.spy(index, "add")
+
+    index.update(["Task one", "Task two", "Task three"])
+
+    add.assert_called_once_with("Task three")
+    assert len(index) == 3
+
+
+def test_cache_keeps_an_index_per_recent_run() -> None:
+    cache = TaskIndexCache(max_runs=2)
+    first = cache.get("first")
+
+    assert cache.get("first") is first
+    cache.get("second")
+    cache.get("third")
+
+    assert len(cache) == 2
+    assert cache.get("first") is not first
@@ -1,10 +1,11 @@
-from typing import List, Type
+from typing import AsyncIterator, List, Type
 
 import pytest
 from langchain.schema import OutputParserException
 
 from reworkd_platform.web.api.agent.task_output_parser import (
     TaskOutputParser,
+    TaskStreamParser,
     extract_array,
     real_tasks_filter,
     remove_prefix,
@@ -46,6 +47,29 @@ def test_parse_with_completed_tasks() -> None:
     assert result == expected
 
 
+def test_parse_drops_near_duplicates() -> None:
+    input_text = (
+        '["Search the web for NBA news", "Search for NBA news on the web", '
+        '"Summarize the findings", "Write code to build a web scraper"]'
+    )
+    completed = ["write the code to build a web scraper"]
+
+    parser = TaskOutputParser(completed_tasks=completed)
+
+    assert parser.parse(input_text) == [
+        "Search the web for NBA news",
+        "Summarize the findings",
+    ]
+
+
+def test_parse_has_no_side_effects() -> None:
+    input_text = '["Search the web for NBA news", "Summarize the findings"]'
+    parser = TaskOutputParser(completed_tasks=[])
+
+    assert parser.parse(input_text) == parser.parse(input_text)
+    assert parser.index is not None and len(parser.index) == 0
+
+
 @pytest.mark.parametrize(
     "input_text, exception",
     [
@@ -201,3 +225,60 @@ def test_remove_task_prefix(task_input: str, expected_output: str) -> None:
 )
 def test_real_tasks_filter_no_task(input_text: str, expected_result: bool) -> None:
     assert real_tasks_filter(input_text) == expected_result
+
+
+def test_stream_parser_emits_tasks_on_closing_quote() -> None:
+    parser = TaskStreamParser(completed_tasks=[])
+    completion = 'Sure! ["Task 1: Find \\"news\\"", \'Write code\', "Do nothing"]'
+
+    emitted = [parser.feed(char) for char in completion]
+
+    assert [tasks for tasks in emitted if tasks] == [['Find "news"'], ["Write code"]]
+    assert emitted.index(['Find "news"']) == completion.index('",')
+    assert parser.finish() == []
+
+
+def test_stream_parser_ignores_text_after_the_array() -> None:
+    parser = TaskStreamParser(completed_tasks=["Old task"])
+
+    assert parser.feed('["Old task", "New ta') == []
+    assert parser.feed('sk", "New task"] ["Other"]') == ["New task"]
+
+
+@pytest.mark.parametrize(
+    "completion",
+    ['[5] tasks: [ "Search the web", "Write a report"]', '[\n"Search the web",'],
+)
+def test_stream_parser_skips_brackets_before_the_array(completion: str) -> None:
+    parser = TaskStreamParser(completed_tasks=[])
+
+    emitted = [task for char in completion for task in parser.feed(char)]
+
+    assert emitted[0] == "Search the web"
+    assert parser.finish() == []
+
+
+def test_stream_parser_falls_back_after_brackets_without_strings() -> None:
+    parser = TaskStreamParser(completed_tasks=[])
+
+    assert parser.feed("[Note] Tasks:\n1. First task\n2. Second") == []
+    assert parser.finish()[-2:] == ["First task", "Second"]
+
+
+def test_stream_parser_falls_back_to_whole_completion() -> None:
+    parser = TaskStreamParser(completed_tasks=[])
+
+    assert parser.feed("1. First task\n2. Second") == []
+    assert parser.finish() == ["First task", "Second"]
+
+
+@pytest.mark.asyncio
+async def test_stream_parser_parses_streams() -> None:
+    async def chunks() -> AsyncIterator[str]:
+        for chunk in ['["A', ' task", "Another', ' task"]']:
+            yield chunk
+
+    parser = TaskStreamParser(completed_tasks=[])
+    tasks = [task async for task in parser.parse_stream(chunks())]
+
+    assert tasks == ["A task", "Another task"]
@@ -1,5 +1,6 @@
 from typing import List, Type
 
+from reworkd_platform.web.api.agent.tools.calculator import Calculator
 from reworkd_platform.web.api.agent.tools.conclude import Conclude
 from reworkd_platform.web.api.agent.tools.image import Image
 from reworkd_platform.web.api.agent.tools.reason import Reason
@@ -51,6 +52,8 @@ def test_get_default_tool() -> None:
 
 def test_get_tool_from_name() -> None:
     assert get_tool_from_name("Search") == Search
-    assert get_tool_from_name("CoNcLuDe") == Conclude
+    assert get_tool_from_name("CaLcUlAtOr") == Calculator
+    # Conclude is never offered to the model
+    assert get_tool_from_name("Conclude") == Search
     assert get_tool_from_name("NonExistingTool") == Search
     assert get_tool_from_name("SID") == SID
@@ -0,0 +1,228 @@
+import asyncio
+from typing import List
+
+import pytest
+from langchain.schema import HumanMessage
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+from starlette.requests import ClientDisconnect
+
+from reworkd_platform.schemas import ModelSettings, UserBase
+from reworkd_platform.services.cancellation.meter import CancellationMeter
+from reworkd_platform.settings import Settings
+from reworkd_platform.web.api.agent.model_factory import create_model
+from reworkd_platform.web.api.agent.streaming import (
+    StreamingResponse,
+    until_disconnected,
+)
+from reworkd_platform.web.api.errors import ClientDisconnectedError
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class FakeRequest:
+    def __init__(self, disconnect: asyncio.Event):
+        self.disconnect = disconnect
+        self.body_read = False
+
+    async def body(self) -> bytes:
+        self.body_read = True
+        return b"{}"
+
+    async def receive(self) -> dict:
+        await self.disconnect.wait()
+        return {"type": "http.disconnect"}
+
+
+def test_meter_records_saved_tokens() -> None:
+    meter = CancellationMeter(count_words)
+
+    meter.record_completion(100, "three words here")
+    meter.record_completion(2, "more words than allowed")
+    meter.record_request()
+
+    stats = meter.stats()
+    assert stats.cancelled_completions == 2
+    assert stats.cancelled_requests == 1
+    assert stats.saved_tokens == 97
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_cancels_chain_on_disconnect() -> None:
+    disconnect = asyncio.Event()
+    cancelled = asyncio.Event()
+    sent: List[dict] = []
+
+    async def chain_executor(send) -> None:
+        await send({"type": "http.response.body", "body": b"hi", "more_body": True})
+        disconnect.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    response = StreamingResponse(chain_executor)
+    await asyncio.wait_for(
+        response({}, FakeRequest(disconnect).receive, send), timeout=1
+    )
+
+    assert cancelled.is_set()
+    assert [m.get("body") for m in sent[1:]] == [b"hi"]
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_cancels_chain_on_disconnect_before_first_chunk() -> (
+    None
+):
+    disconnect = asyncio.Event()
+    disconnect.set()
+    cancelled = asyncio.Event()
+    sent: List[dict] = []
+
+    async def chain_executor(send) -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        await send({"type": "http.response.body", "body": b"hi", "more_body": True})
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    response = StreamingResponse(chain_executor)
+    await asyncio.wait_for(
+        response({}, FakeRequest(disconnect).receive, send), timeout=1
+    )
+
+    assert cancelled.is_set()
+    assert not [m for m in sent if m.get("body")]
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_stops_listening_when_done() -> None:
+    sent: List[dict] = []
+
+    async def chain_executor(send) -> None:
+        await send({"type": "http.response.body", "body": b"hi", "more_body": True})
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    # The client never disconnects, the response must still return
+    response = StreamingResponse(chain_executor)
+    await asyncio.wait_for(
+        response({}, FakeRequest(asyncio.Event()).receive, send), timeout=1
+    )
+
+    assert sent[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_raises_chain_errors_after_the_body() -> None:
+    sent: List[dict] = []
+
+    async def chain_executor(send) -> None:
+        await send({"type": "http.response.body", "body": b"hi", "more_body": True})
+        raise ValueError("Upstream failed")
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    response = StreamingResponse(chain_executor)
+    with pytest.raises(ValueError):
+        await response({}, FakeRequest(asyncio.Event()).receive, send)
+
+    assert sent[-1] == {
+        "type": "http.response.body",
+        "body": b"Upstream failed",
+        "more_body": False,
+    }
+
+
+@pytest.mark.asyncio
+async def test_until_disconnected_returns_the_result() -> None:
+    async def work() -> str:
+        return "result"
+
+    request = FakeRequest(asyncio.Event())
+    assert await until_disconnected(request, work()) == "result"  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_until_disconnected_reads_the_body_before_listening() -> None:
+    request = FakeRequest(asyncio.Event())
+
+    async def work() -> bool:
+        await asyncio.sleep(0)
+        return request.body_read
+
+    assert await until_disconnected(request, work())  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_until_disconnected_stops_when_disconnected_while_reading() -> None:
+    class DisconnectedRequest(FakeRequest):
+        async def body(self) -> bytes:
+            raise ClientDisconnect()
+
+    with pytest.raises(ClientDisconnectedError):
+        await until_disconnected(
+            DisconnectedRequest(asyncio.Event()), asyncio.sleep(10)  # type: ignore
+        )
+
+
+@pytest.mark.asyncio
+async def test_until_disconnected_cancels_the_work() -> None:
+    disconnect = asyncio.Event()
+    cancelled = asyncio.Event()
+    meter = CancellationMeter(count_words)
+
+    async def work() -> str:
+        disconnect.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "result"
+
+    with pytest.raises(ClientDisconnectedError):
+        await until_disconnected(FakeRequest(disconnect), work(), meter)  # type: ignore
+
+    assert cancelled.is_set()
+    assert meter.stats().cancelled_requests == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_stream_is_metered(mocker) -> None:
+    meter = CancellationMeter(count_words)
+    model = create_model(
+        Settings(),
+        ModelSettings(max_tokens=100),
+        UserBase(id="user_id"),
+        streaming=True,
+        cancellation_meter=meter,
+    )
+
+    async def astream(*args, **kwargs):
+        for word in ["one ", "two "]:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+        await asyncio.sleep(10)
+
+    mocker.patch("langchain.chat_models.openai.ChatOpenAI._astream", astream)
+
+    task = asyncio.create_task(model.agenerate([[HumanMessage(content="Hi")]]))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert meter.stats().cancelled_completions == 1
+    assert meter.stats().saved_tokens == 98
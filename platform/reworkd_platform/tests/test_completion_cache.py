@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from reworkd_platform.services.completion_cache.backends import (
+    DiskCacheBackend,
+    MemoryCacheBackend,
+)
+from reworkd_platform.services.completion_cache.cache import (
+    CompletionCache,
+    completion_key,
+)
+
+
+def test_memory_backend_evicts_least_recently_used() -> None:
+    backend = MemoryCacheBackend(max_size=2, ttl=60)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    assert backend.get("a") == "1"  # "b" is now the least recently used
+
+    backend.set("c", "3")
+
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+    assert backend.get("c") == "3"
+    assert len(backend) == 2
+
+
+def test_memory_backend_expires_entries(mocker) -> None:
+    clock = mocker.patch(
+        "reworkd_platform.services.completion_cache.backends.time.monotonic",
+        return_value=100,
+    )
+    backend = MemoryCacheBackend(max_size=10, ttl=5)
+    backend.set("a", "1")
+
+    clock.return_value = 104
+    assert backend.get("a") == "1"
+
+    clock.return_value = 105
+    assert backend.get("a") is None
+    assert len(backend) == 0
+
+
+def test_disk_backend_survives_restart(tmp_path) -> None:
+    path = tmp_path / "cache.db"
+    backend = DiskCacheBackend(path, ttl=60)
+    backend.set("a", "1")
+    backend.close()
+
+    backend = DiskCacheBackend(path, ttl=60)
+    assert backend.get("a") == "1"
+    assert backend.get("b") is None
+    backend.close()
+
+
+def test_disk_backend_expires_entries(tmp_path) -> None:
+    backend = DiskCacheBackend(tmp_path / "cache.db", ttl=-1)
+    backend.set("a", "1")
+    assert backend.get("a") is None
+    backend.close()
+
+
+@pytest.mark.asyncio
+async def test_hit_in_slower_backend_is_copied_forward(tmp_path) -> None:
+    memory = MemoryCacheBackend(max_size=10, ttl=60)
+    disk = DiskCacheBackend(tmp_path / "cache.db", ttl=60)
+    disk.set("a", "1")
+    cache = CompletionCache([memory, disk], max_temperature=0.5)
+
+    assert await cache.get("a") == "1"
+    assert memory.get("a") == "1"
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_backend_runs_off_the_event_loop(tmp_path) -> None:
+    backend = DiskCacheBackend(tmp_path / "cache.db", ttl=60)
+    await backend.aset("a", "1")
+
+    thread = backend._executor.submit(threading.get_ident).result()
+    assert thread != threading.get_ident()
+    assert await backend.aget("a") == "1"
+    backend.close()
+
+
+@pytest.mark.asyncio
+async def test_get_or_call_counts_hits_and_misses() -> None:
+    cache = CompletionCache(
+        [MemoryCacheBackend(max_size=10, ttl=60)], max_temperature=0.5
+    )
+    calls = []
+
+    async def call() -> str:
+        calls.append(1)
+        return "completion"
+
+    assert await cache.get_or_call("key", call) == "completion"
+    assert await cache.get_or_call("key", call) == "completion"
+
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.hit_rate, stats.size) == (1, 1, 0.5, 1)
+
+
+@pytest.mark.parametrize(
+    "temperature, accepted", [(0.0, True), (0.5, True), (0.9, False)]
+)
+def test_accepts_temperature(temperature: float, accepted: bool) -> None:
+    cache = CompletionCache([], max_temperature=0.5)
+    assert cache.accepts(temperature) is accepted
+
+
+def test_completion_key() -> None:
+    functions = [{"name": "search"}]
+    key = completion_key("gpt-4", 0, 500, "prompt", functions)
+
+    assert key == completion_key("gpt-4", 0, 500, "prompt", functions)
+    assert key != completion_key("gpt-3.5-turbo", 0, 500, "prompt", functions)
+    assert key != completion_key("gpt-4", 0.1, 500, "prompt", functions)
+    assert key != completion_key("gpt-4", 0, 1000, "prompt", functions)
+    assert key != completion_key("gpt-4", 0, 500, "other prompt", functions)
+    assert key != completion_key("gpt-4", 0, 500, "prompt", [{"name": "code"}])
+    assert key != completion_key("gpt-4", 0, 500, "prompt")
@@ -0,0 +1,88 @@
+import tiktoken
+
+from reworkd_platform.services.tokenizer.context_packer import ContextPacker
+from reworkd_platform.services.tokenizer.count_cache import TokenCountCache
+from reworkd_platform.services.tokenizer.token_service import TokenService
+
+encoding = tiktoken.get_encoding("cl100k_base")
+
+
+def create_packer(**kwargs) -> ContextPacker:
+    return ContextPacker(TokenService(encoding), **kwargs)
+
+
+def test_everything_fits() -> None:
+    packer = create_packer()
+    results = ["first", "second", "third"]
+
+    assert packer.pack("message", results, 1000) == results
+
+
+def test_relevant_results_win_and_keep_their_order() -> None:
+    packer = create_packer()
+    results = [
+        "The capital of France is Paris. " * 10,
+        "Bananas are rich in potassium. " * 10,
+        "Paris has a population of about two million. " * 10,
+        "The weather today is sunny. " * 10,
+    ]
+    budget = packer.count(results[0]) + packer.count(results[2])
+
+    packed = packer.pack("Tell me about Paris", results, budget)
+
+    assert packed == [results[0], results[2]]
+
+
+def test_recency_breaks_ties() -> None:
+    packer = create_packer()
+    results = ["alpha beta", "gamma delta", "epsilon zeta"]
+
+    packed = packer.pack("unrelated", results, packer.count(results[-1]))
+
+    assert packed == ["epsilon zeta"]
+
+
+def test_large_result_is_truncated_to_the_budget() -> None:
+    packer = create_packer()
+    result = "word " * 1000
+
+    packed = packer.pack("word", [result], 200)
+
+    assert len(packed) == 1
+    assert packer.token_service.count(packed[0]) == 200
+
+
+def test_tiny_leftover_budget_is_not_used() -> None:
+    packer = create_packer()
+
+    assert packer.pack("word", ["word " * 1000], 50) == []
+
+
+def test_token_counts_are_cached(mocker) -> None:
+    packer = create_packer(cache_size=2)
+    count = mocker.spy(packer.token_service, "tokenize")
+
+    for results in [["a"], ["b"], ["a"], ["b"]]:
+        packer.pack("message", results, 1000)
+    assert count.call_count == 2
+
+    packer.pack("message", ["c"], 1000)
+    packer.pack("message", ["a"], 1000)  # Least recently used, evicted by "c"
+    assert count.call_count == 4
+
+
+def test_shared_count_cache_is_used() -> None:
+    cache = TokenCountCache()
+    packer = ContextPacker(TokenService(encoding, cache))
+
+    packer.pack("message", ["a", "b"], 1000)
+    assert cache.stats().misses == 2
+
+
+def test_budget_leaves_room_for_the_answer() -> None:
+    packer = create_packer(max_tokens=3000, min_completion_tokens=500)
+
+    assert packer.budget("gpt-4") == 3000
+    prompt = "word " * 7000
+    assert packer.budget("gpt-4", prompt) == 8192 - 500 - packer.count(prompt)
+    assert packer.budget("gpt-4", "word " * 9000) == 0
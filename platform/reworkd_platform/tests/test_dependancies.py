@@ -1,5 +1,11 @@
 import pytest
 
+from reworkd_platform.schemas.agent import (
+    AgentChat,
+    AgentSummarize,
+    AgentTaskCreate,
+    RunState,
+)
 from reworkd_platform.web.api.agent import dependancies
 
 
@@ -24,3 +30,40 @@ async def test_agent_validate(mocker, validator, step):
 
     await validator(body, crud)
     crud.create_task.assert_called_once_with(run_id, step)
+
+
+@pytest.mark.anyio
+async def test_missing_fields_are_loaded_from_run_state(mocker):
+    crud = mocker.Mock()
+    crud.create_task = mocker.AsyncMock()
+    crud.get_run_state = mocker.AsyncMock(
+        return_value=RunState(
+            tasks=["Pending"], completed_tasks=["First", "Last"], results=["1", "2"]
+        )
+    )
+
+    body = await dependancies.agent_create_validator(
+        AgentTaskCreate(goal="goal", run_id="run", tasks=["Client task"]), crud
+    )
+
+    assert body.run_id == "run"
+    assert body.tasks == ["Client task"]
+    assert body.completed_tasks == ["First", "Last"]
+    assert (body.last_task, body.result) == ("Last", "2")
+
+    body = await dependancies.agent_summarize_validator(
+        AgentSummarize(goal="goal", run_id="run"), crud
+    )
+    assert body.results == ["1", "2"]
+
+
+@pytest.mark.anyio
+async def test_run_state_is_not_loaded_when_provided(mocker):
+    crud = mocker.Mock()
+    crud.create_task = mocker.AsyncMock()
+    crud.get_run_state = mocker.AsyncMock()
+
+    await dependancies.agent_chat_validator(
+        AgentChat(goal="goal", run_id="run", message="hi", results=[]), crud
+    )
+    crud.get_run_state.assert_not_called()
@@ -0,0 +1,18 @@
+from reworkd_platform.services.tokenizer import encodings
+from reworkd_platform.services.tokenizer.encodings import get_encoding
+
+
+def test_registry_shares_encodings(mocker) -> None:
+    mocker.patch.dict(encodings._encodings, clear=True)
+
+    assert get_encoding() is get_encoding("cl100k_base")
+
+
+def test_registry_builds_each_encoding_once(mocker) -> None:
+    mocker.patch.dict(encodings._encodings, clear=True)
+    build = mocker.patch("tiktoken.get_encoding")
+
+    get_encoding("cl100k_base")
+    get_encoding("cl100k_base")
+
+    build.assert_called_once_with("cl100k_base")
@@ -1,8 +1,14 @@
 import pytest
+from langchain.schema import AIMessage, HumanMessage
 from openai.error import InvalidRequestError, ServiceUnavailableError
 
 from reworkd_platform.schemas.agent import ModelSettings
-from reworkd_platform.web.api.agent.helpers import openai_error_handler
+from reworkd_platform.services.completion_cache.backends import MemoryCacheBackend
+from reworkd_platform.services.completion_cache.cache import CompletionCache
+from reworkd_platform.web.api.agent.helpers import (
+    call_function_with_handling,
+    openai_error_handler,
+)
 from reworkd_platform.web.api.errors import OpenAIError
 
 
@@ -43,3 +49,32 @@ async def test_should_log(settings, should_log):
     error: OpenAIError = exc_info.value
 
     assert error.should_log == should_log
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("temperature, expected_calls", [(0.0, 1), (0.9, 2)])
+async def test_call_function_with_handling_uses_cache(
+    mocker, temperature, expected_calls
+):
+    cache = CompletionCache(
+        [MemoryCacheBackend(max_size=10, ttl=60)], max_temperature=0.5
+    )
+    model = mocker.Mock(model_name="gpt-4", temperature=temperature)
+    model.apredict_messages = mocker.AsyncMock(
+        return_value=AIMessage(
+            content="",
+            additional_kwargs={"function_call": {"name": "search", "arguments": "{}"}},
+        )
+    )
+
+    for _ in range(2):
+        function_call = await call_function_with_handling(
+            model,
+            [HumanMessage(content="task")],
+            [{"name": "search"}],
+            settings=ModelSettings(),
+            cache=cache,
+        )
+        assert function_call == {"name": "search", "arguments": "{}"}
+
+    assert model.apredict_messages.call_count == expected_calls
@@ -0,0 +1,179 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from reworkd_platform.services.idempotency.middleware import IdempotencyMiddleware
+from reworkd_platform.services.idempotency.store import IdempotencyStore
+
+
+class Steps:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release: Optional[asyncio.Event] = None
+
+
+def create_app(steps: Steps) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware, path_prefix="/agent/")
+    app.state.idempotency_store = IdempotencyStore(ttl=60, max_size=10)
+
+    @app.post("/agent/analyze")
+    async def analyze(body: Dict[str, str]) -> Dict[str, int]:
+        steps.calls += 1
+        if steps.release:
+            await steps.release.wait()
+        return {"call": steps.calls}
+
+    @app.post("/agent/execute")
+    async def execute() -> StreamingResponse:
+        steps.calls += 1
+
+        async def body() -> AsyncIterator[bytes]:
+            for chunk in [b"one ", b"two ", f"{steps.calls}".encode()]:
+                yield chunk
+
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    @app.post("/agent/fail")
+    async def fail() -> None:
+        steps.calls += 1
+        raise ValueError("Upstream failed")
+
+    return app
+
+
+def client(app: FastAPI) -> httpx.AsyncClient:
+    return httpx.AsyncClient(app=app, base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_retry_replays_response() -> None:
+    steps = Steps()
+    app = create_app(steps)
+    async with client(app) as c:
+        headers = {"Idempotency-Key": "key", "Authorization": "Bearer token"}
+        first = await c.post("/agent/analyze", json={"a": "b"}, headers=headers)
+        retry = await c.post("/agent/analyze", json={"a": "b"}, headers=headers)
+        other = await c.post(
+            "/agent/analyze",
+            json={"a": "b"},
+            headers={**headers, "Authorization": "Bearer other"},
+        )
+
+    assert first.json() == retry.json() == {"call": 1}
+    assert other.json() == {"call": 2}
+    assert app.state.idempotency_store.stats().replayed == 1
+
+
+@pytest.mark.asyncio
+async def test_requests_without_key_run_every_time() -> None:
+    steps = Steps()
+    async with client(create_app(steps)) as c:
+        await c.post("/agent/analyze", json={"a": "b"})
+        await c.post("/agent/analyze", json={"a": "b"})
+
+    assert steps.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_retry_replays_stream_body() -> None:
+    steps = Steps()
+    async with client(create_app(steps)) as c:
+        headers = {"Idempotency-Key": "key"}
+        first = await c.post("/agent/execute", headers=headers)
+        retry = await c.post("/agent/execute", headers=headers)
+
+    assert first.text == retry.text == "one two 1"
+    assert retry.headers["content-type"].startswith("text/event-stream")
+    assert steps.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_key_reused_for_different_request() -> None:
+    steps = Steps()
+    async with client(create_app(steps)) as c:
+        headers = {"Idempotency-Key": "key"}
+        await c.post("/agent/analyze", json={"a": "b"}, headers=headers)
+        conflict = await c.post("/agent/analyze", json={"a": "c"}, headers=headers)
+
+    assert conflict.status_code == 422
+    assert steps.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_attaches_to_running_request() -> None:
+    steps = Steps()
+    steps.release = asyncio.Event()
+    app = create_app(steps)
+    async with client(app) as c:
+        headers = {"Idempotency-Key": "key"}
+        first = asyncio.create_task(
+            c.post("/agent/analyze", json={"a": "b"}, headers=headers)
+        )
+        await asyncio.sleep(0.01)
+        retry = asyncio.create_task(
+            c.post("/agent/analyze", json={"a": "b"}, headers=headers)
+        )
+        await asyncio.sleep(0.01)
+        steps.release.set()
+
+        assert (await first).json() == (await retry).json() == {"call": 1}
+
+    assert steps.calls == 1
+    assert app.state.idempotency_store.stats().attached == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_requests_are_executed_again() -> None:
+    steps = Steps()
+    async with client(create_app(steps)) as c:
+        headers = {"Idempotency-Key": "key"}
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await c.post("/agent/fail", headers=headers)
+
+    assert steps.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_streams_failing_midway_are_executed_again() -> None:
+    steps = Steps()
+    app = create_app(steps)
+
+    async def body() -> AsyncIterator[bytes]:
+        yield b"one "
+        raise ValueError("Upstream failed")
+
+    @app.post("/agent/break")
+    async def break_stream() -> StreamingResponse:
+        steps.calls += 1
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    async with client(app) as c:
+        headers = {"Idempotency-Key": "key"}
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await c.post("/agent/break", headers=headers)
+
+    assert steps.calls == 2
+
+
+def test_store_expires_and_evicts(mocker) -> None:
+    store = IdempotencyStore(ttl=10, max_size=1)
+    monotonic = mocker.patch("time.monotonic", return_value=0)
+
+    for key in ["a", "b"]:
+        response = store.begin(key, "fingerprint")
+        response.start = {"type": "http.response.start", "status": 200}
+        response.done = True
+        store.complete(key, response)
+
+    assert store.get("a") is None
+    assert store.get("b") is not None
+
+    monotonic.return_value = 11
+    assert store.get("b") is None
@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import pytest
+from openai.error import APIConnectionError
+
+from reworkd_platform.schemas import ModelSettings, UserBase
+from reworkd_platform.services.rate_limiter.limiter import (
+    RateLimiter,
+    TokenBucket,
+    rate_limit_key,
+)
+from reworkd_platform.settings import Settings
+from reworkd_platform.web.api.agent.model_factory import create_model
+from reworkd_platform.web.api.errors import RateLimitTimeoutError
+
+
+def create_limiter(mocker, **kwargs) -> RateLimiter:
+    token_service = mocker.Mock()
+    token_service.count.side_effect = len
+    return RateLimiter(token_service, **kwargs)
+
+
+def test_token_bucket_refills_over_time() -> None:
+    bucket = TokenBucket(per_minute=60)
+    bucket.consume(60)
+    assert bucket.wait_time(30) == pytest.approx(30, abs=0.1)
+
+    bucket.updated -= 30  # Pretend 30 seconds have passed
+    assert bucket.wait_time(30) == 0
+    assert bucket.wait_time(60) == pytest.approx(30, abs=0.1)
+
+
+def test_token_bucket_caps_at_capacity() -> None:
+    bucket = TokenBucket(per_minute=60)
+    bucket.updated -= 600
+    bucket.refill()
+    assert bucket.level == 60
+
+
+def test_token_bucket_oversized_request_waits_for_full_bucket() -> None:
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(1000) == 0
+
+
+@pytest.mark.asyncio
+async def test_acquire_charges_estimated_prompt_tokens(mocker) -> None:
+    limiter = create_limiter(mocker, rpm=10, tpm=1000)
+
+    reservation = await limiter.acquire("key", "x" * 100)
+
+    assert reservation.estimated == 100
+    limit = limiter._limits["key"]
+    assert limit.requests.level == pytest.approx(9, abs=0.01)
+    assert limit.tokens.level == pytest.approx(900, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_charges_actual_usage(mocker) -> None:
+    limiter = create_limiter(mocker, tpm=1000)
+    reservation = await limiter.acquire("key", "x" * 100)
+
+    reservation.reconcile(250)
+
+    assert limiter._limits["key"].tokens.level == pytest.approx(750, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_limits_are_per_key(mocker) -> None:
+    limiter = create_limiter(mocker, rpm=1, max_wait=0)
+
+    await limiter.acquire("a", "")
+    await limiter.acquire("b", "")
+
+    with pytest.raises(RateLimitTimeoutError):
+        await limiter.acquire("a", "")
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_capacity(mocker) -> None:
+    limiter = create_limiter(mocker, tpm=60_000, max_wait=5)  # 1000 tokens / second
+    await limiter.acquire("key", "x" * 60_000)
+
+    start = time.monotonic()
+    await limiter.acquire("key", "x" * 100)
+
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_acquire_fails_fast_when_wait_exceeds_bound(mocker) -> None:
+    limiter = create_limiter(mocker, rpm=1, max_wait=10)
+    await limiter.acquire("key", "")
+
+    start = time.monotonic()
+    with pytest.raises(RateLimitTimeoutError):
+        await limiter.acquire("key", "")
+
+    assert time.monotonic() - start < 1
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_in_order(mocker) -> None:
+    limiter = create_limiter(mocker, tpm=60_000, max_wait=5)
+    await limiter.acquire("key", "x" * 60_000)
+    order = []
+
+    async def acquire(i: int) -> None:
+        await limiter.acquire("key", "x" * 20)
+        order.append(i)
+
+    await asyncio.gather(*[acquire(i) for i in range(5)])
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_rate_limit_key() -> None:
+    assert rate_limit_key("base", "key_1") == rate_limit_key("other", "key_1")
+    assert rate_limit_key("base", "key_1") != rate_limit_key("base", "key_2")
+    assert "key_1" not in rate_limit_key("base", "key_1")
+    assert rate_limit_key("base", "key", "gpt-35-turbo") != rate_limit_key(
+        "base", "key", "gpt-4"
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("streaming", [False, True])
+async def test_failed_calls_give_back_their_reservation(mocker, streaming) -> None:
+    limiter = create_limiter(mocker, tpm=1000)
+
+    async def fail(*args, **kwargs):
+        raise APIConnectionError("down")
+
+    mocker.patch("langchain.chat_models.openai.acompletion_with_retry", fail)
+    model = create_model(
+        Settings(),
+        ModelSettings(),
+        UserBase(id="user_id"),
+        streaming=streaming,
+        rate_limiter=limiter,
+    )
+
+    with pytest.raises(APIConnectionError):
+        await model.apredict("x" * 100)
+
+    tokens = next(iter(limiter._limits.values())).tokens
+    assert tokens.level == pytest.approx(1000, abs=1)
@@ -0,0 +1,128 @@
+import asyncio
+from typing import AsyncIterator, List
+
+import pytest
+
+from reworkd_platform.services.scheduler.scheduler import (
+    KeyedSemaphore,
+    RunScheduler,
+    TaskGraph,
+    TaskNode,
+)
+
+
+def test_graph_ready_respects_dependencies() -> None:
+    graph = TaskGraph()
+    first = graph.add("first")
+    second = graph.add("second")
+    child = graph.add("child", depends_on=[first.id])
+
+    assert graph.ready() == [first, second]
+
+    graph.start(first)
+    graph.complete(first)
+    assert graph.ready() == [second, child]
+
+
+async def collect(scheduler: RunScheduler, graph: TaskGraph, process) -> List:
+    return [item async for item in scheduler.run(graph, process)]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_caps_concurrency() -> None:
+    graph = TaskGraph()
+    for i in range(5):
+        graph.add(f"task {i}")
+    running, peak = 0, 0
+
+    async def process(node: TaskNode) -> AsyncIterator[str]:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        yield node.id
+
+    items = await collect(RunScheduler(max_concurrency=2), graph, process)
+
+    assert sorted(items) == ["1", "2", "3", "4", "5"]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_caps_concurrency_per_user() -> None:
+    slots = KeyedSemaphore(limit=1)
+    running, peak = 0, 0
+
+    async def process(node: TaskNode) -> AsyncIterator[str]:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        yield node.id
+
+    def run_for(user_id: str):
+        graph = TaskGraph()
+        graph.add("a")
+        graph.add("b")
+        scheduler = RunScheduler(max_concurrency=2, user_slots=slots, user_id=user_id)
+        return collect(scheduler, graph, process)
+
+    await asyncio.gather(run_for("user"), run_for("user"))
+    assert peak == 1
+    assert len(slots) == 0
+
+    await asyncio.gather(run_for("user"), run_for("other user"))
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_tasks_added_while_running() -> None:
+    graph = TaskGraph()
+    graph.add("root")
+
+    async def process(node: TaskNode) -> AsyncIterator[str]:
+        if node.task == "root":
+            graph.add("child", depends_on=[node.id])
+        yield node.task
+
+    items = await collect(RunScheduler(max_concurrency=2), graph, process)
+    assert items == ["root", "child"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_stops_at_max_tasks() -> None:
+    graph = TaskGraph()
+    for i in range(5):
+        graph.add(f"task {i}")
+
+    async def process(node: TaskNode) -> AsyncIterator[str]:
+        yield node.id
+
+    items = await collect(RunScheduler(max_concurrency=2, max_tasks=3), graph, process)
+    assert sorted(items) == ["1", "2", "3"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_failure_cancels_other_tasks() -> None:
+    graph = TaskGraph()
+    graph.add("slow")
+    graph.add("failing")
+    cancelled = []
+
+    async def process(node: TaskNode) -> AsyncIterator[str]:
+        if node.task == "failing":
+            raise ValueError("failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(node.task)
+            raise
+        yield node.task
+
+    with pytest.raises(ValueError):
+        await collect(RunScheduler(max_concurrency=2), graph, process)
+
+    await asyncio.sleep(0)
+    assert cancelled == ["slow"]
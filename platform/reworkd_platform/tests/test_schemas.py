@@ -17,7 +17,7 @@ from reworkd_platform.schemas.agent import ModelSettings
             "max_tokens": 3000,
         },
         {
-            "model": "gpt-3.5-turbo-16k",
+            "model": "gpt-4o",
             "max_tokens": 16000,
         },
     ],
@@ -0,0 +1,287 @@
+import asyncio
+
+import pytest
+from lanarky.responses import StreamingResponse
+
+from reworkd_platform.schemas.agent import ModelSettings
+from reworkd_platform.schemas.user import UserBase
+from reworkd_platform.services.singleflight.body import iter_body
+from reworkd_platform.services.singleflight.singleflight import SingleFlight, scoped_key
+from reworkd_platform.settings import Settings
+from reworkd_platform.web.api.agent.agent_service.open_ai_agent_service import (
+    OpenAIAgentService,
+)
+from reworkd_platform.web.api.agent.analysis import Analysis
+from reworkd_platform.web.api.agent.model_factory import create_model
+from reworkd_platform.web.api.agent.stream_mock import stream_string
+from reworkd_platform.web.api.agent.streaming import (
+    on_stream_complete,
+    stream_with_header,
+)
+
+
+async def read(response) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def chain_response(chunks, release: asyncio.Event) -> StreamingResponse:
+    async def chain_executor(send):
+        for chunk in chunks:
+            await release.wait()
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    return StreamingResponse(chain_executor, media_type="text/event-stream")
+
+
+@pytest.mark.asyncio
+async def test_do_coalesces_concurrent_calls() -> None:
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = []
+
+    async def call() -> str:
+        calls.append(1)
+        await release.wait()
+        return "result"
+
+    waiters = [asyncio.create_task(flight.do("key", call)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.coalesced == 4
+
+    # Once finished, the next call goes upstream again
+    assert await flight.do("key", call) == "result"
+    assert len(calls) == 2
+
+
+def test_scoped_key_separates_credentials(mocker) -> None:
+    model = mocker.Mock(
+        openai_api_base="https://api.openai.com/v1", openai_api_key="sk-a"
+    )
+    same = mocker.Mock(
+        openai_api_base="https://api.openai.com/v1", openai_api_key="sk-a"
+    )
+    other_key = mocker.Mock(
+        openai_api_base="https://api.openai.com/v1", openai_api_key="sk-b"
+    )
+    other_base = mocker.Mock(openai_api_base="https://proxy/v1", openai_api_key="sk-a")
+
+    assert scoped_key("key", model) == scoped_key("key", same)
+    assert scoped_key("key", model) != scoped_key("key", other_key)
+    assert scoped_key("key", model) != scoped_key("key", other_base)
+    assert "sk-a" not in scoped_key("key", model)
+
+
+@pytest.mark.asyncio
+async def test_do_shares_errors() -> None:
+    flight = SingleFlight()
+
+    async def call() -> str:
+        await asyncio.sleep(0)
+        raise ValueError("upstream failed")
+
+    results = await asyncio.gather(
+        flight.do("key", call), flight.do("key", call), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_do_survives_cancelled_caller() -> None:
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def call() -> str:
+        await release.wait()
+        return "result"
+
+    first = asyncio.create_task(flight.do("key", call))
+    second = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    release.set()
+
+    assert await second == "result"
+
+
+@pytest.mark.asyncio
+async def test_stream_tees_one_upstream_stream() -> None:
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return chain_response([b"a", b"b", b"c"], release)
+
+    responses = await asyncio.gather(
+        flight.stream("key", call), flight.stream("key", call)
+    )
+    release.set()
+
+    assert await asyncio.gather(*map(read, responses)) == [b"abc", b"abc"]
+    assert responses[0].media_type == "text/event-stream"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_late_subscriber_replays_buffer() -> None:
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def call():
+        return chain_response([b"a", b"b"], release)
+
+    first = await flight.stream("key", call)
+    release.set()
+    first_body = asyncio.create_task(read(first))
+    await asyncio.sleep(0)
+
+    second = await flight.stream("key", call)
+    assert await read(second) == b"ab"
+    assert await first_body == b"ab"
+
+
+@pytest.mark.asyncio
+async def test_iter_body_of_plain_streaming_response() -> None:
+    chunks = [chunk async for chunk in iter_body(stream_string("hello"))]
+    assert b"".join(chunks) == b"hello"
+
+
+@pytest.mark.asyncio
+async def test_stream_with_header_prepends_line() -> None:
+    release = asyncio.Event()
+    release.set()
+
+    response = stream_with_header(
+        '{"action": "search"}', chain_response([b"a", b"b"], release)
+    )
+
+    assert await read(response) == b'{"action": "search"}\nab'
+    assert response.media_type == "text/event-stream"
+
+
+@pytest.mark.asyncio
+async def test_on_stream_complete_passes_full_body() -> None:
+    received = []
+
+    async def callback(body: bytes) -> None:
+        received.append(body)
+
+    response = on_stream_complete(stream_string("hello"), callback)
+
+    assert await read(response) == b"hello"
+    assert received == [b"hello"]
+
+
+def endless_response(cancelled: asyncio.Event) -> StreamingResponse:
+    async def chain_executor(send):
+        await send({"type": "http.response.body", "body": b"a", "more_body": True})
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    return StreamingResponse(chain_executor, media_type="text/event-stream")
+
+
+@pytest.mark.asyncio
+async def test_stream_cancels_upstream_once_every_subscriber_left() -> None:
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def call():
+        return endless_response(cancelled)
+
+    first, second = await asyncio.gather(
+        flight.stream("key", call), flight.stream("key", call)
+    )
+    assert await first.body_iterator.__anext__() == b"a"
+    assert await second.body_iterator.__anext__() == b"a"
+
+    await first.body_iterator.aclose()
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+
+    await second.body_iterator.aclose()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+    # The next call starts a new upstream stream
+    third = await flight.stream("key", call)
+    assert await third.body_iterator.__anext__() == b"a"
+    await third.body_iterator.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_releases_subscribers_whose_body_never_started() -> None:
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def call():
+        return endless_response(cancelled)
+
+    first, second = await asyncio.gather(
+        flight.stream("key", call), flight.stream("key", call)
+    )
+    wrapped = stream_with_header("header", first)
+
+    # Both clients disconnect before their body is iterated
+    await wrapped.background()
+    await wrapped.background()
+    assert not cancelled.is_set()
+
+    await second.background()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_disconnecting_coalesced_execute_cancels_the_tool(mocker) -> None:
+    cancelled = asyncio.Event()
+    calls = []
+
+    class EndlessTool:
+        coalescable = True
+
+        def __init__(self, *args):
+            pass
+
+        async def call(self, *args):
+            calls.append(1)
+            return endless_response(cancelled)
+
+    mocker.patch(
+        "reworkd_platform.web.api.agent.agent_service.open_ai_agent_service"
+        ".get_tool_from_name",
+        return_value=EndlessTool,
+    )
+    service = OpenAIAgentService(
+        model=create_model(Settings(), ModelSettings(), UserBase(id="user_id")),
+        settings=ModelSettings(),
+        token_service=mocker.Mock(),
+        callbacks=None,
+        user=mocker.Mock(),
+        oauth_crud=mocker.Mock(),
+        single_flight=SingleFlight(),
+    )
+    analysis = Analysis(action="search", arg="bagels", reasoning="reasoning")
+
+    responses = await asyncio.gather(
+        *[
+            service.copy().execute_task_agent(
+                goal="goal", task="task", analysis=analysis
+            )
+            for _ in range(2)
+        ]
+    )
+    for response in responses:
+        assert await response.body_iterator.__anext__() == b"a"
+    for response in responses:
+        await response.body_iterator.aclose()
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert len(calls) == 1
@@ -0,0 +1,254 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, List
+
+import pytest
+from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
+
+from reworkd_platform.schemas import ModelSettings, UserBase
+from reworkd_platform.services.step_queue.brokers import MemoryBroker
+from reworkd_platform.services.step_queue.dispatcher import StepDispatcher
+from reworkd_platform.services.step_queue.jobs import StepEvent, StepJob
+from reworkd_platform.services.step_queue.worker import StepWorker
+from reworkd_platform.web.api.agent.agent_service.remote_agent_service import (
+    RemoteAgentService,
+    execute_step,
+)
+from reworkd_platform.web.api.agent.analysis import Analysis
+from reworkd_platform.web.api.agent.stream_mock import stream_string
+from reworkd_platform.web.api.agent.streaming import stream_text
+from reworkd_platform.web.api.errors import OpenAIError, StepWorkerError
+
+JOBS = "steps"
+RESULTS = "results"
+
+
+class LocalService:
+    def __init__(self) -> None:
+        self.calls: List[dict] = []
+
+    async def analyze_task_agent(self, **kwargs: Any) -> Analysis:
+        self.calls.append(kwargs)
+        return Analysis(action="search", arg=kwargs["task"], reasoning="because")
+
+    async def execute_task_agent(self, **kwargs: Any) -> FastAPIStreamingResponse:
+        self.calls.append(kwargs)
+        return stream_string(f"Executed {kwargs['task']} ✓", True)
+
+    async def start_goal_agent(self, **kwargs: Any) -> List[str]:
+        raise OpenAIError(Exception(), "Invalid API key", 401)
+
+
+def dispatcher(broker: MemoryBroker, timeout: float = 5) -> StepDispatcher:
+    return StepDispatcher(broker, JOBS, RESULTS, timeout=timeout)
+
+
+def remote(step_dispatcher: StepDispatcher) -> RemoteAgentService:
+    return RemoteAgentService(
+        step_dispatcher,
+        ModelSettings(),
+        UserBase(id="user", name="name", email="email"),
+        streaming=True,
+    )
+
+
+async def start_worker(
+    broker: MemoryBroker, service: Any, concurrency: int = 2
+) -> "asyncio.Task[None]":
+    worker = StepWorker(
+        broker,
+        lambda job: execute_step(service, job),
+        JOBS,
+        RESULTS,
+        group="workers",
+        concurrency=concurrency,
+    )
+    task = asyncio.create_task(worker.run())
+    await asyncio.sleep(0)
+    return task
+
+
+async def stop(*tasks: "asyncio.Task[None]") -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_memory_broker_delivers_to_every_group() -> None:
+    broker = MemoryBroker()
+    await broker.send("topic", "key", b"before")
+    late = await broker.subscribe("topic", "late")
+    replay = await broker.subscribe("topic", "replay", from_beginning=True)
+    await broker.send("topic", "key", b"after")
+
+    assert await late.__anext__() == b"after"
+    assert await replay.__anext__() == b"before"
+    assert await replay.__anext__() == b"after"
+
+
+@pytest.mark.asyncio
+async def test_memory_broker_delivers_everything_without_a_group() -> None:
+    broker = MemoryBroker()
+    first = await broker.subscribe("topic")
+    second = await broker.subscribe("topic")
+    await broker.send("topic", "key", b"value")
+
+    assert await first.__anext__() == b"value"
+    assert await second.__anext__() == b"value"
+
+
+@pytest.mark.asyncio
+async def test_remote_step_returns_parsed_result() -> None:
+    broker = MemoryBroker()
+    service = LocalService()
+    step_dispatcher = dispatcher(broker)
+    await step_dispatcher.start()
+    worker = await start_worker(broker, service)
+
+    analysis = await remote(step_dispatcher).analyze_task_agent(
+        goal="goal", task="task", tool_names=[]
+    )
+
+    assert analysis == Analysis(action="search", arg="task", reasoning="because")
+    assert service.calls == [{"goal": "goal", "task": "task", "tool_names": []}]
+    await stop(worker)
+    await step_dispatcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_remote_step_streams_chunks() -> None:
+    broker = MemoryBroker()
+    service = LocalService()
+    step_dispatcher = dispatcher(broker)
+    await step_dispatcher.start()
+    worker = await start_worker(broker, service)
+
+    response = await remote(step_dispatcher).execute_task_agent(
+        goal="goal",
+        task="task",
+        analysis=Analysis(action="search", arg="arg", reasoning="reasoning"),
+    )
+    chunks = [text async for text in stream_text(response)]
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == "Executed task ✓"
+    assert isinstance(service.calls[0]["analysis"], Analysis)
+    await stop(worker)
+    await step_dispatcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_remote_step_raises_worker_errors() -> None:
+    broker = MemoryBroker()
+    step_dispatcher = dispatcher(broker)
+    await step_dispatcher.start()
+    worker = await start_worker(broker, LocalService())
+
+    with pytest.raises(StepWorkerError) as e:
+        await remote(step_dispatcher).start_goal_agent(goal="goal")
+
+    assert e.value.detail == "Invalid API key"
+    assert e.value.code == 401
+    await stop(worker)
+    await step_dispatcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_remote_step_times_out_without_workers() -> None:
+    broker = MemoryBroker()
+    step_dispatcher = dispatcher(broker, timeout=0.01)
+    await step_dispatcher.start()
+
+    with pytest.raises(StepWorkerError) as e:
+        await remote(step_dispatcher).start_goal_agent(goal="goal")
+
+    assert e.value.code == 504
+    await step_dispatcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_bounds_concurrency() -> None:
+    broker = MemoryBroker()
+    release = asyncio.Event()
+    running = 0
+    peak = 0
+
+    async def execute(job: StepJob) -> AsyncIterator[StepEvent]:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await release.wait()
+        running -= 1
+        yield StepEvent(job_id=job.id, type="result", data="null")
+
+    results = await broker.subscribe(RESULTS, "test")
+    worker = StepWorker(broker, execute, JOBS, RESULTS, "workers", concurrency=2)
+    task = asyncio.create_task(worker.run())
+
+    for _ in range(5):
+        job = StepJob(
+            method="start_goal_agent",
+            kwargs={},
+            model_settings=ModelSettings(),
+            user_id="user",
+        )
+        await broker.send(JOBS, job.id, job.json().encode())
+
+    await asyncio.sleep(0.01)
+    assert running == 2
+
+    release.set()
+    for _ in range(5):
+        await asyncio.wait_for(results.__anext__(), timeout=1)
+    assert peak == 2
+    await stop(task)
+
+
+@pytest.mark.asyncio
+async def test_worker_drops_expired_jobs() -> None:
+    broker = MemoryBroker()
+    service = LocalService()
+    results = await broker.subscribe(RESULTS, "test")
+    worker = await start_worker(broker, service)
+
+    job = StepJob(
+        method="analyze_task_agent",
+        kwargs={"goal": "goal", "task": "task", "tool_names": []},
+        model_settings=ModelSettings(),
+        user_id="user",
+        deadline=time.time() - 1,
+    )
+    await broker.send(JOBS, job.id, job.json().encode())
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(results.__anext__(), timeout=0.05)
+    assert service.calls == []
+    await stop(worker)
+
+
+@pytest.mark.asyncio
+async def test_remote_step_keeps_secrets_off_the_topic() -> None:
+    broker = MemoryBroker()
+    jobs = await broker.subscribe(JOBS, "test")
+    step_dispatcher = dispatcher(broker, timeout=0.01)
+    await step_dispatcher.start()
+    service = RemoteAgentService(
+        step_dispatcher,
+        ModelSettings(custom_api_key="sk-secret"),
+        UserBase(id="user", name="name", email="user@example.com"),
+    )
+
+    with pytest.raises(StepWorkerError):
+        await service.start_goal_agent(goal="goal")
+
+    value = await jobs.__anext__()
+    assert b"sk-secret" not in value
+    assert b"user@example.com" not in value
+
+    job = StepJob.parse_raw(value)
+    assert job.user_id == "user"
+    assert job.model_settings.custom_api_key is None
+    assert job.get_model_settings().custom_api_key == "sk-secret"
+    assert job.deadline
+    await step_dispatcher.stop()
@@ -2,8 +2,13 @@ from unittest.mock import Mock
 
 import tiktoken
 
-from reworkd_platform.schemas.agent import LLM_MODEL_MAX_TOKENS
+from reworkd_platform.schemas.agent import LLM_MODELS
+from reworkd_platform.services.tokenizer.count_cache import TokenCountCache
 from reworkd_platform.services.tokenizer.token_service import TokenService
+from reworkd_platform.web.api.agent.prompts import (
+    analyze_task_prompt,
+    create_tasks_prompt,
+)
 
 encoding = tiktoken.get_encoding("cl100k_base")
 
@@ -45,14 +50,23 @@ def test_calculate_max_tokens_with_high_completion_tokens() -> None:
     service = TokenService(encoding)
     prompt_tokens = service.count(LONG_TEXT)
     model = Mock(spec=["model_name", "max_tokens"])
+    model.model_name = "gpt-4"
+    model.max_tokens = 8000
+
+    service.calculate_max_tokens(model, LONG_TEXT)
+
+    assert model.max_tokens == LLM_MODELS["gpt-4"].context_window - prompt_tokens
+
+
+def test_calculate_max_tokens_is_limited_by_the_model_output() -> None:
+    service = TokenService(encoding)
+    model = Mock(spec=["model_name", "max_tokens"])
     model.model_name = "gpt-3.5-turbo"
     model.max_tokens = 8000
 
     service.calculate_max_tokens(model, LONG_TEXT)
 
-    assert model.max_tokens == (
-        LLM_MODEL_MAX_TOKENS.get("gpt-3.5-turbo") - prompt_tokens
-    )
+    assert model.max_tokens == LLM_MODELS["gpt-3.5-turbo"].max_output_tokens
 
 
 def test_calculate_max_tokens_with_negative_result() -> None:
@@ -67,6 +81,164 @@ def test_calculate_max_tokens_with_negative_result() -> None:
     assert model.max_tokens == 1
 
 
+def test_count_is_memoized(mocker) -> None:
+    cache = TokenCountCache(max_size=2)
+    service = TokenService(encoding, cache)
+    tokenize = mocker.spy(service, "tokenize")
+
+    assert [service.count(text) for text in ["a b", "c", "a b"]] == [2, 1, 2]
+    assert tokenize.call_count == 2
+
+    service.count("d")
+    service.count("a b")
+    service.count("c")  # Least recently used, evicted by "d"
+    assert tokenize.call_count == 4
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.size) == (2, 4, 2)
+    assert stats.hit_rate == 2 / 6
+
+
+def test_count_cache_is_shared_per_encoding() -> None:
+    cache = TokenCountCache()
+    TokenService(encoding, cache).count(LONG_TEXT)
+    TokenService(encoding, cache).count(LONG_TEXT)
+    other = Mock(spec=["name", "encode"], encode=encoding.encode)
+    other.name = "other"
+    TokenService(other, cache).count(LONG_TEXT)
+
+    assert cache.stats().hits == 1
+    assert cache.stats().size == 2
+
+
+def test_count_prompt_is_close_to_the_formatted_prompt() -> None:
+    service = TokenService(encoding)
+    args = {
+        "goal": "Plan a trip to Paris",
+        "language": "English",
+        "tasks": "Find flights\nBook a hotel",
+        "lastTask": "Find flights",
+        "result": LONG_TEXT,
+    }
+
+    exact = service.count(create_tasks_prompt.format(**args))
+    assert exact <= service.count_prompt(create_tasks_prompt, **args) <= exact + 10
+
+
+def test_count_prompt_only_encodes_variables(mocker) -> None:
+    service = TokenService(encoding)
+    service.compile(analyze_task_prompt)
+    tokenize = mocker.spy(service, "tokenize")
+
+    service.count_prompt(analyze_task_prompt, goal="g", task="t", language="l")
+
+    assert sorted(call.args[0] for call in tokenize.call_args_list) == [
+        "g",
+        *["l"] * analyze_task_prompt.template.count("{language}"),
+        "t",
+    ]
+
+
+def test_function_costs_are_cached(mocker) -> None:
+    service = TokenService(encoding)
+    tokenize = mocker.spy(service, "tokenize")
+    functions = [{"name": "search", "description": "Search the web"}]
+
+    assert service.count_functions(functions) == service.count(str(functions[0]))
+    service.count_functions(functions)
+    assert tokenize.call_count == 2
+
+
+def test_for_model_uses_the_model_encoding(mocker) -> None:
+    cache = TokenCountCache()
+    service = TokenService(encoding, cache)
+    other = Mock(spec=["name", "encode"], encode=encoding.encode)
+    other.name = "o200k_base"
+    get_encoding = mocker.patch(
+        "reworkd_platform.services.tokenizer.token_service.get_encoding",
+        return_value=other,
+    )
+
+    assert service.for_model("gpt-4") is service
+    gpt_4o = service.for_model("gpt-4o")
+    assert gpt_4o.encoding is other
+    assert gpt_4o.cache is cache
+    assert service.for_model("gpt-4o") is gpt_4o
+    get_encoding.assert_called_once_with("o200k_base")
+
+
+def test_encoding_is_loaded_on_first_use(mocker) -> None:
+    get_encoding = mocker.patch(
+        "reworkd_platform.services.tokenizer.token_service.get_encoding",
+        return_value=encoding,
+    )
+    service = TokenService("cl100k_base", TokenCountCache())
+
+    assert service.for_model("gpt-4") is service
+    get_encoding.assert_not_called()
+
+    assert service.count("Hello world") == 2
+    assert service.count("Hello world") == 2
+    get_encoding.assert_called_once_with("cl100k_base")
+
+
+def test_for_model_falls_back_on_unknown_encodings(mocker) -> None:
+    service = TokenService(encoding)
+    mocker.patch(
+        "reworkd_platform.services.tokenizer.token_service.get_encoding",
+        side_effect=ValueError("Unknown encoding o200k_base"),
+    )
+
+    assert service.for_model("gpt-4o") is service
+
+
+def test_truncate_head_and_tail() -> None:
+    service = TokenService(encoding)
+    tokens = service.tokenize(LONG_TEXT)
+
+    assert service.truncate(LONG_TEXT, 50) == service.detokenize(tokens[:50])
+    assert service.truncate(LONG_TEXT, 50, "tail") == service.detokenize(tokens[-50:])
+    assert service.truncate("Hello world!", 50, "tail") == "Hello world!"
+    assert service.truncate(LONG_TEXT, 0) == ""
+
+
+def test_truncate_head_and_tail_together() -> None:
+    service = TokenService(encoding)
+    text = "start " + LONG_TEXT + " end"
+
+    truncated = service.truncate(text, 50, "head_tail", separator=" [...] ")
+
+    assert truncated.startswith("start \nThis is")
+    assert truncated.endswith("long text.\n end")
+    assert " [...] " in truncated
+    assert service.count(truncated) <= 50
+
+
+def test_truncate_only_encodes_the_budget(mocker) -> None:
+    service = TokenService(encoding)
+    tokenize = mocker.spy(service, "tokenize")
+    text = LONG_TEXT * 100
+
+    service.truncate(text, 100)
+    service.truncate(text, 100, "tail")
+
+    assert max(len(call.args[0]) for call in tokenize.call_args_list) < 1000
+    assert service.count_up_to(text, 100) == 101
+    assert service.count_up_to("Hello world!", 100) == 3
+
+
+def test_truncate_all_shares_the_budget_fairly() -> None:
+    service = TokenService(encoding)
+    texts = ["Hello world!", LONG_TEXT, LONG_TEXT * 2]
+
+    truncated = service.truncate_all(texts, 203)
+
+    assert truncated[0] == "Hello world!"
+    assert [service.count(text) for text in truncated[1:]] == [100, 100]
+    assert service.truncate_all(texts, 0)[1:] == ["", ""]
+    assert service.truncate_all([], 100) == []
+
+
 LONG_TEXT = """
 This is some long text. This is some long text. This is some long text.
 This is some long text. This is some long text. This is some long text.
@@ -0,0 +1,78 @@
+import openai
+import pytest
+from langchain.schema import HumanMessage
+
+from reworkd_platform.schemas import ModelSettings, UserBase
+from reworkd_platform.services.transport.transport import LLMTransport, pool_key
+from reworkd_platform.settings import Settings
+from reworkd_platform.web.api.agent.model_factory import create_model
+
+
+@pytest.mark.parametrize(
+    "api_base, expected",
+    [
+        ("https://api.openai.com/v1", "https://api.openai.com"),
+        ("https://oai.hconeai.com/v1", "https://oai.hconeai.com"),
+        ("https://my.openai.azure.com/", "https://my.openai.azure.com"),
+        ("HTTPS://API.OPENAI.COM/v1", "https://api.openai.com"),
+        ("openai_base", "openai_base"),
+    ],
+)
+def test_pool_key(api_base: str, expected: str) -> None:
+    assert pool_key(api_base) == expected
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_shared_per_base() -> None:
+    transport = LLMTransport(pool_size=5, keepalive_timeout=10)
+
+    openai_session = transport.get_session("https://api.openai.com/v1")
+    assert transport.get_session("https://api.openai.com/v2") is openai_session
+    assert transport.get_session("https://oai.hconeai.com/v1") is not openai_session
+    assert openai_session.connector.limit == 5
+
+    await transport.close()
+    assert openai_session.closed
+
+
+@pytest.mark.asyncio
+async def test_closed_session_is_replaced() -> None:
+    transport = LLMTransport()
+    session = transport.get_session("https://api.openai.com/v1")
+    await session.close()
+
+    assert transport.get_session("https://api.openai.com/v1") is not session
+    await transport.close()
+
+
+@pytest.mark.asyncio
+async def test_bind_sets_and_resets_openai_session() -> None:
+    transport = LLMTransport()
+
+    with transport.bind("https://api.openai.com/v1") as session:
+        assert openai.aiosession.get() is session
+
+    assert openai.aiosession.get() is None
+    await transport.close()
+
+
+@pytest.mark.asyncio
+async def test_model_requests_use_pooled_session(mocker) -> None:
+    transport = LLMTransport()
+    seen_sessions = []
+
+    async def fake_completion(*args, **kwargs):
+        seen_sessions.append(openai.aiosession.get())
+        return {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+
+    mocker.patch("langchain.chat_models.openai.acompletion_with_retry", fake_completion)
+
+    model = create_model(
+        Settings(), ModelSettings(), UserBase(id="user_id"), transport=transport
+    )
+    await model.apredict_messages([HumanMessage(content="Hello")])
+    await model.apredict_messages([HumanMessage(content="Hello")])
+
+    expected = transport.get_session(model.openai_api_base)
+    assert seen_sessions == [expected, expected]
+    await transport.close()
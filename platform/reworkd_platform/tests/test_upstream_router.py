@@ -0,0 +1,261 @@
+import asyncio
+
+import pytest
+from openai.error import APIConnectionError, InvalidRequestError
+
+from reworkd_platform.schemas import ModelSettings, UserBase
+from reworkd_platform.services.upstream.router import (
+    Upstream,
+    UpstreamHealth,
+    UpstreamRouter,
+)
+from reworkd_platform.settings import Settings
+from reworkd_platform.web.api.agent.model_factory import create_model
+
+PRIMARY = Upstream("https://primary/v1")
+SECONDARY = Upstream("https://secondary/v1")
+
+
+def test_circuit_opens_after_failures() -> None:
+    health = UpstreamHealth(failure_threshold=0.5, open_seconds=30)
+
+    health.record_failure()
+    health.record_failure()
+    assert health.available()
+
+    health.record_failure()
+    health.record_failure()
+    assert health.state == "open"
+    assert not health.available()
+
+
+def test_half_open_lets_a_single_probe_through(mocker) -> None:
+    clock = mocker.patch(
+        "reworkd_platform.services.upstream.router.time.monotonic", return_value=0
+    )
+    health = UpstreamHealth(failure_threshold=0.1, open_seconds=30)
+    health.record_failure()
+    assert not health.available()
+
+    clock.return_value = 30
+    assert health.available()
+    assert health.state == "half_open"
+
+    health.start()
+    assert not health.available()
+
+    health.record_success(0.1)
+    assert health.state == "closed"
+    assert health.available()
+
+
+def test_failed_probe_reopens_circuit(mocker) -> None:
+    clock = mocker.patch(
+        "reworkd_platform.services.upstream.router.time.monotonic", return_value=0
+    )
+    health = UpstreamHealth(failure_threshold=0.1, open_seconds=30)
+    health.record_failure()
+
+    clock.return_value = 30
+    assert health.available()
+    health.start()
+    health.record_failure()
+
+    assert health.state == "open"
+    assert not health.available()
+
+
+def test_p95_needs_enough_samples() -> None:
+    health = UpstreamHealth(failure_threshold=0.5, open_seconds=30)
+    for latency in range(19):
+        health.record_success(latency)
+    assert health.p95() is None
+
+    for latency in range(19, 100):
+        health.record_success(latency)
+    assert health.p95() == 94
+
+
+def test_order_skips_open_circuits() -> None:
+    router = UpstreamRouter(failure_threshold=0.1)
+    router.health(PRIMARY).record_failure()
+
+    assert router.order([PRIMARY, SECONDARY]) == [SECONDARY]
+
+
+def test_order_falls_back_to_primary_when_all_are_open() -> None:
+    router = UpstreamRouter(failure_threshold=0.1)
+    router.health(PRIMARY).record_failure()
+    router.health(SECONDARY).record_failure()
+
+    assert router.order([PRIMARY, SECONDARY]) == [PRIMARY]
+
+
+@pytest.mark.asyncio
+async def test_call_fails_over_on_upstream_error() -> None:
+    router = UpstreamRouter()
+    seen = []
+
+    async def func(upstream: Upstream) -> str:
+        seen.append(upstream)
+        if upstream == PRIMARY:
+            raise APIConnectionError("down")
+        return "result"
+
+    assert await router.call([PRIMARY, SECONDARY], func) == "result"
+    assert seen == [PRIMARY, SECONDARY]
+    assert router.health(PRIMARY).error_rate > 0
+    assert router.health(SECONDARY).latency is not None
+
+
+@pytest.mark.asyncio
+async def test_call_does_not_fail_over_on_request_errors() -> None:
+    router = UpstreamRouter()
+    seen = []
+
+    async def func(upstream: Upstream) -> str:
+        seen.append(upstream)
+        raise InvalidRequestError("bad request", None)
+
+    with pytest.raises(InvalidRequestError):
+        await router.call([PRIMARY, SECONDARY], func)
+
+    assert seen == [PRIMARY]
+    assert router.health(PRIMARY).error_rate == 0
+
+
+@pytest.mark.asyncio
+async def test_call_raises_last_error_when_all_fail() -> None:
+    router = UpstreamRouter()
+
+    async def func(upstream: Upstream) -> str:
+        raise APIConnectionError(upstream.api_base)
+
+    with pytest.raises(APIConnectionError, match="secondary"):
+        await router.call([PRIMARY, SECONDARY], func)
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged() -> None:
+    router = UpstreamRouter(hedging_enabled=True, hedge_min_delay=0.01)
+    for _ in range(20):
+        router.health(PRIMARY).record_success(0.01)
+    cancelled = []
+
+    async def func(upstream: Upstream) -> str:
+        if upstream == PRIMARY:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(upstream)
+                raise
+        return upstream.api_base
+
+    assert await router.call([PRIMARY, SECONDARY], func, hedge=True) == (
+        SECONDARY.api_base
+    )
+    await asyncio.sleep(0)
+    assert cancelled == [PRIMARY]
+    assert not router.health(PRIMARY).probing
+
+
+@pytest.mark.asyncio
+async def test_first_success_skips_cancelled_attempts() -> None:
+    loop = asyncio.get_running_loop()
+    cancelled, slow = loop.create_future(), loop.create_future()
+    cancelled.cancel()
+    loop.call_later(0.01, slow.set_result, "result")
+
+    assert await UpstreamRouter._first_success([cancelled, slow]) == "result"
+
+
+@pytest.mark.asyncio
+async def test_call_without_upstreams_raises() -> None:
+    async def func(upstream: Upstream) -> str:
+        return upstream.api_base
+
+    with pytest.raises(ValueError):
+        await UpstreamRouter().call([], func)
+
+
+@pytest.mark.asyncio
+async def test_no_hedging_without_latency_history() -> None:
+    router = UpstreamRouter(hedging_enabled=True, hedge_min_delay=0)
+    seen = []
+
+    async def func(upstream: Upstream) -> str:
+        seen.append(upstream)
+        await asyncio.sleep(0.01)
+        return upstream.api_base
+
+    assert await router.call([PRIMARY, SECONDARY], func, hedge=True) == (
+        PRIMARY.api_base
+    )
+    assert seen == [PRIMARY]
+
+
+def test_helicone_models_fall_back_to_provider() -> None:
+    settings = Settings(
+        helicone_api_key="some_key",
+        helicone_api_base="helicone_base",
+        openai_api_base="openai_base",
+    )
+
+    model = create_model(settings, ModelSettings(), UserBase(id="user_id"))
+
+    assert [u.api_base for u in model.upstreams] == ["helicone_base", "openai_base"]
+    assert model.upstreams[0].headers is not None
+    assert model.upstreams[1].headers is None
+
+
+@pytest.mark.parametrize(
+    "api_base, expected",
+    [
+        ("https://api.openai.com/v1", ["https://api.openai.com/v1", "alt/v1"]),
+        ("https://x.openai.azure.com/v1", ["https://x.openai.azure.com/", "alt/"]),
+    ],
+)
+def test_models_fall_back_to_configured_alternates(api_base, expected) -> None:
+    settings = Settings(openai_api_base=api_base, upstream_fallback_bases=["alt/v1"])
+
+    model = create_model(settings, ModelSettings(), UserBase(id="user_id"))
+
+    assert [u.api_base for u in model.upstreams] == expected
+
+
+def test_custom_keys_have_no_alternates() -> None:
+    settings = Settings(upstream_fallback_bases=["alt/v1"])
+
+    model = create_model(
+        settings, ModelSettings(custom_api_key="sk-custom"), UserBase(id="user_id")
+    )
+
+    assert [u.api_base for u in model.upstreams] == ["https://api.openai.com/v1"]
+
+
+@pytest.mark.asyncio
+async def test_model_fails_over_to_provider(mocker) -> None:
+    settings = Settings(
+        helicone_api_key="some_key",
+        helicone_api_base="helicone_base",
+        openai_api_base="openai_base",
+    )
+    seen = []
+
+    async def fake_completion(*args, **kwargs):
+        seen.append(kwargs["api_base"])
+        if kwargs["api_base"] == "helicone_base":
+            raise APIConnectionError("down")
+        return {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+
+    mocker.patch("langchain.chat_models.openai.acompletion_with_retry", fake_completion)
+
+    model = create_model(
+        settings,
+        ModelSettings(),
+        UserBase(id="user_id"),
+        upstream_router=UpstreamRouter(),
+    )
+
+    assert await model.apredict("Hello") == "hi"
+    assert seen == ["helicone_base", "openai_base"]
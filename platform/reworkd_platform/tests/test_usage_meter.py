@@ -0,0 +1,125 @@
+import asyncio
+from typing import List, Tuple
+
+import pytest
+from langchain.schema import AIMessage, ChatGeneration, ChatResult, HumanMessage
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+
+from reworkd_platform.schemas import ModelSettings, UserBase
+from reworkd_platform.services.usage.meter import UsageMeter, cost_of
+from reworkd_platform.settings import Settings
+from reworkd_platform.web.api.agent.model_factory import create_model
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class RecordingMeter(UsageMeter):
+    def __init__(self) -> None:
+        super().__init__(lambda: None, count_words)  # type: ignore
+        self.records: List[Tuple[str, str, int, int]] = []
+
+    async def record(
+        self, run_id: str, model: str, prompt_tokens: int, completion_tokens: int
+    ) -> None:
+        self.records.append((run_id, model, prompt_tokens, completion_tokens))
+
+
+def model_with_usage(meter: UsageMeter, streaming: bool = False):
+    return create_model(
+        Settings(),
+        ModelSettings(model="gpt-4"),
+        UserBase(id="user_id"),
+        streaming=streaming,
+        usage=meter.for_run("run", "gpt-4"),
+    )
+
+
+def test_cost_of_known_and_unknown_models() -> None:
+    assert cost_of("gpt-4", 1000, 500) == pytest.approx(0.06)
+    assert cost_of("unknown", 1000, 500) == 0
+
+
+@pytest.mark.asyncio
+async def test_record_increments_the_run(mocker) -> None:
+    session = mocker.AsyncMock()
+    factory = mocker.MagicMock()
+    factory.return_value.__aenter__.return_value = session
+
+    await UsageMeter(factory, count_words).record("run", "gpt-4", 10, 5)
+
+    session.execute.assert_awaited_once()
+    session.commit.assert_awaited_once()
+    statement = session.execute.call_args.args[0]
+    assert statement.compile().params["prompt_tokens_1"] == 10
+    assert statement.compile().params["completion_tokens_1"] == 5
+
+
+@pytest.mark.asyncio
+async def test_record_never_raises(mocker) -> None:
+    factory = mocker.MagicMock(side_effect=ConnectionError("database is down"))
+
+    await UsageMeter(factory, count_words).record("run", "gpt-4", 10, 5)
+
+
+@pytest.mark.asyncio
+async def test_generate_records_reported_usage(mocker) -> None:
+    meter = RecordingMeter()
+    result = ChatResult(
+        generations=[ChatGeneration(message=AIMessage(content="Hi"))],
+        llm_output={
+            "token_usage": {
+                "prompt_tokens": 12,
+                "completion_tokens": 3,
+                "total_tokens": 15,
+            }
+        },
+    )
+    mocker.patch(
+        "langchain.chat_models.openai.ChatOpenAI._agenerate", return_value=result
+    )
+
+    await model_with_usage(meter).agenerate([[HumanMessage(content="Hi")]])
+
+    assert meter.records == [("run", "gpt-4", 12, 3)]
+
+
+@pytest.mark.asyncio
+async def test_stream_counts_usage_locally(mocker) -> None:
+    meter = RecordingMeter()
+
+    async def astream(*args, **kwargs):
+        for word in ["one ", "two ", "three"]:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    mocker.patch("langchain.chat_models.openai.ChatOpenAI._astream", astream)
+
+    await model_with_usage(meter, streaming=True).agenerate(
+        [[HumanMessage(content="Say three words")]]
+    )
+
+    # The prompt is counted as the buffer string of the messages: 4 tokens
+    assert meter.records == [("run", "gpt-4", 4, 3)]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_stream_records_partial_usage(mocker) -> None:
+    meter = RecordingMeter()
+
+    async def astream(*args, **kwargs):
+        yield ChatGenerationChunk(message=AIMessageChunk(content="one "))
+        await asyncio.sleep(10)
+
+    mocker.patch("langchain.chat_models.openai.ChatOpenAI._astream", astream)
+
+    model = model_with_usage(meter, streaming=True)
+    task = asyncio.create_task(model.agenerate([[HumanMessage(content="Hi")]]))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0)
+
+    assert meter.records == [("run", "gpt-4", 2, 1)]
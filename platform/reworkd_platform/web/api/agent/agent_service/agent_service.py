@@ -1,4 +1,4 @@
-from typing import List, Optional, Protocol
+from typing import List, Optional, Protocol, Tuple
 
 from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
 
@@ -6,14 +6,26 @@ from reworkd_platform.web.api.agent.analysis import Analysis
 
 
 class AgentService(Protocol):
+    def copy(self) -> "AgentService":
+        """A service for a concurrent caller, sharing no state the steps change"""
+        return self
+
     async def start_goal_agent(self, *, goal: str) -> List[str]:
         pass
 
+    async def start_goal_agent_stream(self, *, goal: str) -> FastAPIStreamingResponse:
+        pass
+
     async def analyze_task_agent(
         self, *, goal: str, task: str, tool_names: List[str]
     ) -> Analysis:
         pass
 
+    async def analyze_tasks_agent(
+        self, *, goal: str, tasks: List[str], tool_names: List[str]
+    ) -> List[Analysis]:
+        pass
+
     async def execute_task_agent(
         self,
         *,
@@ -34,6 +46,18 @@ class AgentService(Protocol):
     ) -> List[str]:
         pass
 
+    async def create_and_analyze_task_agent(
+        self,
+        *,
+        goal: str,
+        tasks: List[str],
+        last_task: str,
+        result: str,
+        completed_tasks: Optional[List[str]] = None,
+        tool_names: List[str],
+    ) -> List[Tuple[str, Analysis]]:
+        pass
+
     async def summarize_task_agent(
         self,
         *,
@@ -42,6 +66,15 @@ class AgentService(Protocol):
     ) -> FastAPIStreamingResponse:
         pass
 
+    async def fold_summary_agent(
+        self,
+        *,
+        goal: str,
+        summary: str,
+        results: List[str],
+    ) -> str:
+        pass
+
     async def chat(
         self,
         *,
@@ -5,8 +5,28 @@ from fastapi import Depends
 from reworkd_platform.db.crud.oauth import OAuthCrud
 from reworkd_platform.schemas.agent import AgentRun, LLM_Model
 from reworkd_platform.schemas.user import UserBase
-from reworkd_platform.services.tokenizer.dependencies import get_token_service
+from reworkd_platform.services.cancellation.dependencies import get_cancellation_meter
+from reworkd_platform.services.cancellation.meter import CancellationMeter
+from reworkd_platform.services.completion_cache.cache import CompletionCache
+from reworkd_platform.services.completion_cache.dependencies import get_completion_cache
+from reworkd_platform.services.rate_limiter.dependencies import get_rate_limiter
+from reworkd_platform.services.rate_limiter.limiter import RateLimiter
+from reworkd_platform.services.singleflight.dependencies import get_single_flight
+from reworkd_platform.services.singleflight.singleflight import SingleFlight
+from reworkd_platform.services.step_queue.dependencies import get_step_dispatcher
+from reworkd_platform.services.step_queue.dispatcher import StepDispatcher
+from reworkd_platform.services.tokenizer.context_packer import ContextPacker
+from reworkd_platform.services.tokenizer.dependencies import (
+    get_context_packer,
+    get_token_service,
+)
 from reworkd_platform.services.tokenizer.token_service import TokenService
+from reworkd_platform.services.transport.dependencies import get_llm_transport
+from reworkd_platform.services.transport.transport import LLMTransport
+from reworkd_platform.services.upstream.dependencies import get_upstream_router
+from reworkd_platform.services.upstream.router import UpstreamRouter
+from reworkd_platform.services.usage.dependencies import get_usage_meter
+from reworkd_platform.services.usage.meter import UsageMeter
 from reworkd_platform.settings import settings
 from reworkd_platform.web.api.agent.agent_service.agent_service import AgentService
 from reworkd_platform.web.api.agent.agent_service.mock_agent_service import (
@@ -15,7 +35,13 @@ from reworkd_platform.web.api.agent.agent_service.mock_agent_service import (
 from reworkd_platform.web.api.agent.agent_service.open_ai_agent_service import (
     OpenAIAgentService,
 )
+from reworkd_platform.web.api.agent.agent_service.remote_agent_service import (
+    RemoteAgentService,
+)
+from reworkd_platform.web.api.agent.dependancies import get_fast_path, get_task_indexes
+from reworkd_platform.web.api.agent.fast_path import FastPathRouter
 from reworkd_platform.web.api.agent.model_factory import create_model
+from reworkd_platform.web.api.agent.task_index import TaskIndexCache
 from reworkd_platform.web.api.dependencies import get_current_user
 
 
@@ -29,16 +55,47 @@ def get_agent_service(
         user: UserBase = Depends(get_current_user),
         token_service: TokenService = Depends(get_token_service),
         oauth_crud: OAuthCrud = Depends(OAuthCrud.inject),
+        transport: LLMTransport = Depends(get_llm_transport),
+        completion_cache: Optional[CompletionCache] = Depends(get_completion_cache),
+        single_flight: Optional[SingleFlight] = Depends(get_single_flight),
+        rate_limiter: Optional[RateLimiter] = Depends(get_rate_limiter),
+        upstream_router: UpstreamRouter = Depends(get_upstream_router),
+        fast_path: Optional[FastPathRouter] = Depends(get_fast_path),
+        context_packer: ContextPacker = Depends(get_context_packer),
+        cancellation_meter: CancellationMeter = Depends(get_cancellation_meter),
+        step_dispatcher: Optional[StepDispatcher] = Depends(get_step_dispatcher),
+        usage_meter: UsageMeter = Depends(get_usage_meter),
+        task_indexes: TaskIndexCache = Depends(get_task_indexes),
     ) -> AgentService:
         if settings.ff_mock_mode_enabled:
             return MockAgentService()
 
+        if step_dispatcher:
+            return RemoteAgentService(
+                step_dispatcher,
+                run.model_settings,
+                user,
+                run_id=run.run_id,
+                streaming=streaming,
+                llm_model=llm_model,
+            )
+
+        usage = (
+            usage_meter.for_run(run.run_id, llm_model or run.model_settings.model)
+            if run.run_id
+            else None
+        )
         model = create_model(
             settings,
             run.model_settings,
             user,
             streaming=streaming,
             force_model=llm_model,
+            transport=transport,
+            rate_limiter=rate_limiter,
+            upstream_router=upstream_router,
+            cancellation_meter=cancellation_meter,
+            usage=usage,
         )
 
         return OpenAIAgentService(
@@ -48,6 +105,11 @@ def get_agent_service(
             callbacks=None,
             user=user,
             oauth_crud=oauth_crud,
+            completion_cache=completion_cache,
+            single_flight=single_flight,
+            fast_path=fast_path,
+            context_packer=context_packer,
+            task_index=task_indexes.get(run.run_id) if run.run_id else None,
         )
 
     return func
@@ -1,5 +1,5 @@
 import time
-from typing import Any, List
+from typing import Any, List, Tuple
 
 from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
 
@@ -15,10 +15,28 @@ class MockAgentService(AgentService):
         time.sleep(1)
         return ["Task X", "Task Y", "Task Z"]
 
+    async def start_goal_agent_stream(self, **kwargs: Any) -> FastAPIStreamingResponse:
+        return stream_string('["Task X", "Task Y", "Task Z"]', True)
+
     async def create_tasks_agent(self, **kwargs: Any) -> List[str]:
         time.sleep(1)
         return ["Some random task that doesn't exist"]
 
+    async def create_and_analyze_task_agent(
+        self, **kwargs: Any
+    ) -> List[Tuple[str, Analysis]]:
+        time.sleep(1)
+        return [
+            (
+                "Some random task that doesn't exist",
+                Analysis(
+                    action="search",
+                    arg="Mock analysis",
+                    reasoning="Mock to avoid wasting money calling the OpenAI API.",
+                ),
+            )
+        ]
+
     async def analyze_task_agent(self, **kwargs: Any) -> Analysis:
         time.sleep(1.5)
         return Analysis(
@@ -27,6 +45,17 @@ class MockAgentService(AgentService):
             reasoning="Mock to avoid wasting money calling the OpenAI API.",
         )
 
+    async def analyze_tasks_agent(self, **kwargs: Any) -> List[Analysis]:
+        time.sleep(1.5)
+        return [
+            Analysis(
+                action="search",
+                arg="Mock analysis",
+                reasoning="Mock to avoid wasting money calling the OpenAI API.",
+            )
+            for _ in kwargs.get("tasks", [])
+        ]
+
     async def execute_task_agent(self, **kwargs: Any) -> FastAPIStreamingResponse:
         time.sleep(0.5)
         return stream_string(
@@ -61,6 +90,15 @@ class MockAgentService(AgentService):
             True,
         )
 
+    async def fold_summary_agent(
+        self,
+        *,
+        goal: str,
+        summary: str,
+        results: List[str],
+    ) -> str:
+        return "\n".join([summary, *results]).strip()
+
     async def chat(
         self,
         *,
@@ -1,7 +1,8 @@
-from typing import List, Optional
+import copy
+import json
+from typing import Any, Dict, List, Optional, Tuple, Type
 
 from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
-from lanarky.responses import StreamingResponse
 from langchain import LLMChain
 from langchain.callbacks.base import AsyncCallbackHandler
 from langchain.output_parsers import PydanticOutputParser
@@ -11,25 +12,45 @@ from loguru import logger
 from pydantic import ValidationError
 
 from reworkd_platform.db.crud.oauth import OAuthCrud
-from reworkd_platform.schemas.agent import ModelSettings
+from reworkd_platform.schemas.agent import ModelSettings, get_model_spec
 from reworkd_platform.schemas.user import UserBase
+from reworkd_platform.services.completion_cache.cache import (
+    CompletionCache,
+    completion_key,
+)
+from reworkd_platform.services.singleflight.singleflight import SingleFlight, scoped_key
+from reworkd_platform.services.tokenizer.context_packer import ContextPacker
 from reworkd_platform.services.tokenizer.token_service import TokenService
 from reworkd_platform.web.api.agent.agent_service.agent_service import AgentService
 from reworkd_platform.web.api.agent.analysis import Analysis, AnalysisArguments
+from reworkd_platform.web.api.agent.fast_path import FastPathRouter
 from reworkd_platform.web.api.agent.helpers import (
+    call_function_with_handling,
     call_model_with_handling,
-    openai_error_handler,
     parse_with_handling,
 )
 from reworkd_platform.web.api.agent.model_factory import WrappedChatOpenAI
 from reworkd_platform.web.api.agent.prompts import (
     analyze_task_prompt,
+    analyze_tasks_prompt,
     chat_prompt,
+    create_analyze_task_prompt,
     create_tasks_prompt,
+    fold_summary_prompt,
     start_goal_prompt,
+    summarize_prompt,
 )
+from reworkd_platform.web.api.agent.streaming import StreamingResponse
+from reworkd_platform.web.api.agent.task_index import TaskIndex
 from reworkd_platform.web.api.agent.task_output_parser import TaskOutputParser
-from reworkd_platform.web.api.agent.tools.open_ai_function import get_tool_function
+from reworkd_platform.web.api.agent.tools.open_ai_function import (
+    BATCH_ANALYSIS_FUNCTION,
+    CREATE_TASK_FUNCTION,
+    get_batch_analysis_function,
+    get_create_task_function,
+    get_tool_function,
+)
+from reworkd_platform.web.api.agent.tools.tool import Tool
 from reworkd_platform.web.api.agent.tools.tools import (
     get_default_tool,
     get_tool_from_name,
@@ -39,6 +60,12 @@ from reworkd_platform.web.api.agent.tools.tools import (
 from reworkd_platform.web.api.agent.tools.utils import summarize
 from reworkd_platform.web.api.errors import OpenAIError
 
+# Results are folded into the rolling summary in chunks of at most this many tokens
+SUMMARY_CHUNK_TOKENS = 2000
+SUMMARY_MAX_TOKENS = 1000
+# Results passed to the final summary
+SUMMARY_SNIPPET_TOKENS = 7000
+
 
 class OpenAIAgentService(AgentService):
     def __init__(
@@ -49,25 +76,36 @@ class OpenAIAgentService(AgentService):
         callbacks: Optional[List[AsyncCallbackHandler]],
         user: UserBase,
         oauth_crud: OAuthCrud,
+        completion_cache: Optional[CompletionCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        fast_path: Optional[FastPathRouter] = None,
+        context_packer: Optional[ContextPacker] = None,
+        task_index: Optional[TaskIndex] = None,
     ):
         self.model = model
         self.settings = settings
-        self.token_service = token_service
+        self.token_service = token_service.for_model(model.model_name)
         self.callbacks = callbacks
         self.user = user
         self.oauth_crud = oauth_crud
+        self.completion_cache = completion_cache
+        self.single_flight = single_flight
+        self.fast_path = fast_path
+        self.context_packer = context_packer or ContextPacker(token_service)
+        self.task_index = task_index
 
-    async def start_goal_agent(self, *, goal: str) -> List[str]:
-        prompt = ChatPromptTemplate.from_messages(
-            [SystemMessagePromptTemplate(prompt=start_goal_prompt)]
-        )
+    def copy(self) -> "OpenAIAgentService":
+        # Steps size their completions by setting max_tokens on the model
+        service = copy.copy(self)
+        service.model = self.model.copy()
+        return service
 
+    async def start_goal_agent(self, *, goal: str) -> List[str]:
         self.token_service.calculate_max_tokens(
             self.model,
-            prompt.format_prompt(
-                goal=goal,
-                language=self.settings.language,
-            ).to_string(),
+            prompt_tokens=self.token_service.count_prompt(
+                start_goal_prompt, goal=goal, language=self.settings.language
+            ),
         )
 
         completion = await call_model_with_handling(
@@ -77,6 +115,8 @@ class OpenAIAgentService(AgentService):
             ),
             {"goal": goal, "language": self.settings.language},
             settings=self.settings,
+            cache=self.completion_cache,
+            single_flight=self.single_flight,
             callbacks=self.callbacks,
         )
 
@@ -85,10 +125,36 @@ class OpenAIAgentService(AgentService):
 
         return tasks
 
+    async def start_goal_agent_stream(self, *, goal: str) -> FastAPIStreamingResponse:
+        prompt = ChatPromptTemplate.from_messages(
+            [SystemMessagePromptTemplate(prompt=start_goal_prompt)]
+        )
+
+        self.token_service.calculate_max_tokens(
+            self.model,
+            prompt_tokens=self.token_service.count_prompt(
+                start_goal_prompt, goal=goal, language=self.settings.language
+            ),
+        )
+
+        chain = LLMChain(llm=self.model, prompt=prompt)
+        return StreamingResponse.from_chain(
+            chain,
+            {"goal": goal, "language": self.settings.language},
+            media_type="text/event-stream",
+        )
+
     async def analyze_task_agent(
         self, *, goal: str, task: str, tool_names: List[str]
     ) -> Analysis:
         user_tools = await get_user_tools(tool_names, self.user, self.oauth_crud)
+        # Obvious tool choices don't need an LLM round trip
+        fast_analysis = (
+            self.fast_path.route(goal, task, user_tools) if self.fast_path else None
+        )
+        if fast_analysis:
+            return fast_analysis
+
         functions = list(map(get_tool_function, user_tools))
 
         # Create the system message prompt
@@ -97,27 +163,23 @@ class OpenAIAgentService(AgentService):
         )
 
         # Format the prompt with all required variables
-        formatted_prompt = prompt.format_prompt(
-            goal=goal,
-            task=task,
-            language=self.settings.language,
-        )
+        args = {"goal": goal, "task": task, "language": self.settings.language}
+        formatted_prompt = prompt.format_prompt(**args)
 
+        prompt_tokens = self.token_service.count_prompt(analyze_task_prompt, **args)
         self.token_service.calculate_max_tokens(
-            self.model,
-            formatted_prompt.to_string(),
-            str(functions),
+            self.model, prompt_tokens=prompt_tokens, functions=functions
         )
 
-        message = await openai_error_handler(
-            func=self.model.apredict_messages,
-            messages=formatted_prompt.to_messages(),
-            functions=functions,
+        function_call = await call_function_with_handling(
+            self.model,
+            formatted_prompt.to_messages(),
+            functions,
             settings=self.settings,
+            cache=self.completion_cache,
+            single_flight=self.single_flight,
             callbacks=self.callbacks,
         )
-
-        function_call = message.additional_kwargs.get("function_call", {})
         completion = function_call.get("arguments", "")
 
         try:
@@ -132,25 +194,95 @@ class OpenAIAgentService(AgentService):
             logger.error(f"Completion: {completion}")
             return Analysis.get_default_analysis(task)
 
+    async def analyze_tasks_agent(
+        self, *, goal: str, tasks: List[str], tool_names: List[str]
+    ) -> List[Analysis]:
+        user_tools = list(
+            dict.fromkeys(await get_user_tools(tool_names, self.user, self.oauth_crud))
+        )
+        analyses: List[Optional[Analysis]] = [
+            self.fast_path.route(goal, task, user_tools) if self.fast_path else None
+            for task in tasks
+        ]
+
+        # Everything the fast path couldn't answer goes into a single completion
+        pending = [i for i, analysis in enumerate(analyses) if analysis is None]
+        if pending:
+            prompt = ChatPromptTemplate.from_messages(
+                [SystemMessagePromptTemplate(prompt=analyze_tasks_prompt)]
+            )
+            args = {
+                "goal": goal,
+                "tasks": "\n".join(
+                    f"{n + 1}. {tasks[i]}" for n, i in enumerate(pending)
+                ),
+                "language": self.settings.language,
+            }
+            formatted_prompt = prompt.format_prompt(**args)
+            functions = [get_batch_analysis_function(user_tools)]
+
+            prompt_tokens = self.token_service.count_prompt(
+                analyze_tasks_prompt, **args
+            )
+            self.token_service.calculate_max_tokens(
+                self.model, prompt_tokens=prompt_tokens, functions=functions
+            )
+
+            function_call = await call_function_with_handling(
+                self.model,
+                formatted_prompt.to_messages(),
+                functions,
+                settings=self.settings,
+                cache=self.completion_cache,
+                single_flight=self.single_flight,
+                callbacks=self.callbacks,
+                function_call={"name": BATCH_ANALYSIS_FUNCTION},
+            )
+
+            results = parse_batch_analysis(
+                function_call.get("arguments", ""), len(pending), user_tools
+            )
+            for i, analysis in zip(pending, results):
+                analyses[i] = analysis
+
+        return [
+            analysis or Analysis.get_default_analysis(task)
+            for task, analysis in zip(tasks, analyses)
+        ]
+
     async def execute_task_agent(
         self,
         *,
         goal: str,
         task: str,
         analysis: Analysis,
-    ) -> StreamingResponse:
+    ) -> FastAPIStreamingResponse:
         # TODO: More mature way of calculating max_tokens
         if self.model.max_tokens > 3000:
             self.model.max_tokens = max(self.model.max_tokens - 1000, 3000)
 
         tool_class = get_tool_from_name(analysis.action)
-        return await tool_class(self.model, self.settings.language).call(
-            goal,
-            task,
-            analysis.arg,
-            self.user,
-            self.oauth_crud,
+
+        async def call() -> FastAPIStreamingResponse:
+            return await tool_class(self.model, self.settings.language).call(
+                goal,
+                task,
+                analysis.arg,
+                self.user,
+                self.oauth_crud,
+            )
+
+        if self.single_flight is None or not tool_class.coalescable:
+            return await call()
+
+        key = completion_key(
+            self.model.model_name,
+            self.model.temperature,
+            self.model.max_tokens,
+            "\n".join([self.settings.language, goal, task]),
+            [analysis.dict()],
         )
+        return await self.single_flight.stream(scoped_key(key, self.model), call)
 
     async def create_tasks_agent(
         self,
@@ -174,28 +306,134 @@ class OpenAIAgentService(AgentService):
         }
 
         self.token_service.calculate_max_tokens(
-            self.model, prompt.format_prompt(**args).to_string()
+            self.model,
+            prompt_tokens=self.token_service.count_prompt(create_tasks_prompt, **args),
         )
 
         completion = await call_model_with_handling(
-            self.model, prompt, args, settings=self.settings, callbacks=self.callbacks
+            self.model,
+            prompt,
+            args,
+            settings=self.settings,
+            cache=self.completion_cache,
+            single_flight=self.single_flight,
+            callbacks=self.callbacks,
         )
 
-        previous_tasks = (completed_tasks or []) + tasks
+        previous_tasks = self._previous_tasks((completed_tasks or []) + tasks)
         return [completion] if completion not in previous_tasks else []
 
+    async def create_and_analyze_task_agent(
+        self,
+        *,
+        goal: str,
+        tasks: List[str],
+        last_task: str,
+        result: str,
+        completed_tasks: Optional[List[str]] = None,
+        tool_names: List[str],
+    ) -> List[Tuple[str, Analysis]]:
+        user_tools = list(
+            dict.fromkeys(await get_user_tools(tool_names, self.user, self.oauth_crud))
+        )
+        prompt = ChatPromptTemplate.from_messages(
+            [SystemMessagePromptTemplate(prompt=create_analyze_task_prompt)]
+        )
+        args = {
+            "goal": goal,
+            "language": self.settings.language,
+            "tasks": "\n".join(tasks),
+            "lastTask": last_task,
+            "result": result,
+        }
+        formatted_prompt = prompt.format_prompt(**args)
+        functions = [get_create_task_function(user_tools)]
+
+        prompt_tokens = self.token_service.count_prompt(
+            create_analyze_task_prompt, **args
+        )
+        self.token_service.calculate_max_tokens(
+            self.model, prompt_tokens=prompt_tokens, functions=functions
+        )
+
+        function_call = await call_function_with_handling(
+            self.model,
+            formatted_prompt.to_messages(),
+            functions,
+            settings=self.settings,
+            cache=self.completion_cache,
+            single_flight=self.single_flight,
+            callbacks=self.callbacks,
+            function_call={"name": CREATE_TASK_FUNCTION},
+        )
+
+        try:
+            arguments: Dict[str, Any] = json.loads(function_call.get("arguments", ""))
+            task = str(arguments.get("task") or "")
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.error(f"Error parsing created task: {str(e)}")
+            return []
+
+        # Same clean up and dedup as tasks created through create_tasks_agent
+        task_output_parser = TaskOutputParser(
+            completed_tasks=[],
+            index=self._previous_tasks((completed_tasks or []) + tasks),
+        )
+        new_tasks = parse_with_handling(task_output_parser, json.dumps([task]))
+        if not new_tasks:
+            return []
+
+        task = new_tasks[0]
+        return [(task, self._parse_analysis(goal, task, arguments, user_tools))]
+
+    def _previous_tasks(self, tasks: List[str]) -> TaskIndex:
+        """The index of the run's tasks, extended rather than rebuilt per step"""
+        if self.task_index is None:
+            return TaskIndex(tasks)
+
+        self.task_index.update(tasks)
+        return self.task_index
+
+    def _parse_analysis(
+        self,
+        goal: str,
+        task: str,
+        arguments: Dict[str, Any],
+        tools: List[Type[Tool]],
+    ) -> Analysis:
+        try:
+            analysis = Analysis(
+                action=arguments["action"],
+                arg=arguments["arg"],
+                reasoning=arguments["reasoning"],
+            )
+            if analysis.action in [get_tool_name(tool) for tool in tools]:
+                return analysis
+        except (KeyError, ValidationError) as e:
+            logger.error(f"Error parsing analysis of created task: {str(e)}")
+
+        fast_analysis = (
+            self.fast_path.route(goal, task, tools) if self.fast_path else None
+        )
+        return fast_analysis or Analysis.get_default_analysis(task)
+
     async def summarize_task_agent(
         self,
         *,
         goal: str,
         results: List[str],
     ) -> FastAPIStreamingResponse:
-        self.model.model_name = "gpt-3.5-turbo-16k"
-        self.model.max_tokens = 8000  # Total tokens = prompt tokens + completion tokens
-
-        snippet_max_tokens = 7000  # Leave room for the rest of the prompt
-        text_tokens = self.token_service.tokenize("".join(results))
-        text = self.token_service.detokenize(text_tokens[0:snippet_max_tokens])
+        spec = get_model_spec(self.model.model_name)
+        # The summary gets up to half of the window, the results what is left of it
+        self.model.max_tokens = min(spec.max_output_tokens, spec.context_window // 2)
+        prompt_tokens = self.token_service.count_prompt(
+            summarize_prompt, goal=goal, language=self.settings.language, text=""
+        )
+        snippet_max_tokens = min(
+            SUMMARY_SNIPPET_TOKENS,
+            spec.context_window - self.model.max_tokens - prompt_tokens,
+        )
+        text = "".join(self.token_service.truncate_all(results, snippet_max_tokens))
         logger.info(f"Summarizing text: {text}")
 
         return summarize(
@@ -205,26 +443,89 @@ class OpenAIAgentService(AgentService):
             text=text,
         )
 
+    async def fold_summary_agent(
+        self,
+        *,
+        goal: str,
+        summary: str,
+        results: List[str],
+    ) -> str:
+        # Folds run alongside other steps, which keep their own max_tokens
+        model = self.model.copy(update={"max_tokens": SUMMARY_MAX_TOKENS})
+        for text in self._summary_chunks(results):
+            args = {
+                "goal": goal,
+                "language": self.settings.language,
+                "summary": summary,
+                "text": text,
+            }
+
+            model.max_tokens = SUMMARY_MAX_TOKENS
+            self.token_service.calculate_max_tokens(
+                model,
+                prompt_tokens=self.token_service.count_prompt(
+                    fold_summary_prompt, **args
+                ),
+            )
+
+            summary = await call_model_with_handling(
+                model,
+                fold_summary_prompt,
+                args,
+                settings=self.settings,
+                callbacks=self.callbacks,
+            )
+
+        return summary
+
+    def _summary_chunks(self, results: List[str]) -> List[str]:
+        chunks: List[str] = []
+        chunk: List[str] = []
+        chunk_tokens = 0
+
+        for result in results:
+            tokens = self.token_service.count_up_to(result, SUMMARY_CHUNK_TOKENS)
+            if tokens > SUMMARY_CHUNK_TOKENS:
+                tokens = SUMMARY_CHUNK_TOKENS
+                result = self.token_service.truncate(result, SUMMARY_CHUNK_TOKENS)
+
+            if chunk and chunk_tokens + tokens > SUMMARY_CHUNK_TOKENS:
+                chunks.append("\n\n".join(chunk))
+                chunk, chunk_tokens = [], 0
+
+            chunk.append(result)
+            chunk_tokens += tokens
+
+        if chunk:
+            chunks.append("\n\n".join(chunk))
+        return chunks
+
     async def chat(
         self,
         *,
         message: str,
         results: List[str],
     ) -> FastAPIStreamingResponse:
-        self.model.model_name = "gpt-3.5-turbo-16k"
+        system_tokens = self.token_service.count_prompt(
+            chat_prompt, language=self.settings.language
+        )
+        budget = self.context_packer.budget(
+            self.model.model_name, message, prompt_tokens=system_tokens
+        )
+        context = self.context_packer.pack(message, results, budget)
+
         prompt = ChatPromptTemplate.from_messages(
             [
                 SystemMessagePromptTemplate(prompt=chat_prompt),
-                *[HumanMessage(content=result) for result in results],
+                *[HumanMessage(content=result) for result in context],
                 HumanMessage(content=message),
             ]
         )
 
+        # Packed results were already counted (and cached) by the packer
+        context_tokens = sum(self.context_packer.count(result) for result in context)
         self.token_service.calculate_max_tokens(
-            self.model,
-            prompt.format_prompt(
-                language=self.settings.language,
-            ).to_string(),
+            self.model, message, prompt_tokens=system_tokens + context_tokens
         )
 
         chain = LLMChain(llm=self.model, prompt=prompt)
@@ -234,3 +535,40 @@ class OpenAIAgentService(AgentService):
             {"language": self.settings.language},
             media_type="text/event-stream",
         )
+
+
+def parse_batch_analysis(
+    completion: str, count: int, tools: List[Type[Tool]]
+) -> List[Optional[Analysis]]:
+    """
+    Parse the arguments of a batch analysis function call into `count` analyses.
+    Entries that are missing or invalid are left as None
+    """
+    analyses: List[Optional[Analysis]] = [None] * count
+    tool_names = [get_tool_name(tool) for tool in tools]
+
+    try:
+        items = json.loads(completion).get("analyses", [])
+    except (json.JSONDecodeError, AttributeError) as e:
+        logger.error(f"Error parsing batch analysis: {str(e)}")
+        logger.error(f"Completion: {completion}")
+        return analyses
+
+    for item in items if isinstance(items, list) else []:
+        try:
+            index = int(item["task"]) - 1
+            analysis = Analysis(
+                action=item["action"],
+                arg=item["arg"],
+                reasoning=item["reasoning"],
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            # ValidationError is a ValueError
+            logger.error(f"Error parsing analysis {item}: {str(e)}")
+            continue
+
+        if 0 <= index < count and analyses[index] is None:
+            if analysis.action in tool_names:
+                analyses[index] = analysis
+
+    return analyses
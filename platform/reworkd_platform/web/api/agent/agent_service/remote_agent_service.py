@@ -0,0 +1,149 @@
+import inspect
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, get_type_hints
+
+from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
+from pydantic import parse_obj_as
+from pydantic.json import pydantic_encoder
+
+from reworkd_platform.schemas.agent import LLM_Model, ModelSettings
+from reworkd_platform.schemas.user import UserBase
+from reworkd_platform.services.step_queue.dispatcher import StepDispatcher
+from reworkd_platform.services.step_queue.jobs import StepEvent, StepJob
+from reworkd_platform.web.api.agent.agent_service.agent_service import (
+    AgentService,
+    Analysis,
+)
+from reworkd_platform.web.api.agent.streaming import stream_text
+from reworkd_platform.web.api.errors import PlatformaticError, StepWorkerError
+
+STEP_METHODS = {
+    name
+    for name, value in vars(AgentService).items()
+    if inspect.iscoroutinefunction(value) and not name.startswith("_")
+}
+
+
+def _hints(method: str) -> Dict[str, Any]:
+    if method not in STEP_METHODS:
+        raise ValueError(f"'{method}' is not a step of the AgentService")
+    return get_type_hints(getattr(AgentService, method))
+
+
+def _encode(value: Any) -> Any:
+    return json.loads(json.dumps(value, default=pydantic_encoder))
+
+
+def _is_stream(method: str) -> bool:
+    return _hints(method)["return"] is FastAPIStreamingResponse
+
+
+class RemoteAgentService(AgentService):
+    """
+    Runs every step on a step worker instead of in the API process.
+    Streaming steps are relayed chunk by chunk as the worker produces them.
+    """
+
+    def __init__(
+        self,
+        dispatcher: StepDispatcher,
+        model_settings: ModelSettings,
+        user: UserBase,
+        run_id: Optional[str] = None,
+        streaming: bool = False,
+        llm_model: Optional[LLM_Model] = None,
+    ):
+        self.dispatcher = dispatcher
+        self.model_settings = model_settings
+        self.user = user
+        self.run_id = run_id
+        self.streaming = streaming
+        self.llm_model = llm_model
+
+    async def start_goal_agent(self, **kwargs: Any) -> List[str]:
+        return await self._call("start_goal_agent", kwargs)
+
+    async def start_goal_agent_stream(self, **kwargs: Any) -> FastAPIStreamingResponse:
+        return await self._call("start_goal_agent_stream", kwargs)
+
+    async def analyze_task_agent(self, **kwargs: Any) -> Analysis:
+        return await self._call("analyze_task_agent", kwargs)
+
+    async def analyze_tasks_agent(self, **kwargs: Any) -> List[Analysis]:
+        return await self._call("analyze_tasks_agent", kwargs)
+
+    async def execute_task_agent(self, **kwargs: Any) -> FastAPIStreamingResponse:
+        return await self._call("execute_task_agent", kwargs)
+
+    async def create_tasks_agent(self, **kwargs: Any) -> List[str]:
+        return await self._call("create_tasks_agent", kwargs)
+
+    async def create_and_analyze_task_agent(
+        self, **kwargs: Any
+    ) -> List[Tuple[str, Analysis]]:
+        return await self._call("create_and_analyze_task_agent", kwargs)
+
+    async def summarize_task_agent(self, **kwargs: Any) -> FastAPIStreamingResponse:
+        return await self._call("summarize_task_agent", kwargs)
+
+    async def fold_summary_agent(self, **kwargs: Any) -> str:
+        return await self._call("fold_summary_agent", kwargs)
+
+    async def chat(self, **kwargs: Any) -> FastAPIStreamingResponse:
+        return await self._call("chat", kwargs)
+
+    async def _call(self, method: str, kwargs: Dict[str, Any]) -> Any:
+        job = StepJob.create(
+            self.model_settings,
+            method=method,
+            kwargs=_encode(kwargs),
+            user_id=self.user.id,
+            run_id=self.run_id,
+            streaming=self.streaming,
+            llm_model=self.llm_model,
+        )
+        events = self.dispatcher.submit(job)
+
+        # Errors before the first chunk fail the request like a local step would
+        event = await events.__anext__()
+        if event.type == "error":
+            await events.aclose()
+            raise StepWorkerError(
+                RuntimeError(event.data), event.data, event.code, should_log=False
+            )
+
+        if not _is_stream(method):
+            await events.aclose()
+            return parse_obj_as(_hints(method)["return"], json.loads(event.data))
+
+        async def body(event: StepEvent) -> AsyncIterator[bytes]:
+            try:
+                while not event.done:
+                    yield event.data.encode()
+                    event = await events.__anext__()
+                if event.type == "error":
+                    yield event.data.encode()
+            finally:
+                await events.aclose()
+
+        return FastAPIStreamingResponse(body(event), media_type="text/event-stream")
+
+
+async def execute_step(service: AgentService, job: StepJob) -> AsyncIterator[StepEvent]:
+    """Call the method of a job on a local service and yield its events"""
+    try:
+        hints = _hints(job.method)
+        kwargs = {
+            name: parse_obj_as(hints[name], value) for name, value in job.kwargs.items()
+        }
+        result = await getattr(service, job.method)(**kwargs)
+
+        if isinstance(result, FastAPIStreamingResponse):
+            async for text in stream_text(result):
+                yield StepEvent(job_id=job.id, type="chunk", data=text)
+            yield StepEvent(job_id=job.id, type="result")
+        else:
+            data = json.dumps(result, default=pydantic_encoder)
+            yield StepEvent(job_id=job.id, type="result", data=data)
+    except PlatformaticError as e:
+        yield StepEvent(job_id=job.id, type="error", data=e.detail, code=e.code)
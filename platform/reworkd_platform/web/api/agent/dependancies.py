@@ -1,6 +1,6 @@
-from typing import TypeVar
+from typing import List, Optional, TypeVar
 
-from fastapi import Body, Depends
+from fastapi import Body, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from reworkd_platform.db.crud.agent import AgentCRUD
@@ -9,17 +9,31 @@ from reworkd_platform.schemas.agent import (
     AgentChat,
     AgentRun,
     AgentRunCreate,
+    AgentRunLoop,
     AgentSummarize,
     AgentTaskAnalyze,
     AgentTaskCreate,
+    AgentTaskCreateAnalyze,
     AgentTaskExecute,
+    AgentTasksAnalyze,
     Loop_Step,
 )
 from reworkd_platform.schemas.user import UserBase
+from reworkd_platform.web.api.agent.fast_path import FastPathRouter
+from reworkd_platform.web.api.agent.task_index import TaskIndexCache
 from reworkd_platform.web.api.dependencies import get_current_user
 
+CREATE_STATE = ["tasks", "completed_tasks", "last_task", "result"]
+
 T = TypeVar(
-    "T", AgentTaskAnalyze, AgentTaskExecute, AgentTaskCreate, AgentSummarize, AgentChat
+    "T",
+    AgentTaskAnalyze,
+    AgentTasksAnalyze,
+    AgentTaskExecute,
+    AgentTaskCreate,
+    AgentTaskCreateAnalyze,
+    AgentSummarize,
+    AgentChat,
 )
 
 
@@ -45,8 +59,43 @@ async def agent_start_validator(
     return AgentRun(**body.dict(), run_id=str(id_))
 
 
+async def agent_run_validator(
+    body: AgentRunLoop = Body(
+        example={
+            "goal": "Create business plan for a bagel company",
+            "tool_names": ["image"],
+            "modelSettings": {
+                "customModelName": "gpt-3.5-turbo",
+            },
+        },
+    ),
+    crud: AgentCRUD = Depends(agent_crud),
+) -> AgentRunLoop:
+    body.run_id = (await crud.create_run(body.goal)).id
+    return body
+
+
 async def validate(body: T, crud: AgentCRUD, type_: Loop_Step) -> T:
-    body.run_id = (await crud.create_task(body.run_id, type_)).id
+    await crud.create_task(body.run_id, type_)
+    return body
+
+
+async def load_run_state(body: T, crud: AgentCRUD, fields: List[str]) -> T:
+    """Fill in the fields the client left out from the state stored with the run"""
+    missing = [field for field in fields if getattr(body, field) is None]
+    if not missing or not body.run_id:
+        return body
+
+    state = await crud.get_run_state(body.run_id)
+    values = {
+        "tasks": state.tasks,
+        "completed_tasks": state.completed_tasks,
+        "results": state.results,
+        "last_task": state.completed_tasks[-1] if state.completed_tasks else "",
+        "result": state.results[-1] if state.results else "",
+    }
+    for field in missing:
+        setattr(body, field, values[field])
     return body
 
 
@@ -57,6 +106,22 @@ async def agent_analyze_validator(
     return await validate(body, crud, "analyze")
 
 
+async def agent_analyze_batch_validator(
+    body: AgentTasksAnalyze = Body(
+        example={
+            "goal": "Create business plan for a bagel company",
+            "tasks": ["Research the bagel market", "Draw a logo for the company"],
+            "tool_names": ["image"],
+        },
+    ),
+    crud: AgentCRUD = Depends(agent_crud),
+) -> AgentTasksAnalyze:
+    # Each task counts as an analyze step, as if analyzed one at a time
+    for _ in body.tasks[1:]:
+        await crud.create_task(body.run_id, "analyze")
+    return await validate(body, crud, "analyze")
+
+
 async def agent_execute_validator(
     body: AgentTaskExecute = Body(
         example={
@@ -74,10 +139,36 @@ async def agent_execute_validator(
     return await validate(body, crud, "execute")
 
 
+async def agent_analyze_execute_validator(
+    body: AgentTaskAnalyze = Body(
+        example={
+            "goal": "Perform tasks accurately",
+            "task": "Write code to make a platformer",
+            "tool_names": ["code"],
+        },
+    ),
+    crud: AgentCRUD = Depends(agent_crud),
+) -> AgentTaskAnalyze:
+    # Counts as both steps so loop limits match the separate endpoints
+    await crud.create_task(body.run_id, "analyze")
+    return await validate(body, crud, "execute")
+
+
 async def agent_create_validator(
     body: AgentTaskCreate = Body(),
     crud: AgentCRUD = Depends(agent_crud),
 ) -> AgentTaskCreate:
+    await load_run_state(body, crud, CREATE_STATE)
+    return await validate(body, crud, "create")
+
+
+async def agent_create_analyze_validator(
+    body: AgentTaskCreateAnalyze = Body(),
+    crud: AgentCRUD = Depends(agent_crud),
+) -> AgentTaskCreateAnalyze:
+    await load_run_state(body, crud, CREATE_STATE)
+    # Counts as both steps so loop limits match the separate endpoints
+    await crud.create_task(body.run_id, "analyze")
     return await validate(body, crud, "create")
 
 
@@ -85,6 +176,7 @@ async def agent_summarize_validator(
     body: AgentSummarize = Body(),
     crud: AgentCRUD = Depends(agent_crud),
 ) -> AgentSummarize:
+    await load_run_state(body, crud, ["results"])
     return await validate(body, crud, "summarize")
 
 
@@ -92,4 +184,13 @@ async def agent_chat_validator(
     body: AgentChat = Body(),
     crud: AgentCRUD = Depends(agent_crud),
 ) -> AgentChat:
+    await load_run_state(body, crud, ["results"])
     return await validate(body, crud, "chat")
+
+
+def get_fast_path(request: Request) -> Optional[FastPathRouter]:
+    return request.app.state.fast_path
+
+
+def get_task_indexes(request: Request) -> TaskIndexCache:
+    return request.app.state.task_indexes
@@ -0,0 +1,232 @@
+import json
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Type
+
+from pydantic import BaseModel
+
+from reworkd_platform.web.api.agent.analysis import Analysis
+from reworkd_platform.web.api.agent.tools.calculator import Calculator
+from reworkd_platform.web.api.agent.tools.image import Image
+from reworkd_platform.web.api.agent.tools.notion import Notion
+from reworkd_platform.web.api.agent.tools.tool import Tool
+from reworkd_platform.web.api.agent.tools.tools import get_tool_name
+
+
+class RuleMatch(BaseModel):
+    analysis: Analysis
+    confidence: float
+
+
+class FastPathRule(ABC):
+    """
+    A deterministic check that can pick a tool for a task without asking the LLM.
+    Rules only fire for tools the user actually has available.
+    """
+
+    name: str
+    tool: Type[Tool]
+
+    @abstractmethod
+    def match(self, goal: str, task: str) -> Optional[RuleMatch]:
+        pass
+
+    def _analysis(self, reasoning: str, arg: str, confidence: float) -> RuleMatch:
+        return RuleMatch(
+            analysis=Analysis(
+                action=get_tool_name(self.tool),
+                arg=arg,
+                reasoning=reasoning,
+            ),
+            confidence=confidence,
+        )
+
+
+NOTION_URL = re.compile(r"https?://(?:[\w-]+\.)?notion\.(?:so|site)/\S+", re.I)
+NOTION_WRITE = re.compile(r"\b(?:add|append|create|insert|list|update)\b", re.I)
+NOTION_ID = re.compile(
+    r"([0-9a-f]{32}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})",
+    re.I,
+)
+
+
+class NotionUrlRule(FastPathRule):
+    name = "notion_url"
+    tool = Notion
+
+    def match(self, goal: str, task: str) -> Optional[RuleMatch]:
+        url = NOTION_URL.search(task)
+        if not url:
+            return None
+
+        # Only reads are obvious, anything else needs the LLM to pick the action
+        if NOTION_WRITE.search(NOTION_URL.sub("", task)):
+            return None
+
+        path = url.group(0).split("?")[0].rstrip("/.,)")
+        id_match = NOTION_ID.search(path.split("/")[-1])
+        database_id = id_match.group(0) if id_match else path.split("/")[-1]
+
+        return self._analysis(
+            "The task links to a Notion page, so I'll read it from Notion",
+            json.dumps(
+                {"action": "read_database", "params": {"database_id": database_id}}
+            ),
+            confidence=1.0,
+        )
+
+
+MATH_FUNCTIONS = "sqrt|sin|cos|tan|log10|log|abs|round|pow|min|max|pi|e"
+MATH_PREFIX = re.compile(
+    r"^(?:please\s+)?(?:calculate|compute|evaluate|solve|what\s+is|what's)\s*:?\s*",
+    re.I,
+)
+MATH_EXPRESSION = re.compile(
+    rf"^(?:\s|\d+(?:\.\d+)?|\.\d+|[-+*/^%(),]|\b(?:{MATH_FUNCTIONS})\b)+$"
+)
+MATH_OPERATION = re.compile(rf"[-+*/^%]|\b(?:{MATH_FUNCTIONS})\s*\(")
+THOUSANDS_SEPARATOR = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+
+
+class ArithmeticRule(FastPathRule):
+    name = "arithmetic"
+    tool = Calculator
+
+    def match(self, goal: str, task: str) -> Optional[RuleMatch]:
+        expression = MATH_PREFIX.sub("", task.strip()).rstrip("?.= ").strip()
+        expression = THOUSANDS_SEPARATOR.sub("", expression)
+        if not (
+            MATH_EXPRESSION.match(expression)
+            and MATH_OPERATION.search(expression)
+            and re.search(r"\d|\bpi\b|\be\b", expression)
+            and not has_top_level_comma(expression)
+        ):
+            return None
+
+        return self._analysis(
+            "The task is a plain arithmetic expression",
+            expression,
+            confidence=0.95,
+        )
+
+
+def has_top_level_comma(expression: str) -> bool:
+    """Commas outside of function arguments would evaluate to a tuple"""
+    depth = 0
+    for char in expression:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth <= 0:
+            return True
+    return False
+
+
+IMAGE_NOUNS = (
+    r"(?:image|picture|photo|drawing|illustration|sketch|painting|logo|icon"
+    r"|portrait|poster|artwork|cartoon|wallpaper)s?"
+)
+IMAGE_REQUEST = re.compile(
+    r"^\s*(?:please\s+)?"
+    r"(?:draw|sketch|paint|generate|create|make|produce|render|design)\s+(?:me\s+)?"
+    r"(?:an?\s+|the\s+|some\s+)?(?:(?!of\b)[\w-]+\s+){0,2}?"
+    rf"{IMAGE_NOUNS}\b",
+    re.I,
+)
+DRAWING_REQUEST = re.compile(
+    r"^\s*(?:please\s+)?(?:draw|sketch|paint)\s+(?:me\s+)?(?:an?|the|some)\s+\w",
+    re.I,
+)
+# Drawing verbs are mostly used figuratively in tasks
+IMAGE_IDIOM = re.compile(
+    r"\b(?:draw|sketch|paint)\s+(?:up|out|on|upon|from)\b"
+    r"|\bpaint\s+(?:an?\s+|the\s+)?(?:\w+\s+)?picture\b"
+    r"|\b(?:plan|strategy|outline|roadmap|proposal|timeline|budget|framework"
+    r"|conclusions?|comparisons?|distinction|parallels?|attention|inspiration)\b",
+    re.I,
+)
+
+
+class ImageRequestRule(FastPathRule):
+    name = "image_request"
+    tool = Image
+
+    def match(self, goal: str, task: str) -> Optional[RuleMatch]:
+        if IMAGE_IDIOM.search(task):
+            return None
+
+        if IMAGE_REQUEST.match(task):
+            confidence = 0.9
+        elif DRAWING_REQUEST.match(task):
+            # "Draw a cat" is an image, but "Draw a comparison" isn't
+            confidence = 0.8
+        else:
+            return None
+
+        return self._analysis(
+            "The task asks for an image to be drawn",
+            task.strip(),
+            confidence=confidence,
+        )
+
+
+def get_fast_path_rules() -> List[FastPathRule]:
+    return [NotionUrlRule(), ArithmeticRule(), ImageRequestRule()]
+
+
+class FastPathStats(BaseModel):
+    evaluated: int
+    short_circuited: Dict[str, int]
+
+
+class FastPathRouter:
+    """
+    Runs deterministic rules before the analysis LLM call. The first rule that
+    fires with at least `min_confidence` decides the Analysis; otherwise the
+    caller falls back to the LLM.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Sequence[FastPathRule]] = None,
+        min_confidence: float = 0.9,
+    ):
+        self.rules = list(get_fast_path_rules() if rules is None else rules)
+        self.min_confidence = min_confidence
+        self.evaluated = 0
+        self.short_circuited: Counter[str] = Counter()
+
+    @classmethod
+    def from_names(
+        cls, names: Optional[List[str]], min_confidence: float
+    ) -> "FastPathRouter":
+        rules = get_fast_path_rules()
+        if names is not None:
+            rules = [rule for rule in rules if rule.name in names]
+        return cls(rules, min_confidence)
+
+    def route(
+        self, goal: str, task: str, tools: List[Type[Tool]]
+    ) -> Optional[Analysis]:
+        self.evaluated += 1
+
+        for rule in self.rules:
+            if rule.tool not in tools:
+                continue
+
+            match = rule.match(goal, task)
+            if match and match.confidence >= self.min_confidence:
+                self.short_circuited[rule.name] += 1
+                return match.analysis
+
+        return None
+
+    def stats(self) -> FastPathStats:
+        return FastPathStats(
+            evaluated=self.evaluated,
+            short_circuited={
+                rule.name: self.short_circuited[rule.name] for rule in self.rules
+            },
+        )
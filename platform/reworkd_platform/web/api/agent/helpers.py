@@ -1,8 +1,15 @@
-from typing import Any, Callable, Dict, TypeVar
+import json
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
 
 from langchain import BasePromptTemplate, LLMChain
 from langchain.chat_models.base import BaseChatModel
-from langchain.schema import BaseOutputParser, OutputParserException
+from langchain.schema import (
+    BaseMessage,
+    BaseOutputParser,
+    OutputParserException,
+    get_buffer_string,
+)
 from openai.error import (
     AuthenticationError,
     InvalidRequestError,
@@ -11,7 +18,12 @@ from openai.error import (
 )
 
 from reworkd_platform.schemas.agent import ModelSettings
-from reworkd_platform.web.api.errors import OpenAIError
+from reworkd_platform.services.completion_cache.cache import (
+    CompletionCache,
+    completion_key,
+)
+from reworkd_platform.services.singleflight.singleflight import SingleFlight, scoped_key
+from reworkd_platform.web.api.errors import OpenAIError, PlatformaticError
 
 T = TypeVar("T")
 
@@ -30,6 +42,8 @@ async def openai_error_handler(
 ) -> Any:
     try:
         return await func(*args, **kwargs)
+    except PlatformaticError:
+        raise
     except ServiceUnavailableError as e:
         raise OpenAIError(
             e,
@@ -65,12 +79,84 @@ async def openai_error_handler(
         )
 
 
+async def call_with_reuse(
+    model: BaseChatModel,
+    prompt: str,
+    functions: Optional[Sequence[Any]],
+    call: Callable[[], Awaitable[str]],
+    cache: Optional[CompletionCache] = None,
+    single_flight: Optional[SingleFlight] = None,
+) -> str:
+    """
+    Serve a completion from the cache if allowed, otherwise make the call.
+    Identical calls already in flight are joined instead of being repeated.
+    """
+    temperature = getattr(model, "temperature", 0)
+    model_name = getattr(model, "model_name", model.__class__.__name__)
+    max_tokens = getattr(model, "max_tokens", None)
+    key = completion_key(model_name, temperature, max_tokens, prompt, functions)
+
+    upstream = call
+    if single_flight is not None:
+        upstream = partial(single_flight.do, scoped_key(key, model), call)
+
+    if cache is not None and cache.accepts(temperature):
+        return await cache.get_or_call(key, upstream)
+
+    return await upstream()
+
+
 async def call_model_with_handling(
     model: BaseChatModel,
     prompt: BasePromptTemplate,
     args: Dict[str, str],
     settings: ModelSettings,
+    cache: Optional[CompletionCache] = None,
+    single_flight: Optional[SingleFlight] = None,
     **kwargs: Any,
 ) -> str:
     chain = LLMChain(llm=model, prompt=prompt)
-    return await openai_error_handler(chain.arun, args, settings=settings, **kwargs)
+
+    async def call() -> str:
+        return await openai_error_handler(chain.arun, args, settings=settings, **kwargs)
+
+    return await call_with_reuse(
+        model,
+        prompt.format_prompt(**args).to_string(),
+        None,
+        call,
+        cache=cache,
+        single_flight=single_flight,
+    )
+
+
+async def call_function_with_handling(
+    model: BaseChatModel,
+    messages: List[BaseMessage],
+    functions: Sequence[Any],
+    settings: ModelSettings,
+    cache: Optional[CompletionCache] = None,
+    single_flight: Optional[SingleFlight] = None,
+    **kwargs: Any,
+) -> Dict[str, str]:
+    """Run a function calling completion and return the resulting function_call"""
+
+    async def call() -> str:
+        message = await openai_error_handler(
+            func=model.apredict_messages,
+            messages=messages,
+            functions=functions,
+            settings=settings,
+            **kwargs,
+        )
+        return json.dumps(message.additional_kwargs.get("function_call", {}))
+
+    completion = await call_with_reuse(
+        model,
+        get_buffer_string(messages),
+        functions,
+        call,
+        cache=cache,
+        single_flight=single_flight,
+    )
+    return json.loads(completion)
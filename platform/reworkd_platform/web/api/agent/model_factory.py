@@ -1,10 +1,39 @@
-from typing import Any, Dict, Optional, Tuple, Type, Union
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import (
+    Any,
+    AsyncIterator,
+    ContextManager,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
+from langchain.schema import BaseMessage, ChatResult, get_buffer_string
+from langchain.schema.output import ChatGenerationChunk
 from pydantic import Field
 
 from reworkd_platform.schemas.agent import LLM_Model, ModelSettings
 from reworkd_platform.schemas.user import UserBase
+from reworkd_platform.services.cancellation.meter import CancellationMeter
+from reworkd_platform.services.rate_limiter.limiter import (
+    RateLimiter,
+    Reservation,
+    rate_limit_key,
+)
+from reworkd_platform.services.transport.transport import LLMTransport
+from reworkd_platform.services.upstream.router import (
+    UPSTREAM_ERRORS,
+    Upstream,
+    UpstreamRouter,
+)
+from reworkd_platform.services.usage.meter import RunUsage
 from reworkd_platform.settings import Settings
 
 
@@ -15,6 +44,200 @@ class WrappedChatOpenAI(ChatOpenAI):
     )
     max_tokens: int
     model_name: LLM_Model = Field(alias="model")
+    transport: Optional[Any] = Field(
+        default=None,
+        exclude=True,
+        description="Shared LLMTransport whose pooled sessions requests go through",
+    )
+    rate_limiter: Optional[Any] = Field(
+        default=None,
+        exclude=True,
+        description="RateLimiter that requests must acquire capacity from",
+    )
+
+    upstream_router: Optional[Any] = Field(
+        default=None,
+        exclude=True,
+        description="UpstreamRouter used to fail over between the upstreams",
+    )
+    upstreams: List[Any] = Field(
+        default_factory=list,
+        exclude=True,
+        description="Equivalent API bases (and their headers) in preference order",
+    )
+    cancellation_meter: Optional[Any] = Field(
+        default=None,
+        exclude=True,
+        description="CancellationMeter that records completions cut short",
+    )
+    usage: Optional[Any] = Field(
+        default=None,
+        exclude=True,
+        description="RunUsage the tokens of every call are recorded against",
+    )
+
+    def _pooled_session(self, api_base: Optional[str] = None) -> ContextManager[Any]:
+        if self.transport is None:
+            return nullcontext()
+        return self.transport.bind(api_base or self.openai_api_base)
+
+    async def _reserve(
+        self, messages: List[BaseMessage], **kwargs: Any
+    ) -> Optional[Reservation]:
+        limiter: Optional[RateLimiter] = self.rate_limiter
+        if limiter is None:
+            return None
+
+        key = rate_limit_key(
+            self.openai_api_base or "",
+            self.openai_api_key or "",
+            getattr(self, "deployment_name", None),
+        )
+        return await limiter.acquire(key, prompt_text(messages, **kwargs))
+
+    def _record_cancelled(self, completion: str = "") -> None:
+        meter: Optional[CancellationMeter] = self.cancellation_meter
+        if meter is not None:
+            meter.record_completion(self.max_tokens, completion)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        stream: Optional[bool] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        agenerate = super()._agenerate
+        if stream if stream is not None else self.streaming:
+            # Streams are limited, pooled and routed in _astream
+            return await agenerate(
+                messages, stop=stop, run_manager=run_manager, stream=stream, **kwargs
+            )
+
+        async def generate(upstream: Optional[Upstream] = None) -> ChatResult:
+            overrides = upstream_overrides(upstream)
+            with self._pooled_session(overrides.get("api_base")):
+                return await agenerate(
+                    messages,
+                    stop=stop,
+                    run_manager=run_manager,
+                    stream=stream,
+                    **kwargs,
+                    **overrides,
+                )
+
+        reservation = await self._reserve(messages, **kwargs)
+        router: Optional[UpstreamRouter] = self.upstream_router
+        used: Optional[int] = 0  # Failed calls give back what they reserved
+        try:
+            if router and self.upstreams:
+                result = await router.call(self.upstreams, generate, hedge=True)
+            else:
+                result = await generate()
+            token_usage = (result.llm_output or {}).get("token_usage", {})
+            used = token_usage.get("total_tokens")
+        except asyncio.CancelledError:
+            self._record_cancelled()
+            raise
+        finally:
+            if reservation:
+                reservation.reconcile(used)
+
+        if self.usage:
+            await self.usage.record(
+                token_usage.get("prompt_tokens", 0),
+                token_usage.get("completion_tokens", 0),
+            )
+        return result
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        astream = super()._astream
+        reservation = await self._reserve(messages, **kwargs)
+        completion = ""
+        used = 0  # Failed streams give back what they reserved
+
+        router: Optional[UpstreamRouter] = self.upstream_router
+        candidates: List[Optional[Upstream]] = (
+            list(router.order(self.upstreams)) if router and self.upstreams else [None]
+        )
+
+        try:
+            for i, upstream in enumerate(candidates):
+                overrides = upstream_overrides(upstream)
+                health = router.health(upstream) if router and upstream else None
+                start = time.monotonic()
+                started = False
+
+                try:
+                    if health:
+                        health.start()
+                    with self._pooled_session(overrides.get("api_base")):
+                        async for chunk in astream(
+                            messages,
+                            stop=stop,
+                            run_manager=run_manager,
+                            **kwargs,
+                            **overrides,
+                        ):
+                            if health and not started:
+                                health.record_success(time.monotonic() - start)
+                            started = True
+                            completion += chunk.text
+                            yield chunk
+                    break
+                except UPSTREAM_ERRORS:
+                    if health and not started:
+                        health.record_failure()
+                    # Fail over only if nothing has been streamed yet
+                    if started or i == len(candidates) - 1:
+                        raise
+                finally:
+                    if health and not started:
+                        health.release()
+
+            limiter: Optional[RateLimiter] = self.rate_limiter
+            if reservation and limiter:
+                # Streams don't report usage, so count the completion ourselves
+                used = reservation.estimated + limiter.count(completion)
+        except (asyncio.CancelledError, GeneratorExit):
+            # The consumer went away, nothing more will be generated for it
+            self._record_cancelled(completion)
+            run_usage: Optional[RunUsage] = self.usage
+            if run_usage:
+                run_usage.record_in_background(
+                    run_usage.count(prompt_text(messages, **kwargs)),
+                    run_usage.count(completion),
+                )
+            raise
+        finally:
+            if reservation:
+                reservation.reconcile(used)
+
+        if self.usage:
+            await self.usage.record(
+                self.usage.count(prompt_text(messages, **kwargs)),
+                self.usage.count(completion),
+            )
+
+
+def prompt_text(messages: List[BaseMessage], **kwargs: Any) -> str:
+    """What a call sends as its prompt, for counting its tokens"""
+    return get_buffer_string(messages) + str(kwargs.get("functions", ""))
+
+
+def upstream_overrides(upstream: Optional[Upstream]) -> Dict[str, Any]:
+    """Request parameters that point a call at a specific upstream"""
+    if upstream is None:
+        return {}
+
+    return {"api_base": upstream.api_base, "headers": upstream.headers}
 
 
 class WrappedAzureChatOpenAI(AzureChatOpenAI, WrappedChatOpenAI):
@@ -32,6 +255,11 @@ def create_model(
     user: UserBase,
     streaming: bool = False,
     force_model: Optional[LLM_Model] = None,
+    transport: Optional[LLMTransport] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    upstream_router: Optional[UpstreamRouter] = None,
+    cancellation_meter: Optional[CancellationMeter] = None,
+    usage: Optional[RunUsage] = None,
 ) -> WrappedChat:
     use_azure = (
         not model_settings.custom_api_key and "azure" in settings.openai_api_base
@@ -49,6 +277,15 @@ def create_model(
         "streaming": streaming,
         "max_retries": 5,
         "model_kwargs": {"user": user.email, "headers": headers},
+        "transport": transport,
+        # Custom keys have their own (unknown) limits
+        "rate_limiter": None if model_settings.custom_api_key else rate_limiter,
+        "upstream_router": upstream_router,
+        "upstreams": get_upstreams(
+            settings, model_settings, base, headers, use_helicone
+        ),
+        "cancellation_meter": cancellation_meter,
+        "usage": usage,
     }
 
     if use_azure:
@@ -60,6 +297,10 @@ def create_model(
                 "deployment_name": deployment_name,
                 "openai_api_type": "azure",
                 "openai_api_base": base.rstrip("v1"),
+                "upstreams": [
+                    Upstream(u.api_base.rstrip("v1"), u.headers)
+                    for u in kwargs["upstreams"]  # type: ignore
+                ],
             }
         )
 
@@ -95,3 +336,25 @@ def get_base_and_headers(
     )
 
     return base, headers, use_helicone
+
+
+def get_upstreams(
+    settings_: Settings,
+    model_settings: ModelSettings,
+    base: str,
+    headers: Optional[Dict[str, str]],
+    use_helicone: bool,
+) -> List[Upstream]:
+    """
+    Equivalent bases a request can be sent to, in preference order.
+    Helicone only proxies to the provider, so the provider itself is the first
+    fallback, followed by the alternates configured for the platform key
+    """
+    upstreams = [Upstream(base, headers)]
+    if model_settings.custom_api_key:
+        return upstreams
+
+    if use_helicone:
+        upstreams.append(Upstream(settings_.openai_api_base))
+    upstreams.extend(Upstream(alt) for alt in settings_.upstream_fallback_bases)
+    return upstreams
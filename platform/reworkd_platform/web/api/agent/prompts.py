@@ -54,6 +54,26 @@ analyze_task_prompt = PromptTemplate(
     input_variables=["goal", "task", "language"],
 )
 
+analyze_tasks_prompt = PromptTemplate(
+    template="""
+    High level objective: "{goal}"
+    Tasks:
+    {tasks}
+
+    For every numbered task above, select the best function to accomplish it
+    and call "analyze_tasks" with one analysis per task.
+    Respond in the "{language}" language.
+
+    Special Instructions for Notion Tasks:
+    - When given a Notion URL (contains 'notion.so'), always use the 'notion' function
+    - Format its arg as a JSON string:
+      {{"action": "read_database", "params": {{"database_id": "extracted-id"}}}}
+
+    For search queries, provide the search term as a plain string.
+    """,
+    input_variables=["goal", "tasks", "language"],
+)
+
 code_prompt = PromptTemplate(
     template="""
     You are a world-class software engineer and an expert in all programing languages,
@@ -110,6 +130,31 @@ create_tasks_prompt = PromptTemplate(
     input_variables=["goal", "language", "tasks", "lastTask", "result"],
 )
 
+create_analyze_task_prompt = PromptTemplate(
+    template="""You are an AI task creation agent. You must answer in the "{language}"
+    language. You have the following objective `{goal}`.
+
+    You have the following incomplete tasks:
+    `{tasks}`
+
+    You just completed the following task:
+    `{lastTask}`
+
+    And received the following result:
+    `{result}`.
+
+    Based on this, create a single new task to be completed by your AI system such
+    that your goal is closer reached. If there are no more tasks to be done, return
+    an empty task. Do not add quotes to the task. Then select the best function to
+    accomplish the new task and call "create_task" with both.
+
+    When the new task involves a Notion URL (contains 'notion.so'), always use the
+    'notion' function with an arg formatted as a JSON string:
+    {{"action": "read_database", "params": {{"database_id": "extracted-id"}}}}
+    """,
+    input_variables=["goal", "language", "tasks", "lastTask", "result"],
+)
+
 summarize_prompt = PromptTemplate(
     template="""You must answer in the "{language}" language.
 
@@ -127,6 +172,26 @@ summarize_prompt = PromptTemplate(
     input_variables=["goal", "language", "text"],
 )
 
+fold_summary_prompt = PromptTemplate(
+    template="""You must answer in the "{language}" language.
+
+    You are keeping running notes of the results of the tasks done for the goal
+    "{goal}".
+
+    The current notes are:
+    "{summary}"
+
+    Update the notes with the following new results:
+    "{text}"
+
+    Keep every fact, figure, name and link relevant to the goal and drop repetition.
+    Write the notes as concise markdown bullet points.
+    You will not make up information or add any information outside of the above text.
+    Respond with the updated notes only.
+    """,
+    input_variables=["goal", "language", "summary", "text"],
+)
+
 company_context_prompt = PromptTemplate(
     template="""You must answer in the "{language}" language.
 
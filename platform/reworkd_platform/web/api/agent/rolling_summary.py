@@ -0,0 +1,91 @@
+from typing import List, Optional
+
+from loguru import logger
+
+from reworkd_platform.db.crud.agent import AgentCRUD
+from reworkd_platform.schemas.agent import RunSummary
+from reworkd_platform.web.api.agent.agent_service.agent_service import AgentService
+
+# Results left out of the summary before folding them is worth an extra call
+MIN_FOLD_RESULTS = 5
+
+
+async def fold_results(
+    service: AgentService,
+    goal: str,
+    summary: RunSummary,
+    results: List[str],
+) -> RunSummary:
+    """
+    Fold the results completed since the summary's checkpoint into it.
+    Results are append only, so the checkpoint is an index into them.
+    """
+    tail = results[summary.checkpoint :]
+    if not tail:
+        return summary
+
+    return RunSummary(
+        summary=await service.fold_summary_agent(
+            goal=goal,
+            summary=summary.summary,
+            results=tail,
+        ),
+        checkpoint=len(results),
+    )
+
+
+def summary_inputs(summary: RunSummary, results: List[str]) -> List[str]:
+    """The rolling summary followed by the results it doesn't cover yet"""
+    head = [summary.summary] if summary.summary else []
+    return head + results[summary.checkpoint :]
+
+
+async def get_run_summary(
+    crud: AgentCRUD, run_id: str, results: List[str]
+) -> RunSummary:
+    """The summary stored with a run, if it was made from these results"""
+    summary = await crud.get_run_summary(run_id)
+    if summary.checkpoint > len(results):
+        # The client sent results that don't match the ones stored with the run
+        return RunSummary()
+    return summary
+
+
+async def update_run_summary(
+    service: AgentService,
+    crud: AgentCRUD,
+    run_id: str,
+    goal: str,
+    results: Optional[List[str]] = None,
+    min_results: int = 1,
+) -> RunSummary:
+    """
+    Bring the rolling summary stored with a run up to date with its results,
+    once at least `min_results` of them aren't part of it yet
+    """
+    if results is None:
+        results = (await crud.get_run_state(run_id)).results
+
+    summary = await get_run_summary(crud, run_id, results)
+    if len(results) - summary.checkpoint < min_results:
+        return summary
+
+    updated = await fold_results(service, goal, summary, results)
+    if updated is not summary:
+        await crud.save_run_summary(run_id, updated)
+    return updated
+
+
+async def update_run_summary_in_background(
+    service: AgentService,
+    crud: AgentCRUD,
+    run_id: str,
+    goal: str,
+) -> None:
+    """Keeps the summary from falling far behind, /summarize reads the rest as is"""
+    try:
+        await update_run_summary(
+            service, crud, run_id, goal, min_results=MIN_FOLD_RESULTS
+        )
+    except Exception as e:
+        logger.warning(f"Failed to update the summary of run {run_id}: {e}")
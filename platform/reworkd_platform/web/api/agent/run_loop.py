@@ -0,0 +1,302 @@
+import asyncio
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
+from loguru import logger
+from pydantic import BaseModel
+
+from reworkd_platform.db.crud.agent import AgentCRUD
+from reworkd_platform.schemas.agent import AgentRunLoop, Loop_Step, RunSummary
+from reworkd_platform.services.scheduler.scheduler import (
+    RunScheduler,
+    TaskGraph,
+    TaskNode,
+)
+from reworkd_platform.settings import settings
+from reworkd_platform.web.api.agent.agent_service.agent_service import AgentService
+from reworkd_platform.web.api.agent.analysis import Analysis
+from reworkd_platform.web.api.agent.rolling_summary import (
+    MIN_FOLD_RESULTS,
+    fold_results,
+    summary_inputs,
+)
+from reworkd_platform.web.api.agent.streaming import stream_text
+from reworkd_platform.web.api.agent.task_index import TaskIndex
+from reworkd_platform.web.api.errors import MaxLoopsError, PlatformaticError
+
+Run_Event_Type = Literal[
+    "run",
+    "task",
+    "analysis",
+    "output",
+    "task_done",
+    "summary",
+    "error",
+    "done",
+]
+
+
+class RunEvent(BaseModel):
+    """A typed server sent event of a server driven run"""
+
+    type: Run_Event_Type
+    run_id: str
+    task_id: Optional[str] = None
+    task: Optional[str] = None
+    analysis: Optional[Analysis] = None
+    text: Optional[str] = None
+
+    def sse(self) -> bytes:
+        data = self.json(exclude_none=True)
+        return f"event: {self.type}\ndata: {data}\n\n".encode()
+
+
+class RunLoop:
+    """
+    Drives a whole agent run (start, analyze, execute, create, ..., summarize)
+    on the server, emitting a RunEvent for every step.
+
+    Tasks form a TaskGraph: the tasks from the start step are independent and
+    run concurrently, tasks created from a result depend on the task that
+    produced it. Events of concurrently running tasks are interleaved and
+    tagged with their task id. A task that fails emits an error event, like
+    the client loop the rest of the run carries on without it.
+
+    Every step is recorded through AgentCRUD like its endpoint would, so
+    max_loops is enforced exactly as for client driven runs. Created tasks
+    that nearly repeat any task of the run are dropped.
+
+    Results are folded into a rolling summary in the background once enough
+    of them are left out of it. The summarize step reads the summary together
+    with the results it doesn't cover yet.
+    """
+
+    def __init__(
+        self,
+        run: AgentRunLoop,
+        service: AgentService,
+        crud: AgentCRUD,
+        scheduler: Optional[RunScheduler[RunEvent]] = None,
+    ):
+        self.run = run
+        self.run_id = run.run_id or ""
+        self.service = service
+        self.crud = crud
+        self.scheduler = scheduler or RunScheduler(
+            max_concurrency=1, max_tasks=settings.max_loops
+        )
+        self.graph = TaskGraph()
+        # Every task of the run, to drop near duplicates across branches
+        self.index = TaskIndex()
+        self.completed_tasks: List[str] = []
+        self.results: List[str] = []
+        self.analyses: Dict[str, Analysis] = {}
+        self.summary = RunSummary()
+        # The DB session can't be shared by concurrent operations
+        self._db_lock = asyncio.Lock()
+        self._summary_lock = asyncio.Lock()
+        self._folds: Set["asyncio.Task[None]"] = set()
+
+    def event(self, type_: Run_Event_Type, **kwargs: Any) -> RunEvent:
+        return RunEvent(type=type_, run_id=self.run_id, **kwargs)
+
+    def task_event(
+        self, type_: Run_Event_Type, node: TaskNode, **kwargs: Any
+    ) -> RunEvent:
+        return self.event(type_, task_id=node.id, task=node.task, **kwargs)
+
+    async def step(self, type_: Loop_Step) -> None:
+        async with self._db_lock:
+            await self.crud.create_task(self.run_id, type_)
+            await self.crud.session.commit()
+
+    async def add_tasks(self, *nodes: TaskNode) -> None:
+        async with self._db_lock:
+            await self.crud.add_run_tasks(self.run_id, [node.task for node in nodes])
+
+    async def complete(self, node: TaskNode, result: str) -> None:
+        async with self._db_lock:
+            await self.crud.complete_run_task(self.run_id, node.task, result)
+
+    async def fold(self) -> None:
+        """Fold the results completed so far into the rolling summary"""
+        async with self._summary_lock:
+            summary = await fold_results(
+                self.service, self.run.goal, self.summary, list(self.results)
+            )
+            if summary is self.summary:
+                return
+
+            self.summary = summary
+            async with self._db_lock:
+                await self.crud.save_run_summary(self.run_id, summary)
+
+    def fold_in_background(self) -> None:
+        if len(self.results) - self.summary.checkpoint < MIN_FOLD_RESULTS:
+            return
+
+        async def fold() -> None:
+            try:
+                await self.fold()
+            except Exception as e:
+                # The summarize step retries whatever wasn't folded
+                logger.warning(
+                    f"Failed to update the summary of run {self.run_id}: {e}"
+                )
+
+        task = asyncio.create_task(fold())
+        self._folds.add(task)
+        task.add_done_callback(self._folds.discard)
+
+    async def events(self) -> AsyncIterator[RunEvent]:
+        try:
+            async for event in self._events():
+                yield event
+        finally:
+            # Nobody is left to read the summary once the run is over
+            for task in list(self._folds):
+                task.cancel()
+
+    async def _events(self) -> AsyncIterator[RunEvent]:
+        yield self.event("run")
+
+        try:
+            async for event in self.loop():
+                yield event
+        except MaxLoopsError as e:
+            yield self.event("error", text=e.detail)
+        except PlatformaticError as e:
+            yield self.event("error", text=e.detail)
+            return
+
+        if self.results:
+            async for event in self.summarize():
+                yield event
+
+        yield self.event("done")
+
+    async def loop(self) -> AsyncIterator[RunEvent]:
+        tasks = await self.service.start_goal_agent(goal=self.run.goal)
+        for task in tasks:
+            self.index.add(task)
+        nodes = [self.graph.add(task) for task in tasks]
+        await self.add_tasks(*nodes)
+        for node in nodes:
+            yield self.task_event("task", node)
+
+        async for event in self.scheduler.run(self.graph, self.process):
+            yield event
+
+    async def process(self, node: TaskNode) -> AsyncIterator[RunEvent]:
+        try:
+            async for event in self._process(node):
+                yield event
+        except MaxLoopsError:
+            raise
+        except PlatformaticError as e:
+            yield self.task_event("error", node, text=e.detail)
+
+    async def _process(self, node: TaskNode) -> AsyncIterator[RunEvent]:
+        # Tasks run concurrently, each sizes its completions on its own model
+        service = self.service.copy()
+
+        analysis = self.analyses.pop(node.id, None)
+        if analysis is None:
+            await self.step("analyze")
+            analysis = await service.analyze_task_agent(
+                goal=self.run.goal,
+                task=node.task,
+                tool_names=self.run.tool_names,
+            )
+        yield self.task_event("analysis", node, analysis=analysis)
+
+        await self.step("execute")
+        result = ""
+        response = await service.execute_task_agent(
+            goal=self.run.goal,
+            task=node.task,
+            analysis=analysis,
+        )
+        async for text in stream_text(response):
+            result += text
+            yield self.task_event("output", node, text=text)
+
+        self.completed_tasks.append(node.task)
+        self.results.append(result)
+        await self.complete(node, result)
+        self.fold_in_background()
+        yield self.task_event("task_done", node)
+
+        async for event in self.create(service, node, result):
+            yield event
+
+    def open_tasks(self, exclude: TaskNode) -> List[str]:
+        return [
+            node.task
+            for node in self.graph.nodes.values()
+            if node.id not in self.graph.completed and node.id != exclude.id
+        ]
+
+    async def create(
+        self, service: AgentService, parent: TaskNode, result: str
+    ) -> AsyncIterator[RunEvent]:
+        await self.step("create")
+        kwargs: Dict[str, Any] = {
+            "goal": self.run.goal,
+            "tasks": self.open_tasks(exclude=parent),
+            "last_task": parent.task,
+            "result": result,
+        }
+
+        if self.run.fused:
+            # The analysis of the new task comes with it, skipping a step
+            await self.step("analyze")
+            created: Sequence[Tuple[str, Optional[Analysis]]]
+            created = await service.create_and_analyze_task_agent(
+                **kwargs, tool_names=self.run.tool_names
+            )
+        else:
+            new_tasks = await service.create_tasks_agent(**kwargs)
+            created = [(task, None) for task in new_tasks]
+
+        for task, analysis in created:
+            if task in self.index:
+                continue
+            self.index.add(task)
+
+            node = self.graph.add(task, depends_on=[parent.id])
+            if analysis is not None:
+                self.analyses[node.id] = analysis
+            await self.add_tasks(node)
+            yield self.task_event("task", node)
+
+    async def summarize(self) -> AsyncIterator[RunEvent]:
+        try:
+            await self.step("summarize")
+            await asyncio.gather(*self._folds)
+            response = await self.service.summarize_task_agent(
+                goal=self.run.goal,
+                results=summary_inputs(self.summary, self.results),
+            )
+            async for text in stream_text(response):
+                yield self.event("summary", text=text)
+        except PlatformaticError as e:
+            yield self.event("error", text=e.detail)
+
+    def stream(self) -> FastAPIStreamingResponse:
+        async def body() -> AsyncIterator[bytes]:
+            async for event in self.events():
+                logger.debug(f"Run {self.run_id}: {event.type}")
+                yield event.sse()
+
+        return FastAPIStreamingResponse(body(), media_type="text/event-stream")
@@ -0,0 +1,78 @@
+from typing import AsyncIterator, Callable
+
+from fastapi import FastAPI
+
+from reworkd_platform.db.crud.oauth import OAuthCrud
+from reworkd_platform.db.crud.user import UserCrud
+from reworkd_platform.schemas.agent import AgentRun
+from reworkd_platform.schemas.user import UserBase
+from reworkd_platform.services.step_queue.jobs import StepEvent, StepJob
+from reworkd_platform.services.step_queue.lifetime import create_broker
+from reworkd_platform.services.step_queue.worker import StepWorker
+from reworkd_platform.settings import settings
+from reworkd_platform.web.api.agent.agent_service.agent_service_provider import (
+    get_agent_service,
+)
+from reworkd_platform.web.api.agent.agent_service.remote_agent_service import (
+    execute_step,
+)
+from reworkd_platform.web.lifetime import init_state, shutdown_state
+
+
+def step_executor(app: FastAPI) -> Callable[[StepJob], AsyncIterator[StepEvent]]:
+    """Runs jobs on the same services an API request would use"""
+    state = app.state
+
+    async def execute(job: StepJob) -> AsyncIterator[StepEvent]:
+        async with state.db_session_factory() as session:
+            user = await UserCrud(session).get_user(job.user_id)
+            service = get_agent_service(
+                None,  # type: ignore
+                streaming=job.streaming,
+                llm_model=job.llm_model,
+            )(
+                run=AgentRun(
+                    goal="", model_settings=job.get_model_settings(), run_id=job.run_id
+                ),
+                user=UserBase(
+                    id=user.id, name=user.name, email=user.email, image=user.image
+                ),
+                token_service=state.token_service,
+                oauth_crud=OAuthCrud(session),
+                transport=state.llm_transport,
+                completion_cache=state.completion_cache,
+                single_flight=state.single_flight,
+                rate_limiter=state.rate_limiter,
+                upstream_router=state.upstream_router,
+                fast_path=state.fast_path,
+                context_packer=state.context_packer,
+                cancellation_meter=state.cancellation_meter,
+                step_dispatcher=None,
+                usage_meter=state.usage_meter,
+                task_indexes=state.task_indexes,
+            )
+
+            async for event in execute_step(service, job):
+                yield event
+
+    return execute
+
+
+async def run_worker() -> None:  # pragma: no cover
+    app = FastAPI()
+    init_state(app)
+
+    broker = create_broker()
+    await broker.start()
+    try:
+        await StepWorker(
+            broker,
+            step_executor(app),
+            jobs_topic=settings.kafka_steps_topic,
+            results_topic=settings.kafka_step_results_topic,
+            group=f"{settings.kafka_consumer_group}-steps",
+            concurrency=settings.step_worker_concurrency,
+        ).run()
+    finally:
+        await broker.stop()
+        await shutdown_state(app)
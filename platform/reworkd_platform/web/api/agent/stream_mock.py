@@ -1,10 +1,11 @@
 import asyncio
 from typing import AsyncGenerator
 
-import tiktoken
 from fastapi import FastAPI
 from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
 
+from reworkd_platform.services.tokenizer.encodings import get_encoding
+
 app = FastAPI()
 
 
@@ -16,7 +17,7 @@ def stream_string(data: str, delayed: bool = False) -> FastAPIStreamingResponse:
 
 async def stream_generator(data: str, delayed: bool) -> AsyncGenerator[bytes, None]:
     if delayed:
-        encoding = tiktoken.get_encoding("cl100k_base")
+        encoding = get_encoding()
         token_data = encoding.encode(data)
 
         for token in token_data:
@@ -0,0 +1,164 @@
+import asyncio
+import codecs
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
+from lanarky.responses import StreamingResponse as LanarkyStreamingResponse
+from lanarky.responses.streaming import openai_aiosession
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+
+from reworkd_platform.services.cancellation.meter import CancellationMeter
+from reworkd_platform.services.singleflight.body import iter_body
+from reworkd_platform.web.api.errors import ClientDisconnectedError
+
+T = TypeVar("T")
+
+
+class StreamingResponse(LanarkyStreamingResponse):
+    """
+    Lanarky response whose chain is cancelled when the client disconnects.
+
+    Lanarky gathers the stream and the disconnect listener, which doesn't cancel
+    one when the other finishes: the chain would run to completion for nobody,
+    and the listener would wait for a disconnect after the stream ended.
+    Cancelling the chain cancels the upstream completion request with it.
+
+    A chain that fails still ends the body with its error like in Lanarky, but
+    the error is raised afterwards so the response isn't mistaken for a success.
+    """
+
+    @openai_aiosession
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stream = asyncio.create_task(self.stream_response(send))
+        disconnect = asyncio.create_task(self.listen_for_disconnect(receive))
+
+        try:
+            await asyncio.wait(
+                {stream, disconnect}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            for task in (stream, disconnect):
+                task.cancel()
+            await asyncio.gather(stream, disconnect, return_exceptions=True)
+
+        if not stream.cancelled() and (error := stream.exception()):
+            raise error
+
+        if self.background is not None:
+            await self.background()
+
+    async def stream_response(self, send: Send) -> None:
+        failure: Optional[Exception] = None
+        chain_executor = self.chain_executor
+
+        async def execute(send: Send) -> Any:
+            nonlocal failure
+            try:
+                return await chain_executor(send)
+            except Exception as e:
+                failure = e
+                raise
+
+        self.chain_executor = execute
+        try:
+            await super().stream_response(send)
+        finally:
+            self.chain_executor = chain_executor
+
+        if failure:
+            raise failure
+
+
+async def until_disconnected(
+    request: Request,
+    awaitable: Awaitable[T],
+    meter: Optional[CancellationMeter] = None,
+) -> T:
+    """
+    Await `awaitable`, cancelling it (and the requests it has in flight) when the
+    client disconnects first.
+    """
+    task = asyncio.ensure_future(awaitable)
+    disconnect = asyncio.create_task(wait_for_disconnect(request))
+
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    if task.cancelled():
+        if meter:
+            meter.record_request()
+        raise ClientDisconnectedError(
+            ConnectionAbortedError(), "Client disconnected", 499, should_log=False
+        )
+
+    return task.result()
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    # Reading the body first (it is cached) keeps the loop from swallowing it
+    try:
+        await request.body()
+    except ClientDisconnect:
+        return
+
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def stream_text(response: FastAPIStreamingResponse) -> AsyncIterator[str]:
+    # Chunks may split multi-byte characters
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    async for chunk in iter_body(response):
+        if text := decoder.decode(chunk):
+            yield text
+
+    if text := decoder.decode(b"", final=True):
+        yield text
+
+
+def stream_with_header(
+    header: str, response: FastAPIStreamingResponse
+) -> FastAPIStreamingResponse:
+    """Stream `header` on its own line, followed by the body of `response`"""
+
+    async def body() -> AsyncIterator[bytes]:
+        yield (header + "\n").encode()
+        async for chunk in iter_body(response):
+            yield chunk
+
+    return FastAPIStreamingResponse(
+        body(),
+        status_code=response.status_code,
+        media_type=response.media_type,
+        background=response.background,
+    )
+
+
+def on_stream_complete(
+    response: FastAPIStreamingResponse,
+    callback: Callable[[bytes], Awaitable[None]],
+) -> FastAPIStreamingResponse:
+    """Stream `response` and pass its full body to `callback` once it finishes"""
+
+    async def body() -> AsyncIterator[bytes]:
+        chunks = []
+        async for chunk in iter_body(response):
+            chunks.append(chunk)
+            yield chunk
+        await callback(b"".join(chunks))
+
+    return FastAPIStreamingResponse(
+        body(),
+        status_code=response.status_code,
+        media_type=response.media_type,
+        background=response.background,
+    )
@@ -0,0 +1,178 @@
+import hashlib
+import random
+import re
+from collections import OrderedDict, defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from reworkd_platform.settings import settings
+
+WORD = re.compile(r"\w+")
+STOP_WORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "for", "from", "in",
+    "into", "is", "it", "its", "of", "on", "or", "that", "the", "their", "them",
+    "then", "this", "to", "with",
+}  # fmt: skip
+# Give the word after them a role, "to London" isn't "from London"
+DIRECTIONS = {"from", "to", "into", "onto", "than", "before", "after", "versus", "vs"}
+SUFFIXES = ("ing", "ed", "es", "s")
+
+# 16 bands of 2 rows: pairs above ~0.3 similarity almost always share a bucket
+NUM_PERMUTATIONS = 32
+ROWS_PER_BAND = 2
+PRIME = (1 << 61) - 1
+
+_rng = random.Random(0)
+PERMUTATIONS = [
+    (_rng.randrange(1, PRIME), _rng.randrange(0, PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def stem(word: str) -> str:
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def normalize(task: str) -> FrozenSet[str]:
+    """
+    The set of stemmed content words of a task. Word order is ignored, except
+    that a directional word is kept with the word it points to, so that
+    "from NYC to London" and "from London to NYC" differ.
+    """
+    words = set()
+    direction = None
+    for word in WORD.findall(task.lower()):
+        if word in DIRECTIONS:
+            direction = word
+        elif word not in STOP_WORDS:
+            word = stem(word)
+            words.add(word)
+            if direction:
+                words.add(f"{direction}:{word}")
+                direction = None
+    return frozenset(words)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+
+
+def signature(words: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [_hash(word) for word in words]
+    return tuple(
+        min((a * h + b) % PRIME for h in hashes) if hashes else 0
+        for a, b in PERMUTATIONS
+    )
+
+
+class TaskIndex:
+    """
+    Finds near duplicate tasks of a run locally, without an embeddings API.
+
+    Tasks are reduced to a set of normalised words and compared by Jaccard
+    similarity. A MinHash signature split into bands (locality sensitive
+    hashing) narrows a lookup down to the few tasks that share a band, so the
+    cost doesn't grow with the number of tasks in the run.
+    """
+
+    def __init__(
+        self,
+        tasks: Iterable[str] = (),
+        threshold: Optional[float] = None,
+    ):
+        self.threshold = (
+            settings.task_similarity_threshold if threshold is None else threshold
+        )
+        self._tasks: List[Tuple[str, FrozenSet[str]]] = []
+        self._added: Set[str] = set()
+        self._exact: Dict[FrozenSet[str], int] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = defaultdict(list)
+
+        for task in tasks:
+            self.add(task)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __contains__(self, task: object) -> bool:
+        return isinstance(task, str) and self.find(task) is not None
+
+    def add(self, task: str) -> None:
+        self._added.add(task)
+        words = normalize(task)
+        i = len(self._tasks)
+        self._tasks.append((task, words))
+        self._exact.setdefault(words, i)
+        for key in self._bands(words):
+            self._buckets[key].append(i)
+
+    def update(self, tasks: Iterable[str]) -> None:
+        """Add the tasks that weren't added before"""
+        for task in tasks:
+            if task not in self._added:
+                self.add(task)
+
+    def find(self, task: str) -> Optional[str]:
+        """A previously added task similar enough to count as the same task"""
+        words = normalize(task)
+        if (i := self._exact.get(words)) is not None:
+            return self._tasks[i][0]
+
+        if self.threshold >= 1:
+            return None
+
+        seen = set()
+        for key in self._bands(words):
+            for i in self._buckets.get(key, []):
+                if i in seen:
+                    continue
+                seen.add(i)
+
+                other, other_words = self._tasks[i]
+                if jaccard(words, other_words) >= self.threshold:
+                    return other
+
+        return None
+
+    @staticmethod
+    def _bands(words: FrozenSet[str]) -> List[Tuple[int, Tuple[int, ...]]]:
+        if not words:
+            return []
+
+        sig = signature(words)
+        return [
+            (band, sig[start : start + ROWS_PER_BAND])
+            for band, start in enumerate(range(0, NUM_PERMUTATIONS, ROWS_PER_BAND))
+        ]
+
+
+class TaskIndexCache:
+    """
+    The TaskIndex of recently active runs, so that the steps of a run extend
+    one index instead of rebuilding it from all of the run's tasks.
+    """
+
+    def __init__(self, max_runs: int = 1000):
+        self.max_runs = max_runs
+        self._indexes: "OrderedDict[str, TaskIndex]" = OrderedDict()
+
+    def get(self, run_id: str) -> TaskIndex:
+        if (index := self._indexes.get(run_id)) is not None:
+            self._indexes.move_to_end(run_id)
+            return index
+
+        index = self._indexes[run_id] = TaskIndex()
+        while len(self._indexes) > self.max_runs:
+            self._indexes.popitem(last=False)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._indexes)
@@ -1,9 +1,12 @@
 import ast
+import json
 import re
-from typing import List
+from typing import AsyncIterator, List, Optional
 
 from langchain.schema import BaseOutputParser, OutputParserException
 
+from reworkd_platform.web.api.agent.task_index import TaskIndex
+
 
 class TaskOutputParser(BaseOutputParser[List[str]]):
     """
@@ -12,10 +15,17 @@ class TaskOutputParser(BaseOutputParser[List[str]]):
     """
 
     completed_tasks: List[str] = []
+    index: Optional[TaskIndex] = None
 
-    def __init__(self, *, completed_tasks: List[str]):
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(
+        self, *, completed_tasks: List[str], index: Optional[TaskIndex] = None
+    ):
         super().__init__()
         self.completed_tasks = completed_tasks
+        self.index = TaskIndex(completed_tasks) if index is None else index
 
     def parse(self, text: str) -> List[str]:
         try:
@@ -23,11 +33,24 @@ class TaskOutputParser(BaseOutputParser[List[str]]):
             all_tasks = [
                 remove_prefix(task) for task in array_str if real_tasks_filter(task)
             ]
-            return [task for task in all_tasks if task not in self.completed_tasks]
+            return self.dedup(all_tasks)
         except Exception as e:
             msg = f"Failed to parse tasks from completion '{text}'. Exception: {e}"
             raise OutputParserException(msg)
 
+    def dedup(self, tasks: List[str], seen: Optional[TaskIndex] = None) -> List[str]:
+        """
+        Drop tasks that (nearly) repeat a completed task or an earlier one.
+        The tasks that are kept are added to `seen`, never to the index.
+        """
+        seen = TaskIndex() if seen is None else seen
+        new_tasks = []
+        for task in tasks:
+            if task not in seen and (self.index is None or task not in self.index):
+                seen.add(task)
+                new_tasks.append(task)
+        return new_tasks
+
     def get_format_instructions(self) -> str:
         return """
         The response should be a JSON array of strings. Example:
@@ -38,6 +61,86 @@ class TaskOutputParser(BaseOutputParser[List[str]]):
         """
 
 
+class TaskStreamParser:
+    """
+    Parses the JSON array of tasks of a completion while it is being streamed.
+    Each task is emitted as soon as its closing quote arrives. Completions that
+    turn out not to contain an array are parsed as a whole once complete.
+    """
+
+    def __init__(self, *, completed_tasks: List[str]):
+        self.parser = TaskOutputParser(completed_tasks=completed_tasks)
+        self.emitted = TaskIndex()
+        self.text = ""
+        self._in_array = False
+        self._started = False
+        self._done = False
+        self._quote: Optional[str] = None
+        self._escaped = False
+        self._raw = ""
+
+    def feed(self, chunk: str) -> List[str]:
+        """The tasks completed by this chunk of the completion"""
+        self.text += chunk
+        tasks: List[str] = []
+        for char in chunk:
+            if self._done:
+                break
+
+            if self._quote is None:
+                if not self._in_array:
+                    self._in_array = char == "["
+                elif char in "\"'":
+                    self._quote, self._raw = char, ""
+                    self._started = True
+                elif not self._started:
+                    # Only a bracket followed by a string opens the task array
+                    self._in_array = char == "[" or char.isspace()
+                elif char == "]":
+                    self._done = True
+            elif self._escaped:
+                self._raw += char
+                self._escaped = False
+            elif char == "\\":
+                self._raw += char
+                self._escaped = True
+            elif char == self._quote:
+                tasks.extend(self._emit(decode_string(self._raw, self._quote)))
+                self._quote = None
+            else:
+                self._raw += char
+
+        return tasks
+
+    def finish(self) -> List[str]:
+        """Tasks of a completion that didn't contain an array"""
+        if self._started:
+            return []
+        return self.parser.parse(self.text)
+
+    async def parse_stream(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        async for chunk in chunks:
+            for task in self.feed(chunk):
+                yield task
+
+        for task in self.finish():
+            yield task
+
+    def _emit(self, task: str) -> List[str]:
+        if not real_tasks_filter(task):
+            return []
+        return self.parser.dedup([remove_prefix(task)], self.emitted)
+
+
+def decode_string(raw: str, quote: str) -> str:
+    try:
+        if quote == '"':
+            return json.loads(f'"{raw}"')
+        return ast.literal_eval(f"'{raw}'")
+    except (ValueError, SyntaxError):
+        return raw
+
+
 def extract_array(input_str: str) -> List[str]:
     regex = (
         r"\[\s*\]|"  # Empty array check
@@ -11,6 +11,9 @@ from reworkd_platform.web.api.agent.agent_service.agent_service_provider import
 from reworkd_platform.web.api.agent.analysis import Analysis
 from reworkd_platform.web.api.agent.dependancies import agent_analyze_validator
 
+# Routes named like a test module, not tests
+__test__ = False
+
 router = APIRouter()
 
 class TestRequest(BaseModel):
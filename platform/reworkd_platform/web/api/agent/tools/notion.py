@@ -1,5 +1,5 @@
 from typing import Any, Optional, Dict, List
-from notion_client import Client
+from notion_client import AsyncClient
 from lanarky.responses import StreamingResponse
 from reworkd_platform.settings import settings
 from reworkd_platform.web.api.agent.stream_mock import stream_string
@@ -28,11 +28,9 @@ class Notion(Tool):
         "3. Or create entry: {'action': 'create_entry', 'params': {'database_id': 'abc123', 'title': 'New Entry'}}"
     )
     image_url = "/tools/notion.svg"
+    coalescable = False
 
-    def __init__(self):
-        self.notion = None
-        if settings.notion_api_key:
-            self.notion = Client(auth=settings.notion_api_key)
+    notion: AsyncClient
 
     @staticmethod
     def available() -> bool:
@@ -42,9 +40,9 @@ class Notion(Tool):
     async def dynamic_available(user: UserBase, oauth_crud: OAuthCrud) -> bool:
         return bool(settings.notion_api_key)
 
-    def _get_title_property(self, database_id: str) -> str:
+    async def _get_title_property(self, database_id: str) -> str:
         """Get the name of the title property in a database"""
-        db_info = self.notion.databases.retrieve(database_id)
+        db_info = await self.notion.databases.retrieve(database_id)
         for prop_name, prop_info in db_info.get('properties', {}).items():
             if prop_info.get('type') == 'title':
                 return prop_name
@@ -57,11 +55,11 @@ class Notion(Tool):
             database_id = database_id.split('?')[0].strip()
             
             # Get database structure
-            db_info = self.notion.databases.retrieve(database_id)
-            title_prop = self._get_title_property(database_id)
+            db_info = await self.notion.databases.retrieve(database_id)
+            title_prop = await self._get_title_property(database_id)
             
             # Query entries
-            query_result = self.notion.databases.query(
+            query_result = await self.notion.databases.query(
                 database_id=database_id,
                 page_size=10
             )
@@ -92,10 +90,10 @@ class Notion(Tool):
             database_id = database_id.split('?')[0].strip()
             
             # Get the title property name
-            title_prop = self._get_title_property(database_id)
+            title_prop = await self._get_title_property(database_id)
             
             # Create the entry
-            new_page = self.notion.pages.create(
+            new_page = await self.notion.pages.create(
                 parent={"database_id": database_id},
                 properties={
                     title_prop: {
@@ -120,9 +118,10 @@ class Notion(Tool):
     async def _list_databases(self) -> str:
         """List available Notion databases"""
         try:
-            results = self.notion.search(
+            response = await self.notion.search(
                 filter={"property": "object", "value": "database"}
-            ).get('results', [])
+            )
+            results = response.get('results', [])
             
             if not results:
                 return "No databases found. Make sure you've shared your databases with the integration."
@@ -146,9 +145,15 @@ class Notion(Tool):
         user: UserBase,
         oauth_crud: OAuthCrud,
     ) -> StreamingResponse:
-        if not self.notion:
+        if not settings.notion_api_key:
             return stream_string("Error: Notion API key not configured")
 
+        # Async, so the requests are cancelled with the task awaiting them.
+        # The client only lives for the call, so its connections are closed
+        async with AsyncClient(auth=settings.notion_api_key) as self.notion:
+            return await self._call(input_str)
+
+    async def _call(self, input_str: str) -> StreamingResponse:
         try:
             # If input looks like a URL, extract the database ID
             if "notion.so" in input_str and "?" in input_str:
@@ -1,4 +1,5 @@
-from typing import Type, TypedDict
+from functools import lru_cache
+from typing import Dict, List, Type, TypedDict
 
 from reworkd_platform.web.api.agent.tools.tool import Tool
 from reworkd_platform.web.api.agent.tools.tools import get_tool_name
@@ -11,33 +12,115 @@ class FunctionDescription(TypedDict):
     """The name of the function."""
     description: str
     """A description of the function."""
-    parameters: dict[str, object]
+    parameters: Dict[str, object]
     """The parameters of the function."""
 
 
+BATCH_ANALYSIS_FUNCTION = "analyze_tasks"
+CREATE_TASK_FUNCTION = "create_task"
+
+
+@lru_cache(maxsize=None)
 def get_tool_function(tool: Type[Tool]) -> FunctionDescription:
-    """A function that will return the tool's function specification"""
+    """
+    A function that will return the tool's function specification.
+    Specs are built once per tool and shared, they must not be modified.
+    """
     name = get_tool_name(tool)
 
     return {
         "name": name,
         "description": tool.description,
+        "parameters": {
+            "type": "object",
+            "properties": get_analysis_properties(tool.arg_description),
+            "required": ["reasoning", "arg"],
+        },
+    }
+
+
+def get_batch_analysis_function(tools: List[Type[Tool]]) -> FunctionDescription:
+    """A single function that assigns one of the tools to each of many tasks"""
+    return {
+        "name": BATCH_ANALYSIS_FUNCTION,
+        "description": "Select the best function for each of the tasks.",
         "parameters": {
             "type": "object",
             "properties": {
-                "reasoning": {
-                    "type": "string",
-                    "description": (
-                        f"Reasoning is how the task will be accomplished with the current function. "
-                        "Detail your overall plan along with any concerns you have."
-                        "Ensure this reasoning value is in the user defined langauge "
-                    ),
+                "analyses": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "task": {
+                                "type": "integer",
+                                "description": "The number of the task",
+                            },
+                            "action": get_action_property(tools),
+                            **get_analysis_properties(
+                                "The argument to pass to the chosen function."
+                            ),
+                        },
+                        "required": ["task", "action", "reasoning", "arg"],
+                    },
                 },
-                "arg": {
+            },
+            "required": ["analyses"],
+        },
+    }
+
+
+def get_create_task_function(tools: List[Type[Tool]]) -> FunctionDescription:
+    """A function that creates the next task together with its analysis"""
+    return {
+        "name": CREATE_TASK_FUNCTION,
+        "description": "Create the next task and select the function to complete it.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "task": {
                     "type": "string",
-                    "description": tool.arg_description,
+                    "description": "The new task. Empty if no more tasks are needed.",
                 },
+                "action": get_action_property(tools),
+                **get_analysis_properties(
+                    "The argument to pass to the chosen function."
+                ),
             },
-            "required": ["reasoning", "arg"],
+            "required": ["task", "action", "reasoning", "arg"],
+        },
+    }
+
+
+def get_action_property(tools: List[Type[Tool]]) -> Dict[str, object]:
+    tool_descriptions = "\n".join(
+        f"'{get_tool_name(tool)}': {tool.description} Arg: {tool.arg_description}"
+        for tool in tools
+    )
+
+    return {
+        "type": "string",
+        "enum": [get_tool_name(tool) for tool in tools],
+        "description": (
+            "The function to use for the task. "
+            f"Available functions:\n{tool_descriptions}"
+        ),
+    }
+
+
+def get_analysis_properties(arg_description: str) -> Dict[str, object]:
+    return {
+        "reasoning": {
+            "type": "string",
+            "description": (
+                "Reasoning is how the task will be accomplished with the current "
+                "function. "
+                "Detail your overall plan along with any concerns you have."
+                "Ensure this reasoning value is in the user defined langauge "
+            ),
+        },
+        "arg": {
+            "type": "string",
+            "description": arg_description,
         },
     }
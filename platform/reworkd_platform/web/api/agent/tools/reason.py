@@ -1,9 +1,9 @@
 from typing import Any
 
 from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
-from lanarky.responses import StreamingResponse
 from langchain import LLMChain
 
+from reworkd_platform.web.api.agent.streaming import StreamingResponse
 from reworkd_platform.web.api.agent.tools.tool import Tool
 
 
@@ -79,6 +79,7 @@ class SID(Tool):
         "The query to search for. It should be a question in natural language."
     )
     image_url = "/tools/sid.png"
+    coalescable = False
 
     @staticmethod
     def available() -> bool:
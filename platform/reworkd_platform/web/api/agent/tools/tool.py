@@ -13,6 +13,9 @@ class Tool(ABC):
     public_description: str = ""
     arg_description: str = "The argument to the function."
     image_url: str = "/tools/openai-white.png"
+    # Whether concurrent identical calls may share a single execution. Disable for
+    # tools whose output depends on the user or that have side effects
+    coalescable: bool = True
 
     model: BaseChatModel
     language: str
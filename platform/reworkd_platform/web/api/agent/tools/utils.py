@@ -2,10 +2,11 @@ from dataclasses import dataclass
 from typing import List
 
 from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
-from lanarky.responses import StreamingResponse
 from langchain import LLMChain
 from langchain.chat_models.base import BaseChatModel
 
+from reworkd_platform.web.api.agent.streaming import StreamingResponse
+
 
 @dataclass
 class CitedSnippet:
@@ -1,33 +1,65 @@
-from typing import List, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Union
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends, Request
 from fastapi.responses import StreamingResponse as FastAPIStreamingResponse
+from langchain.schema import OutputParserException
 from pydantic import BaseModel
 
+from reworkd_platform.db.crud.agent import AgentCRUD
 from reworkd_platform.schemas.agent import (
     AgentChat,
     AgentRun,
+    AgentRunLoop,
     AgentSummarize,
     AgentTaskAnalyze,
     AgentTaskCreate,
+    AgentTaskCreateAnalyze,
     AgentTaskExecute,
-    NewTasksResponse,
+    AgentTasksAnalyze,
     ModelSettings,
+    NewAnalyzedTasksResponse,
+    NewTasksResponse,
+    Usage,
 )
+from reworkd_platform.schemas.user import UserBase
+from reworkd_platform.services.cancellation.dependencies import get_cancellation_meter
+from reworkd_platform.services.cancellation.meter import CancellationMeter
+from reworkd_platform.services.scheduler.dependencies import get_run_slots
+from reworkd_platform.services.scheduler.scheduler import KeyedSemaphore, RunScheduler
+from reworkd_platform.settings import settings
 from reworkd_platform.web.api.agent.agent_service.agent_service import AgentService
 from reworkd_platform.web.api.agent.agent_service.agent_service_provider import (
     get_agent_service,
 )
 from reworkd_platform.web.api.agent.analysis import Analysis
 from reworkd_platform.web.api.agent.dependancies import (
+    agent_analyze_batch_validator,
+    agent_analyze_execute_validator,
     agent_analyze_validator,
     agent_chat_validator,
+    agent_create_analyze_validator,
     agent_create_validator,
+    agent_crud,
     agent_execute_validator,
+    agent_run_validator,
     agent_start_validator,
     agent_summarize_validator,
 )
+from reworkd_platform.web.api.agent.rolling_summary import (
+    get_run_summary,
+    summary_inputs,
+    update_run_summary_in_background,
+)
+from reworkd_platform.web.api.agent.run_loop import RunEvent, RunLoop
+from reworkd_platform.web.api.agent.streaming import (
+    on_stream_complete,
+    stream_text,
+    stream_with_header,
+    until_disconnected,
+)
+from reworkd_platform.web.api.agent.task_output_parser import TaskStreamParser
 from reworkd_platform.web.api.agent.tools.tools import get_external_tools, get_tool_name
+from reworkd_platform.web.api.dependencies import get_current_user
 
 router = APIRouter()
 
@@ -37,9 +69,69 @@ router = APIRouter()
 async def start_tasks(
     req_body: AgentRun = Depends(agent_start_validator),
     agent_service: AgentService = Depends(get_agent_service(agent_start_validator)),
+    crud: AgentCRUD = Depends(agent_crud),
 ) -> NewTasksResponse:
     new_tasks = await agent_service.start_goal_agent(goal=req_body.goal)
-    return NewTasksResponse(newTasks=new_tasks, run_id=req_body.run_id)
+    await crud.add_run_tasks(req_body.run_id or "", new_tasks)
+    return NewTasksResponse(newTasks=new_tasks, run_id=req_body.run_id or "")
+
+
+@router.post("/start-stream")
+async def start_tasks_stream(
+    req_body: AgentRun = Depends(agent_start_validator),
+    agent_service: AgentService = Depends(
+        get_agent_service(validator=agent_start_validator, streaming=True)
+    ),
+    crud: AgentCRUD = Depends(agent_crud),
+) -> FastAPIStreamingResponse:
+    """
+    Like /start, but every task is sent as a `task` server sent event as soon as
+    the model has written it, so the first task can be analyzed while the
+    others are still being generated. The stream ends with a `done` event.
+    """
+    response = await agent_service.start_goal_agent_stream(goal=req_body.goal)
+    run_id = req_body.run_id or ""
+
+    async def body() -> AsyncIterator[bytes]:
+        yield RunEvent(type="run", run_id=run_id).sse()
+
+        parser = TaskStreamParser(completed_tasks=[])
+        try:
+            async for task in parser.parse_stream(stream_text(response)):
+                await crud.add_run_tasks(run_id, [task])
+                yield RunEvent(type="task", run_id=run_id, task=task).sse()
+        except OutputParserException:
+            text = "There was an issue parsing the response from the AI model."
+            yield RunEvent(type="error", run_id=run_id, text=text).sse()
+            return
+
+        yield RunEvent(type="done", run_id=run_id).sse()
+
+    return FastAPIStreamingResponse(body(), media_type="text/event-stream")
+
+
+@router.post("/run")
+async def run_agent(
+    req_body: AgentRunLoop = Depends(agent_run_validator),
+    agent_service: AgentService = Depends(
+        get_agent_service(validator=agent_run_validator, streaming=True)
+    ),
+    crud: AgentCRUD = Depends(agent_crud),
+    user: UserBase = Depends(get_current_user),
+    run_slots: KeyedSemaphore = Depends(get_run_slots),
+) -> FastAPIStreamingResponse:
+    """
+    Run the whole agent loop on the server, streaming every step as a server
+    sent event until there are no tasks left or max_loops is reached.
+    Independent tasks are executed concurrently.
+    """
+    scheduler: RunScheduler[RunEvent] = RunScheduler(
+        max_concurrency=settings.run_max_concurrent_tasks,
+        user_slots=run_slots,
+        user_id=user.id,
+        max_tasks=settings.max_loops,
+    )
+    return RunLoop(req_body, agent_service, crud, scheduler).stream()
 
 
 @router.post("/analyze")
@@ -56,22 +148,90 @@ async def analyze_tasks(
 
 @router.post("/execute")
 async def execute_tasks(
+    request: Request,
     req_body: AgentTaskExecute = Depends(agent_execute_validator),
     agent_service: AgentService = Depends(
         get_agent_service(validator=agent_execute_validator, streaming=True),
     ),
+    crud: AgentCRUD = Depends(agent_crud),
+    meter: CancellationMeter = Depends(get_cancellation_meter),
 ) -> FastAPIStreamingResponse:
-    return await agent_service.execute_task_agent(
-        goal=req_body.goal or "",
-        task=req_body.task or "",
-        analysis=req_body.analysis,
+    # Tools call out to other services before anything is streamed
+    response = await until_disconnected(
+        request,
+        agent_service.execute_task_agent(
+            goal=req_body.goal or "",
+            task=req_body.task or "",
+            analysis=req_body.analysis,
+        ),
+        meter,
+    )
+    return on_stream_complete(response, record_result(crud, req_body))
+
+
+@router.post("/analyze-batch")
+async def analyze_tasks_batch(
+    req_body: AgentTasksAnalyze = Depends(agent_analyze_batch_validator),
+    agent_service: AgentService = Depends(
+        get_agent_service(agent_analyze_batch_validator)
+    ),
+) -> List[Analysis]:
+    """
+    Analyze many tasks of the same goal with a single completion.
+    Analyses are returned in the order of the tasks.
+    """
+    return await agent_service.analyze_tasks_agent(
+        goal=req_body.goal,
+        tasks=req_body.tasks,
+        tool_names=req_body.tool_names or [],
+    )
+
+
+@router.post("/analyze-execute")
+async def analyze_and_execute_tasks(
+    request: Request,
+    req_body: AgentTaskAnalyze = Depends(agent_analyze_execute_validator),
+    agent_service: AgentService = Depends(
+        get_agent_service(validator=agent_analyze_execute_validator, streaming=True),
+    ),
+    crud: AgentCRUD = Depends(agent_crud),
+    meter: CancellationMeter = Depends(get_cancellation_meter),
+) -> FastAPIStreamingResponse:
+    """
+    Analyze a task and immediately execute it in a single request.
+    The first line of the stream is the chosen Analysis as JSON, followed by the
+    output of the task.
+    """
+    analysis = await until_disconnected(
+        request,
+        agent_service.analyze_task_agent(
+            goal=req_body.goal,
+            task=req_body.task or "",
+            tool_names=req_body.tool_names or [],
+        ),
+        meter,
+    )
+
+    response = await until_disconnected(
+        request,
+        agent_service.execute_task_agent(
+            goal=req_body.goal or "",
+            task=req_body.task or "",
+            analysis=analysis,
+        ),
+        meter,
+    )
+    return stream_with_header(
+        analysis.json(), on_stream_complete(response, record_result(crud, req_body))
     )
 
 
 @router.post("/create")
 async def create_tasks(
+    background_tasks: BackgroundTasks,
     req_body: AgentTaskCreate = Depends(agent_create_validator),
     agent_service: AgentService = Depends(get_agent_service(agent_create_validator)),
+    crud: AgentCRUD = Depends(agent_crud),
 ) -> NewTasksResponse:
     new_tasks = await agent_service.create_tasks_agent(
         goal=req_body.goal,
@@ -80,7 +240,51 @@ async def create_tasks(
         result=req_body.result or "",
         completed_tasks=req_body.completed_tasks or [],
     )
-    return NewTasksResponse(newTasks=new_tasks, run_id=req_body.run_id)
+    await crud.add_run_tasks(req_body.run_id or "", new_tasks)
+    background_tasks.add_task(
+        update_run_summary_in_background,
+        agent_service,
+        crud,
+        req_body.run_id or "",
+        req_body.goal,
+    )
+    return NewTasksResponse(newTasks=new_tasks, run_id=req_body.run_id or "")
+
+
+@router.post("/create-analyze")
+async def create_and_analyze_tasks(
+    background_tasks: BackgroundTasks,
+    req_body: AgentTaskCreateAnalyze = Depends(agent_create_analyze_validator),
+    agent_service: AgentService = Depends(
+        get_agent_service(agent_create_analyze_validator)
+    ),
+    crud: AgentCRUD = Depends(agent_crud),
+) -> NewAnalyzedTasksResponse:
+    """
+    Create the next task together with its analysis in a single completion.
+    `analyses[i]` is the analysis of `newTasks[i]`.
+    """
+    created = await agent_service.create_and_analyze_task_agent(
+        goal=req_body.goal,
+        tasks=req_body.tasks or [],
+        last_task=req_body.last_task or "",
+        result=req_body.result or "",
+        completed_tasks=req_body.completed_tasks or [],
+        tool_names=req_body.tool_names or [],
+    )
+    await crud.add_run_tasks(req_body.run_id or "", [task for task, _ in created])
+    background_tasks.add_task(
+        update_run_summary_in_background,
+        agent_service,
+        crud,
+        req_body.run_id or "",
+        req_body.goal,
+    )
+    return NewAnalyzedTasksResponse(
+        newTasks=[task for task, _ in created],
+        analyses=[analysis for _, analysis in created],
+        run_id=req_body.run_id or "",
+    )
 
 
 @router.post("/summarize")
@@ -90,13 +294,20 @@ async def summarize(
         get_agent_service(
             validator=agent_summarize_validator,
             streaming=True,
-            llm_model="gpt-3.5-turbo-16k",
+            llm_model="gpt-3.5-turbo",
         ),
     ),
+    crud: AgentCRUD = Depends(agent_crud),
 ) -> FastAPIStreamingResponse:
+    """
+    Summarize the rolling summary of the run together with the results since
+    its last checkpoint, in a single completion.
+    """
+    results = req_body.results or []
+    summary = await get_run_summary(crud, req_body.run_id or "", results)
     return await agent_service.summarize_task_agent(
         goal=req_body.goal or "",
-        results=req_body.results,
+        results=summary_inputs(summary, results),
     )
 
 
@@ -107,16 +318,39 @@ async def chat(
         get_agent_service(
             validator=agent_chat_validator,
             streaming=True,
-            llm_model="gpt-3.5-turbo-16k",
+            llm_model="gpt-3.5-turbo",
         ),
     ),
 ) -> FastAPIStreamingResponse:
     return await agent_service.chat(
         message=req_body.message,
-        results=req_body.results,
+        results=req_body.results or [],
     )
 
 
+@router.get("/usage")
+async def get_usage(crud: AgentCRUD = Depends(agent_crud)) -> Usage:
+    """Tokens and cost of all runs of the user"""
+    return await crud.get_user_usage()
+
+
+@router.get("/usage/{run_id}")
+async def get_run_usage(run_id: str, crud: AgentCRUD = Depends(agent_crud)) -> Usage:
+    return await crud.get_run_usage(run_id)
+
+
+def record_result(
+    crud: AgentCRUD, req_body: Union[AgentTaskAnalyze, AgentTaskExecute]
+) -> Callable[[bytes], Awaitable[None]]:
+    """Store the output of an executed task with its run"""
+
+    async def record(body: bytes) -> None:
+        result = body.decode("utf-8", errors="replace")
+        await crud.complete_run_task(req_body.run_id or "", req_body.task, result)
+
+    return record
+
+
 class ToolModel(BaseModel):
     name: str
     description: str
@@ -36,3 +36,19 @@ class MaxLoopsError(PlatformaticError):
 
 class MultipleSummaryError(PlatformaticError):
     pass
+
+
+class RunBudgetError(PlatformaticError):
+    pass
+
+
+class RateLimitTimeoutError(PlatformaticError):
+    pass
+
+
+class ClientDisconnectedError(PlatformaticError):
+    pass
+
+
+class StepWorkerError(PlatformaticError):
+    pass
@@ -1,4 +1,28 @@
-from fastapi import APIRouter
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+
+from reworkd_platform.services.cancellation.dependencies import get_cancellation_meter
+from reworkd_platform.services.cancellation.meter import (
+    CancellationMeter,
+    CancellationStats,
+)
+from reworkd_platform.services.completion_cache.cache import CacheStats, CompletionCache
+from reworkd_platform.services.completion_cache.dependencies import get_completion_cache
+from reworkd_platform.services.idempotency.dependencies import get_idempotency_store
+from reworkd_platform.services.idempotency.store import (
+    IdempotencyStats,
+    IdempotencyStore,
+)
+from reworkd_platform.services.tokenizer.count_cache import (
+    TokenCountCache,
+    TokenCountStats,
+)
+from reworkd_platform.services.tokenizer.dependencies import get_token_count_cache
+from reworkd_platform.services.upstream.dependencies import get_upstream_router
+from reworkd_platform.services.upstream.router import UpstreamRouter, UpstreamStats
+from reworkd_platform.web.api.agent.dependancies import get_fast_path
+from reworkd_platform.web.api.agent.fast_path import FastPathRouter, FastPathStats
 
 router = APIRouter()
 
@@ -18,3 +42,65 @@ def error_check() -> None:
     Checks that errors are being correctly logged.
     """
     raise Exception("This is an expected error from the error check endpoint!")
+
+
+@router.get("/completion-cache")
+def completion_cache_stats(
+    cache: Optional[CompletionCache] = Depends(get_completion_cache),
+) -> Optional[CacheStats]:
+    """
+    Hit and miss counters of the completion cache, null if it is disabled.
+    """
+    return cache.stats() if cache else None
+
+
+@router.get("/upstreams")
+def upstream_stats(
+    upstream_router: UpstreamRouter = Depends(get_upstream_router),
+) -> List[UpstreamStats]:
+    """
+    Latency, error rate and circuit state of each LLM API base.
+    """
+    return upstream_router.stats()
+
+
+@router.get("/fast-path")
+def fast_path_stats(
+    fast_path: Optional[FastPathRouter] = Depends(get_fast_path),
+) -> Optional[FastPathStats]:
+    """
+    How often each analysis rule skipped the LLM, null if the fast path is disabled.
+    """
+    return fast_path.stats() if fast_path else None
+
+
+@router.get("/cancellations")
+def cancellation_stats(
+    meter: CancellationMeter = Depends(get_cancellation_meter),
+) -> CancellationStats:
+    """
+    Work cancelled because the client disconnected, and the completion tokens
+    that weren't generated because of it (an upper bound).
+    """
+    return meter.stats()
+
+
+@router.get("/idempotency")
+def idempotency_stats(
+    store: Optional[IdempotencyStore] = Depends(get_idempotency_store),
+) -> Optional[IdempotencyStats]:
+    """
+    Retries answered from a stored response (replayed) or by following the
+    original while it was still running (attached), null if disabled.
+    """
+    return store.stats() if store else None
+
+
+@router.get("/token-counts")
+def token_count_stats(
+    cache: Optional[TokenCountCache] = Depends(get_token_count_cache),
+) -> Optional[TokenCountStats]:
+    """
+    Hit and miss counters of the token count cache, null if it is disabled.
+    """
+    return cache.stats() if cache else None
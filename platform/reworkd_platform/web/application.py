@@ -5,6 +5,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import UJSONResponse
 
 from reworkd_platform.logging import configure_logging
+from reworkd_platform.services.idempotency.middleware import IdempotencyMiddleware
 from reworkd_platform.settings import settings
 from reworkd_platform.web.api.error_handling import platformatic_exception_handler
 from reworkd_platform.web.api.errors import PlatformaticError
@@ -34,6 +35,8 @@ def get_app() -> FastAPI:
         default_response_class=UJSONResponse,
     )
 
+    # Inside CORS, so replayed responses get the headers of the retry
+    app.add_middleware(IdempotencyMiddleware, path_prefix="/api/agent/")
     app.add_middleware(
         CORSMiddleware,
         allow_origins=[settings.frontend_url],
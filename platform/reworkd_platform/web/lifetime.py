@@ -6,7 +6,29 @@ from sqlalchemy.ext.asyncio import async_sessionmaker
 from reworkd_platform.db.meta import meta
 from reworkd_platform.db.models import load_all_models
 from reworkd_platform.db.utils import create_engine
+from reworkd_platform.services.cancellation.lifetime import init_cancellation_meter
+from reworkd_platform.services.completion_cache.lifetime import (
+    init_completion_cache,
+    shutdown_completion_cache,
+)
+from reworkd_platform.services.idempotency.lifetime import init_idempotency_store
+from reworkd_platform.services.rate_limiter.lifetime import init_rate_limiter
+from reworkd_platform.services.scheduler.lifetime import init_run_slots
+from reworkd_platform.services.singleflight.lifetime import init_single_flight
+from reworkd_platform.services.step_queue.lifetime import (
+    init_step_dispatcher,
+    shutdown_step_dispatcher,
+)
 from reworkd_platform.services.tokenizer.lifetime import init_tokenizer
+from reworkd_platform.services.transport.lifetime import (
+    init_transport,
+    shutdown_transport,
+)
+from reworkd_platform.services.upstream.lifetime import init_upstream_router
+from reworkd_platform.services.usage.lifetime import init_usage_meter
+from reworkd_platform.settings import settings
+from reworkd_platform.web.api.agent.fast_path import FastPathRouter
+from reworkd_platform.web.api.agent.task_index import TaskIndexCache
 
 
 def _setup_db(app: FastAPI) -> None:  # pragma: no cover
@@ -28,6 +50,30 @@ def _setup_db(app: FastAPI) -> None:  # pragma: no cover
     app.state.db_session_factory = session_factory
 
 
+def _setup_fast_path(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Creates the rule based router used to skip obvious analysis LLM calls.
+
+    :param app: fastAPI application.
+    """
+    app.state.fast_path = (
+        FastPathRouter.from_names(
+            settings.fast_path_rules, settings.fast_path_min_confidence
+        )
+        if settings.fast_path_enabled
+        else None
+    )
+
+
+def _setup_task_indexes(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Creates the task indexes of runs, shared by their create steps.
+
+    :param app: fastAPI application.
+    """
+    app.state.task_indexes = TaskIndexCache(settings.task_index_cache_size)
+
+
 async def _create_tables() -> None:  # pragma: no cover
     """Populates tables in the database."""
     load_all_models()
@@ -38,6 +84,38 @@ async def _create_tables() -> None:  # pragma: no cover
     await engine.dispose()
 
 
+def init_state(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Stores the services shared by all requests in the application's state.
+    Step workers build the same state to run agent steps.
+
+    :param app: fastAPI application.
+    """
+    _setup_db(app)
+    init_tokenizer(app)
+    init_cancellation_meter(app)
+    init_usage_meter(app)
+    init_rate_limiter(app)
+    init_transport(app)
+    init_upstream_router(app)
+    init_completion_cache(app)
+    init_single_flight(app)
+    _setup_fast_path(app)
+    _setup_task_indexes(app)
+    init_run_slots(app)
+
+
+async def shutdown_state(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Releases the services created by `init_state`.
+
+    :param app: fastAPI application.
+    """
+    await app.state.db_engine.dispose()
+    await shutdown_transport(app)
+    shutdown_completion_cache(app)
+
+
 def register_startup_event(
     app: FastAPI,
 ) -> Callable[[], Awaitable[None]]:  # pragma: no cover
@@ -53,8 +131,9 @@ def register_startup_event(
 
     @app.on_event("startup")
     async def _startup() -> None:  # noqa: WPS430
-        _setup_db(app)
-        init_tokenizer(app)
+        init_state(app)
+        init_idempotency_store(app)
+        await init_step_dispatcher(app)
         # await _create_tables()
 
     return _startup
@@ -72,6 +151,7 @@ def register_shutdown_event(
 
     @app.on_event("shutdown")
     async def _shutdown() -> None:  # noqa: WPS430
-        await app.state.db_engine.dispose()
+        await shutdown_step_dispatcher(app)
+        await shutdown_state(app)
 
     return _shutdown
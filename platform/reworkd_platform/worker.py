@@ -0,0 +1,14 @@
+import asyncio
+
+from reworkd_platform.logging import configure_logging
+from reworkd_platform.web.api.agent.step_worker import run_worker
+
+
+def main() -> None:
+    """Entrypoint of the step workers, see `step_workers_enabled`."""
+    configure_logging()
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()